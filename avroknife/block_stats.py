@@ -0,0 +1,360 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import hashlib
+import json
+import math
+import struct
+
+from avroknife.selection import resolve_field, create_field_getter
+
+## Types of fields for which the smallest and the largest values are stored
+_ORDERED_TYPES = ['int', 'long', 'float', 'double', 'string', 'boolean']
+## Types of fields for which the statistics can be collected
+_SUPPORTED_TYPES = _ORDERED_TYPES + ['bytes', 'fixed', 'enum', 'null']
+
+## Expected rate of false positive answers of the Bloom filters
+_FALSE_POSITIVE_RATE = 0.01
+
+_STRUCT_HASHES = struct.Struct('<QQ')
+
+def _value_key(value):
+    """Returns a byte string identifying the value in a Bloom filter.
+
+    Numbers equal to each other have the same key, regardless of their types.
+    """
+    if isinstance(value, bool):
+        return 'T' if value else 'F'
+    elif isinstance(value, (int, long)):
+        return 'i{}'.format(value)
+    elif isinstance(value, float):
+        if not (math.isinf(value) or math.isnan(value)) and value.is_integer():
+            return 'i{}'.format(int(value))
+        return 'f{!r}'.format(value)
+    elif isinstance(value, unicode):
+        return 's' + value.encode('utf-8')
+    else:
+        ## Enum symbols may be given either as byte or as unicode strings
+        return 's' + value
+
+def _get_type_name(type_json):
+    """Returns the name of the type, e.g. "int" or "enum", of a schema
+    given as a JSON string"""
+    type_ = json.loads(type_json)
+    if isinstance(type_, dict):
+        return type_['type']
+    return type_
+
+class BloomFilter:
+    """Probabilistic set of byte strings.
+
+    It answers whether a string may belong to the set; false positive answers
+    are possible, but false negative ones are not.
+    """
+
+    def __init__(self, bits_num, hashes_num, bits=None):
+        self.__bits_num = bits_num
+        self.__hashes_num = hashes_num
+        if bits is None:
+            bits = bytearray((bits_num + 7) // 8)
+        self.__bits = bits
+
+    @staticmethod
+    def create(items_num, false_positive_rate=_FALSE_POSITIVE_RATE):
+        """Creates an empty filter of the size optimal for the given
+        number of items"""
+        items_num = max(1, items_num)
+        bits_num = int(math.ceil(-items_num * math.log(false_positive_rate)
+                                 / math.log(2) ** 2))
+        hashes_num = max(1, int(round(float(bits_num) / items_num
+                                      * math.log(2))))
+        return BloomFilter(bits_num, hashes_num)
+
+    def __positions(self, key):
+        h1, h2 = _STRUCT_HASHES.unpack(hashlib.md5(key).digest())
+        for i in xrange(self.__hashes_num):
+            yield (h1 + i * h2) % self.__bits_num
+
+    def add(self, key):
+        for position in self.__positions(key):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+
+    def may_contain(self, key):
+        for position in self.__positions(key):
+            if not self.__bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def to_json(self):
+        return [self.__bits_num, self.__hashes_num,
+                base64.b64encode(self.__bits)]
+
+    @staticmethod
+    def from_json(json_):
+        bits_num, hashes_num, bits = json_
+        return BloomFilter(bits_num, hashes_num,
+            bytearray(base64.b64decode(bits)))
+
+class FieldStatistics:
+    """Statistics of values of a field in a group of records.
+
+    Attributes:
+        has_null: True if the value is null in some of the records
+        has_values: True if the value is not null in some of the records
+        min, max: the smallest and the largest non-null value or None if
+            they are unknown, e.g. because values of the field are not
+            ordered
+    """
+
+    def __init__(self, has_null, has_values, min_, max_, bloom_filter):
+        self.has_null = has_null
+        self.has_values = has_values
+        self.min = min_
+        self.max = max_
+        self.__bloom_filter = bloom_filter
+
+    def may_contain(self, value):
+        """Returns:
+            False if none of the records contains the given non-null value
+        """
+        return self.__bloom_filter.may_contain(_value_key(value))
+
+    @staticmethod
+    def collect(values, ordered):
+        """Creates the statistics of given values
+
+        Args:
+            values: list of values
+            ordered: True if the smallest and the largest values are to be
+                found
+        """
+        keys = set()
+        has_null = False
+        min_ = None
+        max_ = None
+        for value in values:
+            if value is None:
+                has_null = True
+                continue
+            keys.add(_value_key(value))
+            ## NaN values are not comparable with anything
+            if ordered and value == value:
+                if min_ is None or value < min_:
+                    min_ = value
+                if max_ is None or value > max_:
+                    max_ = value
+        bloom_filter = BloomFilter.create(len(keys))
+        for key in keys:
+            bloom_filter.add(key)
+        return FieldStatistics(has_null, len(keys) > 0, min_, max_,
+            bloom_filter)
+
+    def to_json(self):
+        return {'has_null': self.has_null, 'has_values': self.has_values,
+                'min': self.min, 'max': self.max,
+                'bloom_filter': self.__bloom_filter.to_json()}
+
+    @staticmethod
+    def from_json(json_):
+        return FieldStatistics(json_['has_null'], json_['has_values'],
+            json_['min'], json_['max'],
+            BloomFilter.from_json(json_['bloom_filter']))
+
+class BlockStatistics:
+    """Statistics of values of chosen fields in Avro blocks of a data store.
+
+    For each block, the statistics contain the smallest and the largest
+    values of the fields and Bloom filters of these values. This allows
+    to skip blocks, and whole files, which can't contain records fulfilling
+    a condition, e.g., a point lookup of a value of a field.
+
+    Just like the offset index, the statistics are stored as a JSON file
+    in the data store directory, along with the sizes and the modification
+    times of the files. Statistics of the files that have changed since
+    then are not used.
+    """
+
+    file_name = '_avroknife_stats.json'
+    __version = 1
+
+    def __init__(self, field_types, files):
+        """
+        Args:
+            field_types: dictionary mapping names of the fields to their
+                types (as JSON strings) in the schema used to collect
+                the statistics
+            files: list of dictionaries describing the files.
+                See the `build` method for the description of their format.
+        """
+        self.__field_types = field_types
+        self.__files = dict((f['name'], f) for f in files)
+        self.__files_list = files
+
+    @staticmethod
+    def get_field_types(schema, field_names):
+        """Checks if the statistics can be collected for given fields
+
+        Returns:
+            dictionary mapping the names of the fields to their types
+        Raises:
+            ValueError: a field is not defined in the schema or it has
+                a type without supported statistics, e.g. an array
+        """
+        field_types = {}
+        for name in field_names:
+            try:
+                type_, _ = resolve_field(schema, name)
+            except Exception as ex:
+                raise ValueError(str(ex))
+            if type_.type not in _SUPPORTED_TYPES:
+                raise ValueError('statistics of field "{}" of type "{}" '\
+                    'cannot be collected'.format(name, type_.type))
+            field_types[name] = str(type_)
+        return field_types
+
+    @staticmethod
+    def build(names, statuses, field_types, iter_file_blocks):
+        """Collects the statistics
+
+        Args:
+            names: list of names of the Avro files of the data store
+            statuses: list of FileStatus or FileInfo objects of these files
+            field_types: see `get_field_types`
+            iter_file_blocks: function taking the number of a file and
+                generating pairs (block, records) for each of its blocks,
+                where `block` is a container.BlockInfo object and `records`
+                is a list of the decoded records of the block
+        Returns:
+            a BlockStatistics object. For each file, it holds the name,
+            the size, the modification time and the number of records of 
+            the file along with a list of its blocks, each one described 
+            by its offset, the number of records and the FieldStatistics 
+            (as JSON) of the fields.
+        """
+        getters = [(name, create_field_getter(name),
+                    _get_type_name(type_) in _ORDERED_TYPES)
+                   for name, type_ in sorted(field_types.items())]
+        files = []
+        for file_number, (name, status) in enumerate(zip(names, statuses)):
+            blocks = []
+            records_num = 0
+            for block, records in iter_file_blocks(file_number):
+                fields = {}
+                for field_name, get, ordered in getters:
+                    fields[field_name] = FieldStatistics.collect(
+                        [get(r) for r in records], ordered).to_json()
+                blocks.append({'offset': block.offset, 'count': block.count,
+                               'fields': fields})
+                records_num = records_num + block.count
+            files.append({'name': name,
+                          'size': status.size,
+                          'modification_time': status.modification_time,
+                          'records': records_num,
+                          'blocks': blocks})
+        return BlockStatistics(field_types, files)
+
+    @staticmethod
+    def load(path):
+        """Reads the statistics from a file
+
+        Args:
+            path: a FileSystemPath object
+        Returns:
+            a BlockStatistics object or None if the file doesn't contain
+            valid statistics
+        """
+        with path.open("r") as f:
+            try:
+                content = json.loads(f.read())
+            except ValueError:
+                return None
+        if not isinstance(content, dict) or \
+                content.get('version') != BlockStatistics.__version or \
+                not isinstance(content.get('field_types'), dict) or \
+                not isinstance(content.get('files'), list):
+            return None
+        try:
+            return BlockStatistics(content['field_types'], content['files'])
+        except (KeyError, TypeError):
+            ## The description of a file has a wrong format
+            return None
+
+    def save(self, path):
+        """Writes the statistics to a file
+
+        Args:
+            path: a FileSystemPath object
+        """
+        with path.open("w") as f:
+            f.write(json.dumps({'version': BlockStatistics.__version,
+                                'field_types': self.__field_types,
+                                'files': self.__files_list}))
+
+    def get_usable_fields(self, schema):
+        """Returns:
+            names of the fields which have the same types in the given
+            schema as in the schema used to collect the statistics
+        """
+        current_types = {}
+        for name in self.__field_types:
+            try:
+                current_types.update(self.get_field_types(schema, [name]))
+            except ValueError:
+                pass
+        return [name for name, type_ in self.__field_types.items()
+                if current_types.get(name) == type_]
+
+    def get_file_statistics(self, name, status, field_names):
+        """Returns statistics of a data store file
+
+        Args:
+            name: name of the file
+            status: the current FileStatus or FileInfo object of the file
+            field_names: names of the fields whose statistics are needed
+        Returns:
+            a FileStatistics object or None if the file has no statistics
+            or it has changed since they were collected
+        """
+        file_ = self.__files.get(name)
+        if file_ is None or status.size != file_['size'] or \
+                status.modification_time != file_['modification_time']:
+            return None
+        return FileStatistics(file_, field_names)
+
+class FileStatistics:
+    """Statistics of the blocks of a single Avro file"""
+
+    def __init__(self, file_json, field_names):
+        self.__records_num = file_json['records']
+        self.__blocks = {}
+        for block in file_json['blocks']:
+            fields = block['fields']
+            self.__blocks[block['offset']] = dict(
+                (name, FieldStatistics.from_json(fields[name]))
+                for name in field_names if name in fields)
+
+    def get_number_of_records(self):
+        return self.__records_num
+
+    def get_block_offsets(self):
+        return self.__blocks.keys()
+
+    def get_block_statistics(self, offset):
+        """Returns:
+            dictionary mapping field names to FieldStatistics objects
+            describing the block starting at the given offset or None if
+            there are no statistics of such a block
+        """
+        return self.__blocks.get(offset)
@@ -0,0 +1,562 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Low-level access to Avro object container files.
+
+Contrary to `avro.datafile.DataFileReader`, the code below allows to inspect
+the structure of an Avro file, i.e. its header and headers of its data blocks,
+without decompressing and decoding the records stored in the blocks.
+Similarly, whole data blocks can be copied to another Avro file without
+decoding their records.
+"""
+
+import bz2
+import importlib
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from cStringIO import StringIO
+from multiprocessing.pool import ThreadPool
+
+from avro.datafile import MAGIC, SYNC_SIZE, SYNC_INTERVAL, META_SCHEMA, \
+    DataFileException
+from avro.io import BinaryDecoder, BinaryEncoder, DatumReader
+
+## Description of a data block of an Avro file:
+## `offset` - position of the beginning of the block in the file,
+## `count` - number of records stored in the block,
+## `data_offset` - position of the (possibly compressed) records data,
+## `data_length` - length of the records data in bytes; in case of
+## the "snappy" codec this includes the 4-byte checksum.
+BlockInfo = namedtuple('BlockInfo',
+    ['offset', 'count', 'data_offset', 'data_length'], verbose=False)
+
+## Header of an Avro file: `meta` - dictionary with the metadata entries,
+## `sync_marker` - the marker written after each data block,
+## `end_offset` - position of the first data block in the file.
+Header = namedtuple('Header', ['meta', 'sync_marker', 'end_offset'],
+    verbose=False)
+
+def read_header(f):
+    """Reads the header of an Avro file.
+
+    Only the magic bytes, the metadata and the sync marker are read, so
+    neither the data blocks nor the end of the file are accessed.
+
+    Args:
+        f: file-like object positioned at the beginning of the file
+    Returns:
+        a Header object
+    """
+    header = DatumReader().read_data(META_SCHEMA, META_SCHEMA,
+        BinaryDecoder(f))
+    if header.get('magic') != MAGIC:
+        raise DataFileException('Not an Avro data file')
+    return Header(header['meta'], header['sync'], f.tell())
+
+class ContainerReader:
+    """Reader of the structure of a single Avro file"""
+
+    def __init__(self, f):
+        """
+        Args:
+            f: file-like object supporting "seek" and "tell" operations
+        """
+        self.__f = f
+        self.__decoder = BinaryDecoder(f)
+        self.__f.seek(0)
+        header = read_header(f)
+        self.__meta = header.meta
+        self.__sync_marker = header.sync_marker
+        self.__header_end = header.end_offset
+        self.__f.seek(0, 2)
+        self.__file_length = self.__f.tell()
+
+    def get_meta(self, key):
+        return self.__meta.get(key)
+
+    def get_codec(self):
+        codec = self.get_meta('avro.codec')
+        if codec is None:
+            return 'null'
+        return codec
+
+    def get_schema_json(self):
+        """Returns:
+            the writer schema of the file as a JSON string
+        """
+        return self.get_meta('avro.schema')
+
+    def get_sync_marker(self):
+        return self.__sync_marker
+
+    def iter_block_infos(self, start_offset=None):
+        """Iterates over the headers of data blocks.
+
+        Only the record count and the length of each block are read;
+        the data of the block is skipped using the "seek" operation.
+
+        Args:
+            start_offset: position of the block the iteration starts with.
+                If None, the iteration starts with the first block.
+        Returns:
+            BlockInfo objects
+        """
+        offset = self.__header_end
+        if start_offset is not None:
+            offset = start_offset
+        while offset < self.__file_length:
+            self.__f.seek(offset)
+            count = self.__decoder.read_long()
+            data_length = self.__decoder.read_long()
+            data_offset = self.__f.tell()
+            next_offset = data_offset + data_length + SYNC_SIZE
+            if next_offset > self.__file_length:
+                raise DataFileException(
+                    'Avro data block at position {} is truncated'.format(offset))
+            self.__f.seek(data_offset + data_length)
+            if self.__f.read(SYNC_SIZE) != self.__sync_marker:
+                raise DataFileException(
+                    'Invalid sync marker after Avro data block at position {}'\
+                        .format(offset))
+            yield BlockInfo(offset, count, data_offset, data_length)
+            offset = next_offset
+
+    def read_block_data(self, block):
+        """Reads and decompresses the data of a block.
+
+        If the file is memory-mapped (see `file_system.MappedFile`), the data
+        of uncompressed blocks is not copied. In such a case, the returned
+        object must not be used after the reader is closed.
+
+        Args:
+            block: a BlockInfo object obtained from this reader
+        Returns:
+            binary string (or a `buffer`) with the encoded records of the block
+        """
+        return decompress(self.get_codec(), self.read_raw_block_data(block))
+
+    def read_raw_block_data(self, block):
+        """Reads the data of a block as stored in the file, i.e. without
+        decompressing it. See `read_block_data` for the lifetime of the 
+        returned object.
+        """
+        if hasattr(self.__f, 'read_buffer'):
+            return self.__f.read_buffer(block.data_offset, block.data_length)
+        self.__f.seek(block.data_offset)
+        return self.__f.read(block.data_length)
+
+    def __enter__(self):
+        return self
+
+    def close(self):
+        self.__f.close()
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+## Codecs which can be used without additional Python packages
+_BUILTIN_CODECS = ['null', 'deflate', 'bzip2']
+## Codecs which require additional packages, along with the names of their
+## modules and the packages
+_OPTIONAL_CODECS = OrderedDict([('snappy', ('snappy', 'python-snappy')),
+                                ('zstandard', ('zstandard', 'zstandard'))])
+
+## Ranges of compression levels supported by the codecs
+COMPRESSION_LEVELS = {'deflate': (1, 9), 'bzip2': (1, 9), 
+                      'zstandard': (1, 22)}
+
+def __import_codec_module(codec, purpose):
+    module_name, package_name = _OPTIONAL_CODECS[codec]
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise DataFileException('The "{}" package is required to {} Avro '\
+            'files compressed with the "{}" codec'.format(
+                package_name, purpose, codec))
+
+def get_available_codecs():
+    """Returns:
+        names of the codecs which can be used in this environment
+    """
+    codecs = list(_BUILTIN_CODECS)
+    for codec, (module_name, _) in _OPTIONAL_CODECS.iteritems():
+        try:
+            importlib.import_module(module_name)
+            codecs.append(codec)
+        except ImportError:
+            pass
+    return codecs
+
+def decompress(codec, data):
+    """Decompresses the data of a block according to the Avro specification
+
+    Args:
+        codec: name of the codec as given in the "avro.codec" metadata entry
+        data: the data of the block as stored in the file
+    """
+    if codec == 'null':
+        return data
+    elif codec == 'deflate':
+        ## -15 denotes raw deflate data without zlib headers
+        return zlib.decompress(data, -15)
+    elif codec == 'bzip2':
+        return bz2.decompress(data)
+    elif codec == 'snappy':
+        snappy = __import_codec_module(codec, 'read')
+        uncompressed = snappy.decompress(data[:-4])
+        checksum = struct.unpack('>I', data[-4:])[0]
+        if zlib.crc32(uncompressed) & 0xffffffff != checksum:
+            raise DataFileException('Checksum failure in a "snappy" block')
+        return uncompressed
+    elif codec == 'zstandard':
+        zstandard = __import_codec_module(codec, 'read')
+        ## Frames written by other implementations may lack the size of
+        ## the data, so the streaming decompressor is used
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    else:
+        raise DataFileException('Unknown codec: {}'.format(codec))
+
+def compress(codec, data, level=None):
+    """Compresses the data of a block according to the Avro specification
+
+    This is the inverse of `decompress`.
+
+    Args:
+        codec: name of the codec
+        data: the encoded records of the block
+        level: compression level (see `COMPRESSION_LEVELS`) or None to use 
+            the default one of the codec
+    """
+    if codec == 'null':
+        return data
+    elif codec == 'deflate':
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    elif codec == 'bzip2':
+        if level is None:
+            level = 9
+        return bz2.compress(data, level)
+    elif codec == 'snappy':
+        snappy = __import_codec_module(codec, 'write')
+        checksum = zlib.crc32(data) & 0xffffffff
+        return snappy.compress(data) + struct.pack('>I', checksum)
+    elif codec == 'zstandard':
+        zstandard = __import_codec_module(codec, 'write')
+        if level is None:
+            level = 3
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    else:
+        raise DataFileException('Unknown codec: {}'.format(codec))
+
+def _compress_block(codec, level, data):
+    """Compresses the data of a block in a thread of ContainerWriter
+
+    Returns:
+        pair (compressed data, time of the compression in seconds)
+    """
+    start = time.time()
+    compressed = compress(codec, data, level)
+    return (compressed, time.time() - start)
+
+class WriterStatistics:
+    """Amounts of data written by a ContainerWriter
+
+    Attributes:
+        records: number of written records
+        uncompressed_bytes: size of the data of the blocks compressed by
+            the writer before the compression
+        compressed_bytes: size of these blocks after the compression
+        copied_bytes: size of the data of the blocks copied from other 
+            files without recompressing them
+        compression_seconds: total time spent on the compression, possibly
+            in many threads at once
+    """
+    def __init__(self):
+        self.records = 0
+        self.uncompressed_bytes = 0
+        self.compressed_bytes = 0
+        self.copied_bytes = 0
+        self.compression_seconds = 0.0
+
+    def add(self, other):
+        self.records = self.records + other.records
+        self.uncompressed_bytes = \
+            self.uncompressed_bytes + other.uncompressed_bytes
+        self.compressed_bytes = self.compressed_bytes + other.compressed_bytes
+        self.copied_bytes = self.copied_bytes + other.copied_bytes
+        self.compression_seconds = \
+            self.compression_seconds + other.compression_seconds
+
+class ContainerWriter:
+    """Writer of Avro files which, apart from records, accepts whole 
+    data blocks read from other files.
+
+    Copying a block doesn't require decoding and encoding its records again.
+    The block is only recompressed if it comes from a file with another 
+    codec or if the compression level is given. Its sync marker is replaced
+    with the one of the written file.
+
+    The blocks can be compressed in a pool of threads, so the compression 
+    of a block overlaps with the encoding of the next one. This pays off 
+    since the compression libraries release the GIL. The blocks are written
+    in the order they were created in anyway.
+    """
+
+    def __init__(self, writer, datum_writer, writers_schema, codec='null',
+            compression_level=None, threads=0):
+        """
+        Args:
+            writer: file-like object the Avro file is written to
+            datum_writer: an avro.io.DatumWriter object used to encode
+                the records
+            writers_schema: an avro.schema.Schema object
+            codec: name of the codec (see `get_available_codecs`)
+            compression_level: see `compress`
+            threads: number of threads compressing the blocks. If it is 0,
+                the blocks are compressed in the calling thread.
+        """
+        if codec not in _BUILTIN_CODECS and codec not in _OPTIONAL_CODECS:
+            raise DataFileException('Unknown codec: {}'.format(codec))
+        self.__writer = writer
+        self.__encoder = BinaryEncoder(writer)
+        self.__datum_writer = datum_writer
+        self.__datum_writer.writers_schema = writers_schema
+        self.__codec = codec
+        self.__compression_level = compression_level
+        self.__buffer = StringIO()
+        self.__buffer_encoder = BinaryEncoder(self.__buffer)
+        self.__block_count = 0
+        self.__sync_marker = os.urandom(SYNC_SIZE)
+        self.__pool = None
+        self.__max_pending = 0
+        if threads > 0 and codec != 'null':
+            self.__pool = ThreadPool(threads)
+            self.__max_pending = 2 * threads
+        ## Blocks waiting for being written: tuples (count, result), where
+        ## `result` is an AsyncResult of `_compress_block` or None if 
+        ## the data is ready to be written
+        self.__pending = deque()
+        self.statistics = WriterStatistics()
+        datum_writer.write_data(META_SCHEMA, 
+            {'magic': MAGIC, 
+             'meta': {'avro.schema': str(writers_schema), 'avro.codec': codec},
+             'sync': self.__sync_marker}, 
+            self.__encoder)
+
+    def append(self, datum):
+        """Appends a record to the file"""
+        self.__datum_writer.write(datum, self.__buffer_encoder)
+        self.__block_count = self.__block_count + 1
+        if self.__buffer.tell() >= SYNC_INTERVAL:
+            self.__end_block()
+
+    def write_raw_block(self, count, data, codec):
+        """Writes a block of records.
+
+        The records appended before are written in a separate block first.
+
+        Args:
+            count: number of records in the block
+            data: data of the block as stored in an Avro file, e.g., 
+                obtained with `ContainerReader.read_raw_block_data`.
+                The records have to be encoded with the schema of the
+                written file.
+            codec: name of the codec used to compress the data
+        """
+        self.__end_block()
+        if count == 0:
+            return
+        ## The data may be a `buffer` valid only until the file it comes from
+        ## is closed, so it is copied if it is not written immediately.
+        ## The level the data was compressed with is unknown, so the data
+        ## is recompressed if a level is given.
+        if codec != self.__codec or self.__compression_level is not None:
+            self.__add_block(count, str(decompress(codec, data)))
+        else:
+            self.statistics.records = self.statistics.records + count
+            self.statistics.copied_bytes = \
+                self.statistics.copied_bytes + len(data)
+            if len(self.__pending) > 0:
+                data = str(data)
+            self.__pending.append((count, data, None))
+            self.__write_ready_blocks()
+
+    def __end_block(self):
+        if self.__block_count > 0:
+            self.__add_block(self.__block_count, self.__buffer.getvalue())
+            self.__buffer.seek(0)
+            self.__buffer.truncate()
+            self.__block_count = 0
+
+    def __add_block(self, count, data):
+        self.statistics.records = self.statistics.records + count
+        self.statistics.uncompressed_bytes = \
+            self.statistics.uncompressed_bytes + len(data)
+        if self.__pool is not None:
+            self.__pending.append((count, None, self.__pool.apply_async(
+                _compress_block, 
+                (self.__codec, self.__compression_level, data))))
+        else:
+            self.__pending.append((count, None, 
+                _compress_block(self.__codec, self.__compression_level, data)))
+        self.__write_ready_blocks()
+
+    def __write_ready_blocks(self, all_blocks=False):
+        """Writes pending blocks, keeping at most the allowed number of 
+        blocks being compressed"""
+        while len(self.__pending) > 0:
+            count, data, result = self.__pending[0]
+            if result is not None:
+                if not all_blocks and len(self.__pending) <= self.__max_pending:
+                    return
+                if self.__pool is not None:
+                    result = result.get()
+                data, seconds = result
+                self.statistics.compressed_bytes = \
+                    self.statistics.compressed_bytes + len(data)
+                self.statistics.compression_seconds = \
+                    self.statistics.compression_seconds + seconds
+            self.__pending.popleft()
+            self.__encoder.write_long(count)
+            self.__encoder.write_long(len(data))
+            self.__writer.write(data)
+            self.__writer.write(self.__sync_marker)
+
+    def flush(self):
+        """Writes all the records appended so far"""
+        self.__end_block()
+        self.__write_ready_blocks(all_blocks=True)
+        self.__writer.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.__pool is not None:
+                self.__pool.terminate()
+                self.__pool.join()
+                self.__pool = None
+        self.__writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        ## Just like avro.datafile.DataFileWriter, the file is completed only
+        ## if there was no exception
+        if type is None:
+            self.close()
+        elif self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool.join()
+
+_STRUCT_FLOAT = struct.Struct('<f')
+_STRUCT_DOUBLE = struct.Struct('<d')
+
+class BufferDecoder(BinaryDecoder):
+    """BinaryDecoder reading data from a string kept in memory.
+
+    It is faster than the original BinaryDecoder since reading a value
+    doesn't involve calls to a file-like object.
+    """
+    def __init__(self, data):
+        BinaryDecoder.__init__(self, None)
+        self._data = data
+        self._pos = 0
+
+    def read(self, n):
+        pos = self._pos
+        end = pos + n
+        if end > len(self._data):
+            raise DataFileException('Unexpected end of the data of a block')
+        self._pos = end
+        return self._data[pos:end]
+
+    def read_boolean(self):
+        return ord(self.read(1)) == 1
+
+    def read_long(self):
+        data = self._data
+        pos = self._pos
+        try:
+            b = ord(data[pos])
+            pos = pos + 1
+            n = b & 0x7F
+            shift = 7
+            while (b & 0x80) != 0:
+                b = ord(data[pos])
+                pos = pos + 1
+                n |= (b & 0x7F) << shift
+                shift += 7
+        except IndexError:
+            raise DataFileException('Unexpected end of the data of a block')
+        self._pos = pos
+        return (n >> 1) ^ -(n & 1)
+
+    def read_int(self):
+        return self.read_long()
+
+    def read_float(self):
+        return _STRUCT_FLOAT.unpack(self.read(4))[0]
+
+    def read_double(self):
+        return _STRUCT_DOUBLE.unpack(self.read(8))[0]
+
+    def read_bytes(self):
+        return self.read(self.read_long())
+
+    def read_utf8(self):
+        return self.read(self.read_long()).decode('utf-8')
+
+    def skip_long(self):
+        data = self._data
+        pos = self._pos
+        try:
+            while ord(data[pos]) & 0x80 != 0:
+                pos = pos + 1
+        except IndexError:
+            raise DataFileException('Unexpected end of the data of a block')
+        self._pos = pos + 1
+
+    def skip_int(self):
+        self.skip_long()
+
+    def skip_bytes(self):
+        self.skip(self.read_long())
+
+    def skip_utf8(self):
+        self.skip_bytes()
+
+    def skip(self, n):
+        self.read(n)
+
+def decode_records(data, count, datum_reader):
+    """Decodes records of a block
+
+    Args:
+        data: uncompressed data of the block
+        count: number of records in the block
+        datum_reader: an object with `read(decoder)` method, e.g., 
+            an avro.io.DatumReader object
+    Returns:
+        decoded records
+    """
+    decoder = BufferDecoder(data)
+    for _ in xrange(count):
+        yield datum_reader.read(decoder)
@@ -13,12 +13,24 @@
 # limitations under the License.
 
 import fnmatch
+import functools
+import itertools
+import multiprocessing
+import traceback
+from multiprocessing.pool import ThreadPool
 import avro
-from avro.datafile import DataFileReader
 from avro.io import DatumReader, SchemaResolutionException
-from collections import OrderedDict
+from collections import OrderedDict, deque, namedtuple
 
-from avroknife.error import error
+from avroknife.block_stats import BlockStatistics
+from avroknife.container import ContainerReader, decode_records, read_header, \
+    decompress
+from avroknife.decoder import CompiledDatumReader, JSONTranscoder, REJECTED
+from avroknife.error import error, warning
+from avroknife.offset_index import OffsetIndex
+from avroknife.prefetch import FilePrefetcher, DEFAULT_MAX_MEMORY
+from avroknife.projection import project_schema
+from avroknife.utils import JSONConverter
 
 class _FieldsOrderPreservingDatumReader(DatumReader):
     """DatumReader that preserves the order of the fields as defined in schema. 
@@ -52,6 +64,197 @@ class _FieldsOrderPreservingDatumReader(DatumReader):
                                                       readers_schema)
         return read_record
 
+class _GenericJSONDatumReader:
+    """Reader converting records decoded by the generic DatumReader to JSON"""
+    def __init__(self, datum_reader):
+        self.__datum_reader = datum_reader
+        self.__converter = JSONConverter(datum_reader.readers_schema)
+
+    def read(self, decoder):
+        return self.__converter.convert(self.__datum_reader.read(decoder))
+
+class _SelectingDatumReader:
+    """Reader replacing records not fulfilling a predicate with REJECTED"""
+    def __init__(self, datum_reader, predicate):
+        self.__datum_reader = datum_reader
+        self.__predicate = predicate
+
+    def read(self, decoder):
+        record = self.__datum_reader.read(decoder)
+        if self.__predicate(record):
+            return record
+        return REJECTED
+
+def _create_datum_reader(writers_schema_json, readers_schema, 
+        generic_decoder=False, as_json=False, selection=None):
+    writers_schema = avro.schema.parse(writers_schema_json)
+    predicate = None
+    if selection is not None:
+        assert not as_json
+        predicate = selection.compile(readers_schema)
+    if generic_decoder:
+        datum_reader = _FieldsOrderPreservingDatumReader(
+            writers_schema=writers_schema, readers_schema=readers_schema)
+        if as_json:
+            return _GenericJSONDatumReader(datum_reader)
+        if predicate is not None:
+            return _SelectingDatumReader(datum_reader, predicate)
+        return datum_reader
+    if as_json:
+        return JSONTranscoder(writers_schema, readers_schema)
+    if predicate is not None:
+        return CompiledDatumReader(writers_schema, readers_schema, predicate,
+            selection.get_field_names())
+    return CompiledDatumReader(writers_schema, readers_schema)
+
+def _get_selection_key(selection):
+    if selection is None:
+        return None
+    return str(selection)
+
+def _identity(x):
+    return x
+
+def _report_failure(index, path, local_index):
+    error("processing record with index {} failed. "\
+        "This record comes from \"{}\" Avro file and in this "\
+        "file it has local index equal {}.".format(
+            index+1, path, local_index+1))
+
+class DecodingException(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+## Number of records to be decoded by a worker process in one go
+_RECORDS_PER_DECODING_TASK = 10000
+
+class _DecodingTask:
+    """Consecutive blocks of an Avro file to be decoded by a worker process"""
+    def __init__(self, path, writers_schema_json, readers_schema_json, 
+            generic_decoder, as_json, selection, first, last):
+        self.path = path
+        self.writers_schema_json = writers_schema_json
+        self.readers_schema_json = readers_schema_json
+        self.generic_decoder = generic_decoder
+        self.as_json = as_json
+        self.selection = selection
+        self.first = first
+        self.last = last
+        self.blocks = []
+        self.records_num = 0
+
+    def add_block(self, block, index, local_index):
+        self.blocks.append((block, index, local_index))
+        self.records_num = self.records_num + block.count
+
+## Datum readers created in a worker process, indexed by the pair of 
+## writer and reader schemas along with the options of decoding
+_worker_datum_readers = {}
+
+def _decode_blocks(task):
+    """Decodes records of a _DecodingTask in a worker process
+
+    Returns:
+        pair (records, failure) where `records` is a list of pairs
+        (index of record, record) and `failure` is None or, if decoding 
+        of a record failed, a tuple (index, local_index, traceback) 
+        describing the problem.
+    """
+    key = (task.writers_schema_json, task.readers_schema_json, 
+        task.generic_decoder, task.as_json, _get_selection_key(task.selection))
+    datum_reader = _worker_datum_readers.get(key)
+    if datum_reader is None:
+        datum_reader = _create_datum_reader(task.writers_schema_json, 
+            avro.schema.parse(task.readers_schema_json), task.generic_decoder,
+            task.as_json, task.selection)
+        _worker_datum_readers[key] = datum_reader
+    records = []
+    _, index, local_index = task.blocks[0]
+    try:
+        with ContainerReader(task.path.open_mapped()) as reader:
+            for block, index, local_index in task.blocks:
+                data = reader.read_block_data(block)
+                for record in decode_records(data, block.count, datum_reader):
+                    if task.last is not None and index > task.last:
+                        break
+                    if index >= task.first and record is not REJECTED:
+                        records.append((index, record))
+                    index = index + 1
+                    local_index = local_index + 1
+    except Exception:
+        return (records, (index, local_index, traceback.format_exc()))
+    return (records, None)
+
+def _get_decoded_records(task, async_result):
+    """Returns records of a _DecodingTask decoded by a worker process"""
+    records, failure = async_result.get()
+    for record in records:
+        yield record
+    if failure is not None:
+        index, local_index, traceback_string = failure
+        _report_failure(index, task.path, local_index)
+        raise DecodingException('decoding in a worker process failed:\n{}'\
+            .format(traceback_string))
+
+## Position of an Avro data block in a data store:
+## `path` - FileSystemPath object of the file the block comes from,
+## `info` - container.BlockInfo object describing the block,
+## `index` - global index of the first record of the block,
+## `local_index` - index of the first record of the block inside the file.
+BlockReference = namedtuple('BlockReference', 
+    ['path', 'info', 'index', 'local_index'], verbose=False)
+
+class DataBlock:
+    """Avro data block of a file of a data store
+
+    Attributes:
+        reference: a BlockReference object describing the position of 
+            the block
+        index: index of the first record of the block in the data store
+        count: number of records in the block
+    """
+
+    def __init__(self, reader, reference, decode):
+        self.__reader = reader
+        self.__block_info = reference.info
+        self.reference = reference
+        self.index = reference.index
+        self.count = reference.info.count
+        self.__decode = decode
+
+    def get_codec(self):
+        return self.__reader.get_codec()
+
+    def get_writers_schema_json(self):
+        return self.__reader.get_schema_json()
+
+    def read_raw_data(self):
+        """Returns:
+            the data of the block as stored in the file, i.e. compressed
+            with the codec of the file and encoded with its writer schema
+        """
+        return self.__reader.read_raw_block_data(self.__block_info)
+
+    def iter_records(self, first=0, last=None, selection=None):
+        """Decodes the records of the block with the reader schema of 
+        the data store
+        
+        Args:
+            first, last, selection: see `DataStore.iter_records`
+        Returns:
+            pairs (index of record, record)
+        """
+        return self.__decode(first, last, False, selection)
+
+def _is_avro_file_name(name):
+    ## Ignore files starting with underscore. 
+    ## Such files are also ignored by default by map-reduce jobs.
+    ## We're also ignoring files starting with dot to ignore
+    ## ".svn" directories.
+    ## We're not checking whether the path is a directory because
+    ## such testing takes too much time
+    return not (fnmatch.fnmatch(name, "_*") or fnmatch.fnmatch(name, ".*"))
+
 class DataStore:
     """Avro data store.
     
@@ -61,17 +264,62 @@ class DataStore:
     increasing order of the paths to these files.
     """
 
-    def __init__(self, datastore_path, schema_path=None):
+    def __init__(self, datastore_path, schema_path=None, 
+            use_offset_index=False, jobs=1, fields=None, 
+            generic_decoder=False, schema_cache=None, 
+            decompression_threads=0, prefetch_files=0, 
+            prefetch_memory=DEFAULT_MAX_MEMORY):
         """
         Args:
             datastore_path: a FileSystemPath object. Path to a directory 
                 containing Avro files, all of them need to have the same schema.
             schema_path: a FileSystemPath object. Path to file containing
                 JSON Avro reader schema.
+            use_offset_index: if True, an OffsetIndex stored in the data store
+                directory is used to find records with given indexes. 
+                The index is created if it doesn't exist yet and recreated 
+                if it is outdated.
+            jobs: number of worker processes used to decode the records.
+                If it is 1, the records are decoded in the current process.
+            fields: list of names of fields (possibly nested, e.g. 'a.b') 
+                to be read. The reader schema is restricted to these fields, 
+                so the remaining ones are skipped without decoding them.
+                If None, all fields are read.
+            generic_decoder: if True, the records are decoded with the generic
+                DatumReader of the Avro library instead of a decoder compiled
+                for the writer and reader schemas. The results are the same, 
+                but the generic decoder is slower.
+            schema_cache: a SchemaCache object used to avoid reading 
+                the schema from the data store files. If None, no cache 
+                is used.
+            decompression_threads: number of threads decompressing 
+                the Avro blocks ahead of decoding their records. If it is 0,
+                the blocks are decompressed just before decoding them.
+                The threads are used only if the records are decoded in 
+                the current process (see `jobs`).
+            prefetch_files: number of Avro files opened, and partially 
+                read, in background threads ahead of reading them. 
+                It helps in case of data stores with many small files 
+                in HDFS. If it is 0, the files are opened when they are 
+                needed.
+            prefetch_memory: maximum total size, in bytes, of the data 
+                of the prefetched files kept in memory
         """
         self._datastore_path = datastore_path
         self._schema_path = schema_path
         self._schema = None
+        self._use_offset_index = use_offset_index
+        self._offset_index = None
+        self._jobs = jobs
+        self._fields = fields
+        self._generic_decoder = generic_decoder
+        self._schema_cache = schema_cache
+        self._decompression_threads = decompression_threads
+        self._prefetch_files = prefetch_files
+        self._prefetch_memory = prefetch_memory
+        self._datum_readers = {}
+        self._json_converter = None
+        self._block_statistics = None
 
 
     def get_schema(self):
@@ -79,59 +327,606 @@ class DataStore:
 
         If schema is given as a run parameter, then returns this schema.
         Otherwise extracts the schema from the Avro data store files.
+        If the fields to be read are specified, the schema is restricted
+        to these fields.
         """
-        if self._schema:
-            return self._schema
-        else:
-            if not self._schema_path: #if there is no schema
-                paths = self.__get_paths_to_avro_files()
-                with DataFileReader(paths[0].open("r"), _FieldsOrderPreservingDatumReader()) as reader:
-                    self._schema = avro.schema.parse(reader.get_meta('avro.schema'))
-                    return self._schema
-            else: #a schema is given
-                try:
-                    self._schema = avro.schema.parse(self._schema_path.open("r").read())
-                    return self._schema
-                except TypeError:
-                    error("supplied schema cannot be parsed!")
-                    raise
+        if not self._schema:
+            self._schema = self.__read_schema()
+            if self._fields is not None:
+                self._schema = project_schema(self._schema, self._fields)
+        return self._schema
+
+    def get_json_converter(self):
+        """Lazy accessor for the converter of records read from the data 
+        store to JSON
+
+        Returns:
+            a utils.JSONConverter object
+        """
+        if self._json_converter is None:
+            self._json_converter = JSONConverter(self.get_schema())
+        return self._json_converter
+
+    def __read_schema(self):
+        if not self._schema_path: #if there is no schema
+            return self.__read_writers_schema(
+                self.__get_paths_to_avro_files()[0])
+        else: #a schema is given
+            try:
+                return avro.schema.parse(self._schema_path.open("r").read())
+            except TypeError:
+                error("supplied schema cannot be parsed!")
+                raise
+
+    def __read_writers_schema(self, path):
+        """Reads the schema from the header of an Avro file or from the cache"""
+        ## In case of HDFS, getting the information takes a single request 
+        ## to the namenode
+        info = None
+        if self._schema_cache is not None:
+            info = path.get_info()
+        if info is None:
+            ## If the file is missing, an error is raised while reading it
+            return avro.schema.parse(self.__read_writers_schema_json(path))
+        schema_json = self._schema_cache.get(path, info)
+        if schema_json is None:
+            schema_json = self.__read_writers_schema_json(path)
+            try:
+                self._schema_cache.put(path, info, schema_json)
+            except (IOError, OSError) as ex:
+                warning("unable to save the schema of \"{}\" in the "\
+                    "cache: {}".format(path, ex))
+        return avro.schema.parse(schema_json)
+
+    @staticmethod
+    def __read_writers_schema_json(path):
+        with path.open("r") as f:
+            return read_header(f).meta.get('avro.schema')
 
     def __iter__(self):
-        paths = self.__get_paths_to_avro_files()
-        prev_global_record_index = 0
-        for path in paths:
-            with DataFileReader(path.open("r"), _FieldsOrderPreservingDatumReader(
-                    readers_schema=self.get_schema())) as reader:
-                prev_local_record_index = 0
-                try:
-                    for record in reader:
+        for _, record in self.iter_records():
+            yield record
+
+    def iter_records(self, first=0, last=None, as_json=False, selection=None):
+        """Generates records from the given range of indexes.
+
+        Avro data blocks that don't overlap with the range are skipped 
+        without decompressing and decoding them.
+
+        Args:
+            first: index of the first record to be generated
+            last: index of the last record to be generated. If None, all
+                records starting from `first` are generated.
+            as_json: if True, records are generated as JSON strings,
+                the same as the ones produced by `utils.dict_to_json`.
+                Unless the generic decoder is used, they are converted
+                directly from the binary data.
+            selection: a Selection object. If given, only the records 
+                fulfilling its condition are generated. The condition is
+                checked as soon as the fields it depends on are decoded, 
+                so the remaining fields of rejected records are skipped.
+                If the data store has block statistics (see 
+                `build_block_statistics`), the blocks which can't contain 
+                matching records are skipped without decoding them.
+                It can't be used along with `as_json`.
+        Returns:
+            pairs (index of record, record)
+        """
+        assert not (as_json and selection is not None)
+        if self._jobs > 1:
+            return self.__iter_records_in_parallel(first, last, as_json, 
+                selection)
+        else:
+            return self.__iter_records_serially(first, last, as_json, 
+                selection)
+
+    def __iter_records_serially(self, first, last, as_json, selection):
+        if self._decompression_threads > 0:
+            blocks = self.__iter_decompressed_blocks(first, last, selection)
+        else:
+            blocks = ((path, reader.get_schema_json(), 
+                       functools.partial(reader.read_block_data, block), 
+                       block, index, local_index) 
+                      for path, reader, block, index, local_index in 
+                      self.__iter_blocks(first, last, selection))
+        for path, writers_schema_json, get_data, block, index, local_index \
+                in blocks:
+            for record in self.__decode_block(path, writers_schema_json, 
+                    get_data, block, index, local_index, first, last, 
+                    as_json, selection):
+                yield record
+
+    def __iter_decompressed_blocks(self, first, last, selection):
+        """Decompresses the blocks ahead of time in a pool of threads.
+
+        The compression libraries release the GIL, so the blocks are 
+        decompressed while the records of the preceding ones are decoded.
+        At most `2 * decompression_threads` blocks are kept in memory 
+        at once.
+
+        Returns:
+            tuples (path, writers_schema_json, get_data, block, index,
+            local_index), where `get_data` is a function returning 
+            the decompressed data of the block
+        """
+        pool = ThreadPool(self._decompression_threads)
+        max_pending = 2 * self._decompression_threads
+        try:
+            pending = deque()
+            for path, reader, block, index, local_index in \
+                    self.__iter_blocks(first, last, selection):
+                codec = reader.get_codec()
+                data = reader.read_raw_block_data(block)
+                if codec == 'null' and len(pending) == 0:
+                    ## Nothing to be done ahead of time; the data is used 
+                    ## while the file is still open, so it is not copied
+                    yield (path, reader.get_schema_json(), 
+                        functools.partial(_identity, data), 
+                        block, index, local_index)
+                    continue
+                ## The data is copied since the file may be closed before 
+                ## the data is used
+                data = str(data)
+                if codec == 'null':
+                    get_data = functools.partial(_identity, data)
+                else:
+                    get_data = pool.apply_async(decompress, (codec, data)).get
+                pending.append((path, reader.get_schema_json(), get_data,
+                    block, index, local_index))
+                if len(pending) > max_pending:
+                    yield pending.popleft()
+            while len(pending) > 0:
+                yield pending.popleft()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __decode_block(self, path, writers_schema_json, get_data, block, 
+            index, local_index, first, last, as_json, selection):
+        """Generates pairs (index of record, record) of the records of 
+        a block from the given range of indexes
+        
+        Args:
+            get_data: function returning the decompressed data of the block
+        """
+        datum_reader = self.__get_datum_reader(writers_schema_json,
+            as_json, selection)
+        try:
+            data = get_data()
+            for record in decode_records(data, block.count, datum_reader):
+                if last is not None and index > last:
+                    return
+                if index >= first and record is not REJECTED:
+                    yield (index, record)
+                index = index + 1
+                local_index = local_index + 1
+        except Exception:
+            _report_failure(index, path, local_index)
+            raise
+
+    def iter_blocks(self, first=0, last=None, selection=None):
+        """Generates Avro data blocks with records from the given range 
+        of indexes.
+
+        This allows to process whole blocks without decoding their records, 
+        e.g. to copy them to another Avro file.
+
+        Args:
+            first, last, selection: see `iter_records`. The selection is 
+                only used to skip blocks with the block statistics, so
+                the generated blocks can contain records not fulfilling 
+                its condition.
+        Returns:
+            DataBlock objects. Each of them can be used only until the next 
+            one is requested.
+        """
+        for path, reader, block, index, local_index in \
+                self.__iter_blocks(first, last, selection):
+            yield self.__create_data_block(reader, 
+                BlockReference(path, block, index, local_index))
+
+    def get_block_references(self, first=0, last=None, selection=None):
+        """Generates references to Avro data blocks with records from 
+        the given range of indexes.
+
+        Only the headers of the blocks are read. The blocks can be read 
+        later on with `read_blocks`, possibly in another process.
+
+        Args:
+            first, last, selection: see `iter_blocks`
+        Returns:
+            BlockReference objects
+        """
+        for path, _, block, index, local_index in \
+                self.__iter_blocks(first, last, selection):
+            yield BlockReference(path, block, index, local_index)
+
+    def read_blocks(self, references):
+        """Reads Avro data blocks of the data store
+
+        Args:
+            references: BlockReference objects obtained with
+                `get_block_references`
+        Returns:
+            DataBlock objects. Each of them can be used only until the next 
+            one is requested.
+        """
+        references, references_ahead = itertools.tee(references)
+        opened_files = self.__open_files(next(paths) for _, paths in 
+            itertools.groupby((r.path for r in references_ahead), key=str))
+        reader = None
+        try:
+            for reference in references:
+                if reader is None or str(reader_path) != str(reference.path):
+                    if reader is not None:
+                        reader.close()
+                        reader = None
+                    reader_path = reference.path
+                    reader = ContainerReader(next(opened_files))
+                yield self.__create_data_block(reader, reference)
+        finally:
+            if reader is not None:
+                reader.close()
+            opened_files.close()
+
+    def __create_data_block(self, reader, reference):
+        return DataBlock(reader, reference, functools.partial(
+            self.__decode_block, reference.path, reader.get_schema_json(), 
+            functools.partial(reader.read_block_data, reference.info),
+            reference.info, reference.index, reference.local_index))
+
+    def __iter_records_in_parallel(self, first, last, as_json, selection):
+        """Decodes the records in a pool of worker processes.
+
+        The records are generated in the same order as in the case of
+        the serial processing. In order to limit memory consumption,
+        only a few decoding tasks per worker are submitted ahead.
+        """
+        pool = multiprocessing.Pool(self._jobs)
+        try:
+            pending = deque()
+            for task in self.__iter_decoding_tasks(first, last, as_json, 
+                    selection):
+                pending.append(
+                    (task, pool.apply_async(_decode_blocks, (task,))))
+                if len(pending) >= 2 * self._jobs:
+                    for record in _get_decoded_records(*pending.popleft()):
                         yield record
-                        prev_global_record_index = prev_global_record_index + 1
-                        prev_local_record_index = prev_local_record_index + 1
-                except Exception:
-                    error("processing record with index {} failed. "\
-                        "This record comes from \"{}\" Avro file and in this "\
-                        "file it has local index equal {}.".format(
-                            prev_global_record_index+1, path,
-                            prev_local_record_index+1))
-                    raise
+            while len(pending) > 0:
+                for record in _get_decoded_records(*pending.popleft()):
+                    yield record
+        finally:
+            ## This also stops the workers when the records are no longer
+            ## needed, e.g. because the limit of records has been reached.
+            pool.terminate()
+            pool.join()
+
+    def __iter_decoding_tasks(self, first, last, as_json, selection):
+        """Groups consecutive blocks of the same file into decoding tasks"""
+        readers_schema_json = str(self.get_schema())
+        task = None
+        for path, reader, block, index, local_index in \
+                self.__iter_blocks(first, last, selection):
+            if task is not None and (task.path != path or 
+                    task.records_num >= _RECORDS_PER_DECODING_TASK):
+                yield task
+                task = None
+            if task is None:
+                task = _DecodingTask(path, reader.get_schema_json(), 
+                    readers_schema_json, self._generic_decoder, as_json, 
+                    selection, first, last)
+            task.add_block(block, index, local_index)
+        if task is not None:
+            yield task
+
+    def __iter_blocks(self, first, last, selection=None):
+        """Generates Avro blocks overlapping with the given range of indexes
+
+        If a selection is given and the data store has block statistics, 
+        the blocks which can't contain records fulfilling its condition 
+        are skipped. So are whole files, if none of their blocks can 
+        contain such records.
+
+        Returns:
+            tuples (path, reader, block, index, local_index), where `reader` 
+            is a ContainerReader of the file the `block` comes from, `index` 
+            and `local_index` are the global index and the index inside 
+            the file of the first record of the block. The reader can be used 
+            only until the next tuple is requested.
+        """
+        names = self.__get_avro_file_names()
+        index = 0
+        local_index = 0
+        start_offset = None
+        offset_index = self.__get_offset_index()
+        if offset_index is not None and first > 0:
+            position = offset_index.locate(first)
+            if position is None:
+                return
+            names = names[position.file_number:]
+            index = position.index
+            local_index = position.local_index
+            start_offset = position.offset
+        get_file_statistics, check = self.__get_statistics_check(selection)
+        first_file_offset = start_offset
+        def iter_files():
+            """Generates tuples (path, file_stats, skipped)"""
+            for file_number, name in enumerate(names):
+                path = self._datastore_path.append(name)
+                file_stats = get_file_statistics(name, path)
+                ## Only a file read from its beginning can be skipped
+                skipped = file_stats is not None and \
+                    (file_number > 0 or first_file_offset is None) and \
+                    not any(check(file_stats.get_block_statistics(offset)) 
+                            for offset in file_stats.get_block_offsets())
+                yield (path, file_stats, skipped)
+        files, files_ahead = itertools.tee(iter_files())
+        opened_files = self.__open_files(
+            path for path, _, skipped in files_ahead if not skipped)
+        try:
+            for path, file_stats, skipped in files:
+                if last is not None and index > last:
+                    return
+                if skipped:
+                    index = index + file_stats.get_number_of_records()
+                    continue
+                with ContainerReader(next(opened_files)) as reader:
+                    try:
+                        for block in reader.iter_block_infos(start_offset):
+                            if last is not None and index > last:
+                                return
+                            if index + block.count > first and \
+                                    (file_stats is None or 
+                                     self.__may_contain_selected_records(
+                                        file_stats, block, check)):
+                                yield (path, reader, block, index, 
+                                    local_index)
+                            index = index + block.count
+                            local_index = local_index + block.count
+                    except Exception:
+                        _report_failure(index, path, local_index)
+                        raise
+                local_index = 0
+                start_offset = None
+        finally:
+            opened_files.close()
+
+    def __open_files(self, paths):
+        """Opens Avro files of the data store in the given order.
+
+        If prefetching is enabled, the files are opened ahead of time 
+        in a pool of threads (see `prefetch.FilePrefetcher`).
+
+        Returns:
+            opened file-like objects. They have to be closed by the caller.
+        """
+        if self._prefetch_files > 0:
+            return FilePrefetcher(self._prefetch_files, 
+                self._prefetch_memory).iter_files(paths)
+        return (path.open_mapped() for path in paths)
+
+    @staticmethod
+    def __may_contain_selected_records(file_stats, block, check):
+        block_stats = file_stats.get_block_statistics(block.offset)
+        return block_stats is None or check(block_stats)
+
+    def __get_statistics_check(self, selection):
+        """Prepares the pruning of blocks with the block statistics
+
+        Returns:
+            pair (get_file_statistics, check), where `get_file_statistics`
+            is a function returning a block_stats.FileStatistics object 
+            of an up-to-date Avro file of the data store or None and `check`
+            is a function taking statistics of a block and telling whether 
+            it can contain records fulfilling the selection
+        """
+        no_statistics = (lambda name, path: None, None)
+        if selection is None:
+            return no_statistics
+        block_statistics = self.__get_block_statistics()
+        if block_statistics is None:
+            return no_statistics
+        schema = self.get_schema()
+        field_names = [name for name in selection.get_field_names()
+                       if name in block_statistics.get_usable_fields(schema)]
+        if len(field_names) == 0:
+            return no_statistics
+        check = selection.compile_statistics_check(schema)
+        ## The sizes and modification times of all the files are taken
+        ## from a single listing of the data store directory
+        infos = dict(self.__get_avro_file_infos())
+        warned = []
+        def get_file_statistics(name, path):
+            info = infos.get(name)
+            if info is None:
+                info = path.get_status()
+            file_stats = block_statistics.get_file_statistics(
+                name, info, field_names)
+            if file_stats is None and len(warned) == 0:
+                warned.append(path)
+                warning("block statistics of \"{}\" are missing or "\
+                    "outdated; run the \"buildstats\" mode to update "\
+                    "them".format(path))
+            return file_stats
+        return (get_file_statistics, check)
+
+    def __get_block_statistics(self):
+        """Lazy accessor for the block statistics of the data store
+
+        Returns:
+            a BlockStatistics object or None if the data store doesn't 
+            have valid statistics
+        """
+        if self._block_statistics is None:
+            stats_path = self._datastore_path.append(BlockStatistics.file_name)
+            if not stats_path.exists():
+                return None
+            self._block_statistics = BlockStatistics.load(stats_path)
+            if self._block_statistics is None:
+                warning("block statistics of \"{}\" are missing or "\
+                    "outdated; run the \"buildstats\" mode to update "\
+                    "them".format(self._datastore_path))
+        return self._block_statistics
+
+    def build_block_statistics(self, field_names):
+        """Collects statistics of values of given fields in each Avro block
+        and saves them in the data store directory.
+
+        The statistics are later used to skip blocks which can't contain 
+        records matching a selection (see `iter_records`). 
+
+        Args:
+            field_names: list of names of fields (possibly nested).
+                Their types have to be primitive or enums.
+        Returns:
+            the created BlockStatistics object
+        Raises:
+            ValueError: statistics of a field cannot be collected
+        """
+        schema = self.get_schema()
+        field_types = BlockStatistics.get_field_types(schema, field_names)
+        readers_schema = project_schema(schema, field_names)
+        names, statuses = self.__get_avro_file_names_and_infos()
+        paths = [self._datastore_path.append(name) for name in names]
+        ## The files are requested in the order of their numbers
+        opened_files = self.__open_files(paths)
+        def iter_file_blocks(file_number):
+            with ContainerReader(next(opened_files)) as reader:
+                datum_reader = _create_datum_reader(reader.get_schema_json(),
+                    readers_schema, self._generic_decoder)
+                for block in reader.iter_block_infos():
+                    data = reader.read_block_data(block)
+                    yield (block, 
+                        list(decode_records(data, block.count, datum_reader)))
+        try:
+            block_statistics = BlockStatistics.build(names, statuses, 
+                field_types, iter_file_blocks)
+        finally:
+            opened_files.close()
+        stats_path = self._datastore_path.append(BlockStatistics.file_name)
+        block_statistics.save(stats_path)
+        self._block_statistics = block_statistics
+        return block_statistics
+
+    def __get_datum_reader(self, writers_schema_json, as_json, selection):
+        """Returns a reader of records written with given schema"""
+        key = (writers_schema_json, as_json, _get_selection_key(selection))
+        datum_reader = self._datum_readers.get(key)
+        if datum_reader is None:
+            datum_reader = _create_datum_reader(writers_schema_json, 
+                self.get_schema(), self._generic_decoder, as_json, selection)
+            self._datum_readers[key] = datum_reader
+        return datum_reader
+
+    def __getstate__(self):
+        """The data store can be passed to worker processes. The schema 
+        is passed as a JSON string; the caches are not passed at all."""
+        state = self.__dict__.copy()
+        if self._schema is not None:
+            state['_schema'] = str(self._schema)
+        state['_datum_readers'] = {}
+        state['_json_converter'] = None
+        state['_offset_index'] = None
+        state['_block_statistics'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._schema is not None:
+            self._schema = avro.schema.parse(self._schema)
+
+    def get_codec(self):
+        """Returns:
+            the name of the codec used in the first Avro file of the data 
+            store
+        """
+        with ContainerReader(
+                self.__get_paths_to_avro_files()[0].open_mapped()) as reader:
+            return reader.get_codec()
+
+    def count_records(self):
+        """Counts records in the data store without decoding them.
+
+        Only the headers of Avro files and the headers of their data blocks
+        are read; the (possibly compressed) data of the blocks is skipped.
+        """
+        offset_index = self.__get_offset_index()
+        if offset_index is not None:
+            return offset_index.get_number_of_records()
+        n = 0
+        opened_files = self.__open_files(self.__get_paths_to_avro_files())
+        try:
+            for f in opened_files:
+                with ContainerReader(f) as reader:
+                    for block in reader.iter_block_infos():
+                        n = n + block.count
+        finally:
+            opened_files.close()
+        return n
+
+    def __get_offset_index(self):
+        """Lazy accessor for the offset index of the data store
+
+        Returns:
+            an up-to-date OffsetIndex object or None if the index is not
+            supposed to be used
+        """
+        if not self._use_offset_index:
+            return None
+        if self._offset_index is None:
+            names, statuses = self.__get_avro_file_names_and_infos()
+            paths = [self._datastore_path.append(name) for name in names]
+            index_path = self._datastore_path.append(OffsetIndex.file_name)
+            offset_index = None
+            if index_path.exists():
+                offset_index = OffsetIndex.load(index_path)
+                if offset_index is not None and \
+                        not offset_index.is_up_to_date(names, statuses):
+                    offset_index = None
+            if offset_index is None:
+                offset_index = OffsetIndex.build(paths, names, statuses)
+                try:
+                    offset_index.save(index_path)
+                except (IOError, OSError) as ex:
+                    warning("unable to save the offset index of the data "\
+                        "store in \"{}\": {}".format(index_path, ex))
+            self._offset_index = offset_index
+        return self._offset_index
 
     def __get_paths_to_avro_files(self):
-        paths = []
-        for file_name in self._datastore_path.ls():
-            ## Ignore files starting with underscore. 
-            ## Such files are also ignored by default by map-reduce jobs.
-            ## We're also ignoring files starting with dot to ignore
-            ## ".svn" directories.
-            if not (fnmatch.fnmatch(file_name, "_*") or 
-                    fnmatch.fnmatch(file_name, ".*")):
-                path = self._datastore_path.append(file_name)
-                ## We're not checking whether the path is a directory because
-                ## such testing takes too much time
-                #if path.is_dir():
-                    #continue
-                paths.append(path)
-        if len(paths) == 0:
+        return [self._datastore_path.append(name) 
+                for name in self.__get_avro_file_names()]
+
+    def __get_avro_file_names(self):
+        names = [name for name in self._datastore_path.ls()
+                 if _is_avro_file_name(name)]
+        if len(names) == 0:
             raise error("Specified data store path is empty or is not valid")
-        paths.sort()
-        return paths
+        names.sort()
+        return names
+
+    def __get_avro_file_infos(self):
+        """Lists the Avro files of the data store along with their sizes
+        and modification times.
+
+        In case of HDFS, it takes a single request to the namenode instead
+        of one per file.
+
+        Returns:
+            sorted list of pairs (name, FileInfo object)
+        """
+        infos = [(name, info) for name, info in self._datastore_path.ls_info()
+                 ## A file removed after listing the directory has no info
+                 if _is_avro_file_name(name) and info is not None]
+        if len(infos) == 0:
+            raise error("Specified data store path is empty or is not valid")
+        infos.sort()
+        return infos
+
+    def __get_avro_file_names_and_infos(self):
+        """Returns:
+            pair of lists (names, FileInfo objects) of the Avro files 
+            of the data store, see `__get_avro_file_infos`
+        """
+        infos = self.__get_avro_file_infos()
+        return ([name for name, _ in infos], [info for _, info in infos])
@@ -0,0 +1,814 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decoder of Avro records specialized for a given pair of schemas.
+
+The generic `avro.io.DatumReader` resolves the writer and reader schemas
+anew for every decoded value, i.e. it matches the schemas, dispatches on
+their types and looks up record fields by name. Here, all of this is done
+only once: a pair of schemas is compiled into a tree of Python functions,
+each of them reading a value of one specific type. For each record type,
+a dedicated function reading its fields one after another is generated.
+
+The decoded values are exactly the same as the ones returned by
+`avroknife.data_store._FieldsOrderPreservingDatumReader`.
+
+In the same way, the schemas can be compiled into functions converting
+the binary data directly into JSON text, without creating Python objects
+representing the decoded records.
+
+A record reader can also be combined with a condition the records have to
+fulfill. The condition is checked as soon as the fields it depends on are
+decoded, and the remaining fields of a rejected record are skipped without
+decoding them.
+"""
+
+import copy
+from collections import OrderedDict
+
+from avro.io import DatumReader, SchemaResolutionException
+from avro.schema import AvroException
+
+from avroknife.utils import dict_to_json, float_to_json, string_to_json, \
+    bytes_to_json
+
+## Value returned by a datum reader in place of a record which doesn't 
+## fulfill the condition given to the reader
+REJECTED = object()
+
+class CompiledDatumReader:
+    """Replacement of avro.io.DatumReader with the schemas compiled
+    into specialized decoding functions"""
+
+    def __init__(self, writers_schema, readers_schema=None, predicate=None,
+            field_names=None):
+        """
+        Args:
+            writers_schema: an avro.schema.Schema object
+            readers_schema: an avro.schema.Schema object. If None,
+                the writer schema is used.
+            predicate: a function taking a decoded record and returning 
+                True if the record is to be returned. Records for which it
+                returns False are replaced with REJECTED. If None, all
+                records are returned.
+            field_names: names of the fields, possibly nested (e.g. 'a.b'), 
+                the predicate depends on. The predicate is called with 
+                a record having only these fields and the ones preceding 
+                them decoded. If None, the predicate is called with 
+                complete records.
+        Raises:
+            SchemaResolutionException: the schemas can't be resolved
+        """
+        if readers_schema is None:
+            readers_schema = writers_schema
+        compiler = _Compiler()
+        if predicate is None:
+            self.__read = compiler.compile_reader(writers_schema, 
+                readers_schema)
+        else:
+            self.__read = compiler.compile_selective_reader(writers_schema,
+                readers_schema, predicate, field_names)
+
+    def read(self, decoder):
+        """Reads a single datum
+
+        Args:
+            decoder: an avro.io.BinaryDecoder object
+        """
+        return self.__read(decoder)
+
+_UNION_TYPES = ['union', 'error_union']
+_RECORD_TYPES = ['record', 'error']
+
+def _read_null(decoder):
+    return None
+
+def _read_boolean(decoder):
+    return decoder.read_boolean()
+
+def _read_utf8(decoder):
+    return decoder.read_utf8()
+
+def _read_long(decoder):
+    return decoder.read_long()
+
+def _read_float(decoder):
+    return decoder.read_float()
+
+def _read_double(decoder):
+    return decoder.read_double()
+
+def _read_bytes(decoder):
+    return decoder.read_bytes()
+
+def _skip_null(decoder):
+    pass
+
+def _skip_long(decoder):
+    decoder.skip_long()
+
+def _skip_bytes(decoder):
+    decoder.skip_bytes()
+
+## Functions reading and skipping primitive values along with the code
+## used in place of their calls in the generated record readers
+_INLINED_FUNCTIONS = {
+    _read_null: 'None',
+    _read_boolean: 'decoder.read_boolean()',
+    _read_utf8: 'decoder.read_utf8()',
+    _read_long: 'decoder.read_long()',
+    _read_float: 'decoder.read_float()',
+    _read_double: 'decoder.read_double()',
+    _read_bytes: 'decoder.read_bytes()',
+    _skip_null: None,
+    _skip_long: 'decoder.skip_long()',
+    _skip_bytes: 'decoder.skip_bytes()'}
+
+def _failing(fail_msg, writers_schema, readers_schema):
+    """Returns a function raising the exception when called.
+
+    It is used where a schema resolution error can be reported only when
+    the corresponding data is actually encountered, e.g., in case of
+    a branch of a union which is not present in the reader schema.
+    """
+    def fail(decoder, *args):
+        raise SchemaResolutionException(fail_msg, writers_schema,
+            readers_schema)
+    return fail
+
+def _resolve_readers_schema(writers_schema, readers_schema):
+    """Checks if the schemas match and finds the reader schema to be used
+    for the data written with the writer schema.
+
+    Returns:
+        the reader schema or, if the reader schema is a union and the writer
+        schema isn't, the first matching branch of the union
+    Raises:
+        SchemaResolutionException: the schemas don't match
+    """
+    if not DatumReader.match_schemas(writers_schema, readers_schema):
+        raise SchemaResolutionException('Schemas do not match.',
+            writers_schema, readers_schema)
+    if writers_schema.type not in _UNION_TYPES and \
+            readers_schema.type in _UNION_TYPES:
+        for s in readers_schema.schemas:
+            if DatumReader.match_schemas(writers_schema, s):
+                return _resolve_readers_schema(writers_schema, s)
+        raise SchemaResolutionException('Schemas do not match.',
+            writers_schema, readers_schema)
+    return readers_schema
+
+def _resolve_record_fields(writers_schema, readers_schema):
+    """Matches fields of the writer and reader record schemas
+
+    Returns:
+        pair (fields, defaults). `fields` is a list of tuples 
+        (name, writer field schema, reader field schema) in the order of 
+        the writer schema; the name and the reader schema are None if 
+        the field is to be skipped. `defaults` is a list of tuples (name, 
+        default value, field schema) of the reader fields not present in 
+        the writer schema, in the same order as the one used by the generic
+        reader.
+    Raises:
+        SchemaResolutionException: a reader field without default value
+            is missing in the writer schema
+    """
+    readers_fields_dict = readers_schema.fields_dict
+    writers_fields_dict = writers_schema.fields_dict
+    fields = []
+    for field in writers_schema.fields:
+        readers_field = readers_fields_dict.get(field.name)
+        if readers_field is not None:
+            fields.append((field.name, field.type, readers_field.type))
+        else:
+            fields.append((None, field.type, None))
+    defaults = []
+    for field_name, field in readers_fields_dict.items():
+        if not writers_fields_dict.has_key(field_name):
+            if not field.has_default:
+                raise SchemaResolutionException(
+                    'No default value for field {}'.format(field_name),
+                    writers_schema, readers_schema)
+            value = DatumReader()._read_default_value(
+                field.type, field.default)
+            defaults.append((field.name, value, field.type))
+    return (fields, defaults)
+
+class _Compiler:
+    """Compiles schemas into decoding functions.
+
+    Each function takes an avro.io.BinaryDecoder object as the only argument.
+    """
+
+    def __init__(self):
+        ## Functions of named record types, identified by ids of schemas.
+        ## Each function is kept in a one-element list, so that it can be
+        ## referred to by recursive types before it is created.
+        self.__record_readers = {}
+        self.__record_skippers = {}
+        self.__generated_num = 0
+
+    def compile_reader(self, writers_schema, readers_schema):
+        readers_schema = _resolve_readers_schema(writers_schema, 
+            readers_schema)
+        w_type = writers_schema.type
+        ## Values of promoted types are returned as they are encoded,
+        ## the same way as in the generic DatumReader.
+        if w_type == 'null':
+            return _read_null
+        elif w_type == 'boolean':
+            return _read_boolean
+        elif w_type == 'string':
+            return _read_utf8
+        elif w_type in ['int', 'long']:
+            return _read_long
+        elif w_type == 'float':
+            return _read_float
+        elif w_type == 'double':
+            return _read_double
+        elif w_type == 'bytes':
+            return _read_bytes
+        elif w_type == 'fixed':
+            size = writers_schema.size
+            return lambda decoder: decoder.read(size)
+        elif w_type == 'enum':
+            return self.__compile_enum_reader(writers_schema, readers_schema)
+        elif w_type == 'array':
+            return self.__compile_array_reader(writers_schema, readers_schema)
+        elif w_type == 'map':
+            return self.__compile_map_reader(writers_schema, readers_schema)
+        elif w_type in _UNION_TYPES:
+            return self.__compile_union_reader(writers_schema, readers_schema)
+        elif w_type in _RECORD_TYPES:
+            return self.__compile_record_reader(writers_schema, readers_schema)
+        else:
+            raise AvroException(
+                'Cannot read unknown schema type: {}'.format(w_type))
+
+    def compile_selective_reader(self, writers_schema, readers_schema,
+            predicate, field_names):
+        """Compiles a reader returning REJECTED for the records not 
+        fulfilling the predicate. See `CompiledDatumReader`."""
+        readers_schema = _resolve_readers_schema(writers_schema, 
+            readers_schema)
+        if writers_schema.type not in _RECORD_TYPES or field_names is None:
+            read = self.compile_reader(writers_schema, readers_schema)
+            def read_selected(decoder):
+                datum = read(decoder)
+                if predicate(datum):
+                    return datum
+                return REJECTED
+            return read_selected
+        fields, defaults = _resolve_record_fields(writers_schema, 
+            readers_schema)
+        steps = []
+        skippers = []
+        for name, writers_type, readers_type in fields:
+            skipper = self.compile_skipper(writers_type)
+            if name is not None:
+                steps.append((name, 
+                    self.compile_reader(writers_type, readers_type)))
+            else:
+                steps.append((None, skipper))
+            skippers.append(skipper)
+        ## The predicate is checked after the last of the fields it depends
+        ## on or, if some of them are filled with default values, at the end
+        names = set(name.split('.')[0] for name in field_names)
+        check_position = -1
+        for i, (name, _) in enumerate(steps):
+            if name in names:
+                check_position = i
+                names.remove(name)
+        if len(names) > 0:
+            check_position = len(steps)
+        return self.__generate_record_reader(steps, defaults, 
+            (check_position, predicate, skippers))
+
+    def compile_skipper(self, writers_schema):
+        w_type = writers_schema.type
+        if w_type == 'null':
+            return _skip_null
+        elif w_type == 'boolean':
+            return lambda decoder: decoder.skip(1)
+        elif w_type in ['int', 'long', 'enum']:
+            return _skip_long
+        elif w_type == 'float':
+            return lambda decoder: decoder.skip(4)
+        elif w_type == 'double':
+            return lambda decoder: decoder.skip(8)
+        elif w_type in ['string', 'bytes']:
+            return _skip_bytes
+        elif w_type == 'fixed':
+            size = writers_schema.size
+            return lambda decoder: decoder.skip(size)
+        elif w_type == 'array':
+            return _compile_blocks_skipper(
+                self.compile_skipper(writers_schema.items))
+        elif w_type == 'map':
+            skip_value = self.compile_skipper(writers_schema.values)
+            def skip_entry(decoder):
+                decoder.skip_bytes()
+                skip_value(decoder)
+            return _compile_blocks_skipper(skip_entry)
+        elif w_type in _UNION_TYPES:
+            return self.__compile_union_skipper(writers_schema)
+        elif w_type in _RECORD_TYPES:
+            return self.__compile_record_skipper(writers_schema)
+        else:
+            raise AvroException('Unknown schema type: {}'.format(w_type))
+
+    def __compile_enum_reader(self, writers_schema, readers_schema):
+        symbols = writers_schema.symbols
+        ## Symbols known to the reader, None for unknown ones
+        resolved = [s if s in readers_schema.symbols else None
+                    for s in symbols]
+        def read_enum(decoder):
+            index = decoder.read_long()
+            if index >= len(resolved):
+                raise SchemaResolutionException(
+                    "Can't access enum index {} for enum with {} symbols"\
+                        .format(index, len(symbols)),
+                    writers_schema, readers_schema)
+            symbol = resolved[index]
+            if symbol is None:
+                raise SchemaResolutionException(
+                    "Symbol {} not present in Reader's Schema"\
+                        .format(symbols[index]),
+                    writers_schema, readers_schema)
+            return symbol
+        return read_enum
+
+    def __compile_array_reader(self, writers_schema, readers_schema):
+        read_item = self.compile_reader(writers_schema.items,
+            readers_schema.items)
+        def read_array(decoder):
+            items = []
+            append = items.append
+            block_count = decoder.read_long()
+            while block_count != 0:
+                if block_count < 0:
+                    block_count = -block_count
+                    decoder.skip_long()
+                for _ in xrange(block_count):
+                    append(read_item(decoder))
+                block_count = decoder.read_long()
+            return items
+        return read_array
+
+    def __compile_map_reader(self, writers_schema, readers_schema):
+        read_value = self.compile_reader(writers_schema.values,
+            readers_schema.values)
+        def read_map(decoder):
+            items = {}
+            block_count = decoder.read_long()
+            while block_count != 0:
+                if block_count < 0:
+                    block_count = -block_count
+                    decoder.skip_long()
+                for _ in xrange(block_count):
+                    key = decoder.read_utf8()
+                    items[key] = read_value(decoder)
+                block_count = decoder.read_long()
+            return items
+        return read_map
+
+    def __compile_union_reader(self, writers_schema, readers_schema):
+        branches = []
+        for s in writers_schema.schemas:
+            try:
+                branches.append(self.compile_reader(s, readers_schema))
+            except SchemaResolutionException as ex:
+                ## The branch might never be used in the data
+                branches.append(_failing(str(ex), s, readers_schema))
+        def read_union(decoder):
+            index = decoder.read_long()
+            if index >= len(branches):
+                raise SchemaResolutionException(
+                    "Can't access branch index {} for union with {} branches"\
+                        .format(index, len(branches)),
+                    writers_schema, readers_schema)
+            return branches[index](decoder)
+        return read_union
+
+    def __compile_union_skipper(self, writers_schema):
+        branches = [self.compile_skipper(s) for s in writers_schema.schemas]
+        def skip_union(decoder):
+            index = decoder.read_long()
+            if index >= len(branches):
+                raise SchemaResolutionException(
+                    "Can't access branch index {} for union with {} branches"\
+                        .format(index, len(branches)),
+                    writers_schema)
+            branches[index](decoder)
+        return skip_union
+
+    def __compile_record_reader(self, writers_schema, readers_schema):
+        key = (id(writers_schema), id(readers_schema))
+        if key in self.__record_readers:
+            cell = self.__record_readers[key]
+            if cell[0] is not None:
+                return cell[0]
+            return lambda decoder: cell[0](decoder)
+        cell = [None]
+        self.__record_readers[key] = cell
+        fields, defaults = _resolve_record_fields(writers_schema, 
+            readers_schema)
+        ## Each element: (name of the field or None if it is skipped,
+        ## function reading or skipping it)
+        steps = []
+        for name, writers_type, readers_type in fields:
+            if name is not None:
+                steps.append((name, 
+                    self.compile_reader(writers_type, readers_type)))
+            else:
+                steps.append((None, self.compile_skipper(writers_type)))
+        cell[0] = self.__generate_record_reader(steps, defaults)
+        return cell[0]
+
+    def __generate_record_reader(self, steps, defaults, selection=None):
+        """Generates a function reading fields of a record one by one,
+        without any loop or lookup of field schemas.
+
+        Args:
+            steps: list of (field name or None, reading function) pairs
+                in the order of the writer schema fields
+            defaults: list of (field name, default value, schema) tuples
+            selection: None or a tuple (position, predicate, skippers). 
+                The predicate is checked after the step with the given 
+                position (-1 denotes the beginning, the number of steps -
+                the end of the record). If it isn't fulfilled, the remaining
+                fields are skipped with the `skippers` functions, one per
+                step, and REJECTED is returned.
+        """
+        namespace = {'OrderedDict': OrderedDict, 'deepcopy': copy.deepcopy,
+                     'REJECTED': REJECTED}
+        lines = ['def read_record(decoder):',
+                 '    record = OrderedDict()']
+        if selection is not None:
+            check_position, predicate, skippers = selection
+            namespace['predicate'] = predicate
+        if selection is not None and check_position == -1:
+            lines.extend(self.__generate_rejection(skippers, namespace))
+        for i, (name, function) in enumerate(steps):
+            if function in _INLINED_FUNCTIONS:
+                code = _INLINED_FUNCTIONS[function]
+            else:
+                function_name = 'f{}'.format(i)
+                namespace[function_name] = function
+                code = '{}(decoder)'.format(function_name)
+            if name is not None:
+                lines.append('    record[{!r}] = {}'.format(name, code))
+            elif code is not None:
+                lines.append('    {}'.format(code))
+            if selection is not None and check_position == i:
+                lines.extend(self.__generate_rejection(skippers[i + 1:], 
+                    namespace))
+        for i, (name, value, _) in enumerate(defaults):
+            value_name = 'd{}'.format(i)
+            namespace[value_name] = value
+            ## Mutable values are copied so that records don't share them
+            if isinstance(value, (list, dict)):
+                lines.append('    record[{!r}] = deepcopy({})'.format(
+                    name, value_name))
+            else:
+                lines.append('    record[{!r}] = {}'.format(name, value_name))
+        if selection is not None and check_position == len(steps):
+            lines.extend(self.__generate_rejection([], namespace))
+        lines.append('    return record')
+        self.__generated_num = self.__generated_num + 1
+        code = compile('\n'.join(lines),
+            '<avroknife record reader {}>'.format(self.__generated_num), 'exec')
+        exec code in namespace
+        return namespace['read_record']
+
+    @staticmethod
+    def __generate_rejection(skippers, namespace):
+        """Generates lines of code checking the predicate and skipping 
+        the remaining fields of a rejected record"""
+        lines = ['    if not predicate(record):']
+        for function in skippers:
+            if function in _INLINED_FUNCTIONS:
+                code = _INLINED_FUNCTIONS[function]
+            else:
+                function_name = 's{}'.format(len(namespace))
+                namespace[function_name] = function
+                code = '{}(decoder)'.format(function_name)
+            if code is not None:
+                lines.append('        {}'.format(code))
+        lines.append('        return REJECTED')
+        return lines
+
+    def __compile_record_skipper(self, writers_schema):
+        key = id(writers_schema)
+        if key in self.__record_skippers:
+            cell = self.__record_skippers[key]
+            if cell[0] is not None:
+                return cell[0]
+            return lambda decoder: cell[0](decoder)
+        cell = [None]
+        self.__record_skippers[key] = cell
+        skippers = [self.compile_skipper(field.type)
+                    for field in writers_schema.fields]
+        def skip_record(decoder):
+            for skip in skippers:
+                skip(decoder)
+        cell[0] = skip_record
+        return cell[0]
+
+def _compile_blocks_skipper(skip_item):
+    """Returns a function skipping a value encoded as a series of blocks,
+    i.e., an array or a map"""
+    def skip_blocks(decoder):
+        block_count = decoder.read_long()
+        while block_count != 0:
+            if block_count < 0:
+                decoder.skip(decoder.read_long())
+            else:
+                for _ in xrange(block_count):
+                    skip_item(decoder)
+            block_count = decoder.read_long()
+    return skip_blocks
+
+class JSONTranscoder:
+    """Converter of binary-encoded Avro data straight into JSON text.
+
+    It has the same interface as avro.io.DatumReader, but instead of 
+    a decoded record it returns the record in JSON format, exactly the same
+    as the one produced by `avroknife.utils.dict_to_json` (without pretty 
+    printing) for the record decoded with the reader schema. No intermediate
+    Python objects representing the record are created.
+    """
+
+    def __init__(self, writers_schema, readers_schema=None):
+        """
+        Args:
+            writers_schema: an avro.schema.Schema object
+            readers_schema: an avro.schema.Schema object. If None,
+                the writer schema is used.
+        Raises:
+            SchemaResolutionException: the schemas can't be resolved
+        """
+        if readers_schema is None:
+            readers_schema = writers_schema
+        self.__write = _JSONCompiler().compile_writer(writers_schema, 
+            readers_schema)
+
+    def read(self, decoder):
+        """Reads a single datum
+
+        Args:
+            decoder: an avro.io.BinaryDecoder object
+        Returns:
+            JSON string
+        """
+        out = []
+        self.__write(decoder, out)
+        return ''.join(out)
+
+def _write_null(decoder, out):
+    out.append('null')
+
+def _write_boolean(decoder, out):
+    out.append('true' if decoder.read_boolean() else 'false')
+
+def _write_utf8(decoder, out):
+    ## The JSON encoder decodes the UTF-8 bytes itself
+    out.append(string_to_json(decoder.read_bytes()))
+
+def _write_long(decoder, out):
+    out.append(str(decoder.read_long()))
+
+def _write_float(decoder, out):
+    out.append(float_to_json(decoder.read_float()))
+
+def _write_double(decoder, out):
+    out.append(float_to_json(decoder.read_double()))
+
+def _write_bytes(decoder, out):
+    out.append(bytes_to_json(decoder.read_bytes()))
+
+## Functions converting primitive values along with the expressions 
+## used in place of their calls in the generated record converters
+_INLINED_WRITERS = {
+    _write_null: "'null'",
+    _write_boolean: "'true' if decoder.read_boolean() else 'false'",
+    _write_utf8: 'string_to_json(decoder.read_bytes())',
+    _write_long: 'str(decoder.read_long())',
+    _write_float: 'float_to_json(decoder.read_float())',
+    _write_double: 'float_to_json(decoder.read_double())',
+    _write_bytes: 'bytes_to_json(decoder.read_bytes())'}
+
+class _JSONCompiler:
+    """Compiles schemas into functions converting binary data into JSON.
+
+    Each function takes an avro.io.BinaryDecoder object and a list the parts
+    of the produced JSON text are appended to.
+    """
+
+    def __init__(self):
+        ## Used to compile skippers of the fields not present 
+        ## in the reader schema
+        self.__compiler = _Compiler()
+        self.__record_writers = {}
+        self.__generated_num = 0
+
+    def compile_writer(self, writers_schema, readers_schema):
+        readers_schema = _resolve_readers_schema(writers_schema, 
+            readers_schema)
+        w_type = writers_schema.type
+        if w_type == 'null':
+            return _write_null
+        elif w_type == 'boolean':
+            return _write_boolean
+        elif w_type == 'string':
+            return _write_utf8
+        elif w_type in ['int', 'long']:
+            return _write_long
+        elif w_type == 'float':
+            return _write_float
+        elif w_type == 'double':
+            return _write_double
+        elif w_type == 'bytes':
+            return _write_bytes
+        elif w_type == 'fixed':
+            ## Fixed values are binary strings, so they are encoded 
+            ## with Base64 as well
+            size = writers_schema.size
+            def write_fixed(decoder, out):
+                out.append(bytes_to_json(decoder.read(size)))
+            return write_fixed
+        elif w_type == 'enum':
+            return self.__compile_enum_writer(writers_schema, readers_schema)
+        elif w_type == 'array':
+            return self.__compile_array_writer(writers_schema, readers_schema)
+        elif w_type == 'map':
+            return self.__compile_map_writer(writers_schema, readers_schema)
+        elif w_type in _UNION_TYPES:
+            return self.__compile_union_writer(writers_schema, readers_schema)
+        elif w_type in _RECORD_TYPES:
+            return self.__compile_record_writer(writers_schema, readers_schema)
+        else:
+            raise AvroException(
+                'Cannot read unknown schema type: {}'.format(w_type))
+
+    def __compile_enum_writer(self, writers_schema, readers_schema):
+        read_enum = self.__compiler.compile_reader(writers_schema, 
+            readers_schema)
+        encoded = dict((s, string_to_json(s)) 
+                       for s in writers_schema.symbols)
+        def write_enum(decoder, out):
+            out.append(encoded[read_enum(decoder)])
+        return write_enum
+
+    def __compile_array_writer(self, writers_schema, readers_schema):
+        write_item = self.compile_writer(writers_schema.items,
+            readers_schema.items)
+        def write_array(decoder, out):
+            out.append('[')
+            first = True
+            block_count = decoder.read_long()
+            while block_count != 0:
+                if block_count < 0:
+                    block_count = -block_count
+                    decoder.skip_long()
+                for _ in xrange(block_count):
+                    if first:
+                        first = False
+                    else:
+                        out.append(', ')
+                    write_item(decoder, out)
+                block_count = decoder.read_long()
+            out.append(']')
+        return write_array
+
+    def __compile_map_writer(self, writers_schema, readers_schema):
+        write_value = self.compile_writer(writers_schema.values,
+            readers_schema.values)
+        def write_map(decoder, out):
+            ## The entries are collected in a dictionary so that they 
+            ## are written in the same order as the entries of a decoded map
+            items = {}
+            block_count = decoder.read_long()
+            while block_count != 0:
+                if block_count < 0:
+                    block_count = -block_count
+                    decoder.skip_long()
+                for _ in xrange(block_count):
+                    key = decoder.read_utf8()
+                    value = []
+                    write_value(decoder, value)
+                    items[key] = value
+                block_count = decoder.read_long()
+            ## The order of entries is the same as in `utils.dict_to_json`
+            items = {k: v for (k, v) in items.iteritems()}
+            out.append('{')
+            first = True
+            for key, value in items.iteritems():
+                if first:
+                    first = False
+                else:
+                    out.append(', ')
+                out.append(string_to_json(key))
+                out.append(': ')
+                out.extend(value)
+            out.append('}')
+        return write_map
+
+    def __compile_union_writer(self, writers_schema, readers_schema):
+        branches = []
+        for s in writers_schema.schemas:
+            try:
+                branches.append(self.compile_writer(s, readers_schema))
+            except SchemaResolutionException as ex:
+                ## The branch might never be used in the data
+                branches.append(_failing(str(ex), s, readers_schema))
+        def write_union(decoder, out):
+            index = decoder.read_long()
+            if index >= len(branches):
+                raise SchemaResolutionException(
+                    "Can't access branch index {} for union with {} branches"\
+                        .format(index, len(branches)),
+                    writers_schema, readers_schema)
+            branches[index](decoder, out)
+        return write_union
+
+    def __compile_record_writer(self, writers_schema, readers_schema):
+        key = (id(writers_schema), id(readers_schema))
+        if key in self.__record_writers:
+            cell = self.__record_writers[key]
+            if cell[0] is not None:
+                return cell[0]
+            return lambda decoder, out: cell[0](decoder, out)
+        cell = [None]
+        self.__record_writers[key] = cell
+        fields, defaults = _resolve_record_fields(writers_schema, 
+            readers_schema)
+        steps = []
+        for name, writers_type, readers_type in fields:
+            if name is not None:
+                steps.append((name, 
+                    self.compile_writer(writers_type, readers_type)))
+            else:
+                steps.append((None, 
+                    self.__compiler.compile_skipper(writers_type)))
+        cell[0] = self.__generate_record_writer(steps, defaults)
+        return cell[0]
+
+    def __generate_record_writer(self, steps, defaults):
+        """Generates a function converting fields of a record one by one.
+
+        Args:
+            steps: list of (field name or None, converting or skipping 
+                function) pairs in the order of the writer schema fields
+            defaults: list of (field name, default value, schema) tuples
+        """
+        namespace = {'string_to_json': string_to_json, 
+                     'float_to_json': float_to_json,
+                     'bytes_to_json': bytes_to_json}
+        lines = ['def write_record(decoder, out):',
+                 '    append = out.append']
+        ## Constant text waiting to be appended
+        text = '{'
+        for i, (name, function) in enumerate(steps):
+            function_name = 'f{}'.format(i)
+            namespace[function_name] = function
+            if name is None:
+                code = '{}(decoder)'.format(function_name)
+                if function in _INLINED_FUNCTIONS:
+                    code = _INLINED_FUNCTIONS[function]
+                if code is not None:
+                    lines.append('    {}'.format(code))
+                continue
+            if text != '{':
+                text = text + ', '
+            text = text + string_to_json(name) + ': '
+            lines.append('    append({!r})'.format(text))
+            text = ''
+            if function in _INLINED_WRITERS:
+                lines.append('    append({})'.format(
+                    _INLINED_WRITERS[function]))
+            else:
+                lines.append('    {}(decoder, out)'.format(function_name))
+        for name, value, schema in defaults:
+            if text != '{':
+                text = text + ', '
+            text = text + string_to_json(name) + ': ' + \
+                dict_to_json(value, schema=schema)
+        lines.append('    append({!r})'.format(text + '}'))
+        self.__generated_num = self.__generated_num + 1
+        code = compile('\n'.join(lines), 
+            '<avroknife record transcoder {}>'.format(self.__generated_num), 
+            'exec')
+        exec code in namespace
+        return namespace['write_record']
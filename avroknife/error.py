@@ -18,3 +18,9 @@ import sys
 
 def error(message):
     print("ERROR: {}".format(message), file=sys.stderr)
+
+def warning(message):
+    print("WARNING: {}".format(message), file=sys.stderr)
+
+def info(message):
+    print("INFO: {}".format(message), file=sys.stderr)
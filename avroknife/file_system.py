@@ -14,9 +14,14 @@
 
 from __future__ import print_function
 
+import os
 import os.path
 import sys
 import errno
+import mmap
+import threading
+import urlparse
+from collections import namedtuple
 
 def hdfs_filesystem_warning():
     return 'maybe you did not specify the right file system? '\
@@ -25,12 +30,19 @@ def hdfs_filesystem_warning():
         'if you want to access HDFS, no prefix should be given.'\
         .format(FileSystemPathFactory.local_fs_path_prefix)
 
+## Modules of pydoop package imported by `import_hdfs_lib`
+_hdfs_lib = None
+
 def import_hdfs_lib():
     """Imports required modules from pydoop package locally. 
     
     This way, if we don't want to use the functionality of accessing HDFS, 
-    having pydoop installed in the system is not necessary.
+    having pydoop installed in the system is not necessary. The modules
+    are imported only once.
     """
+    global _hdfs_lib
+    if _hdfs_lib is not None:
+        return _hdfs_lib
     try:
         import pydoop
     except ImportError:
@@ -48,7 +60,51 @@ def import_hdfs_lib():
     ## is not required.
     import pydoop.hdfs as hdfs
     import pydoop.hdfs.path as hdfspath
-    return (hdfs, hdfspath)
+    _hdfs_lib = (hdfs, hdfspath)
+    return _hdfs_lib
+
+## Connections to HDFS namenodes, shared by all HDFSPath objects. 
+## They are indexed by the process ID too, since a connection 
+## can't be used in a forked process.
+_hdfs_connections = {}
+_hdfs_connections_lock = threading.Lock()
+
+def get_hdfs_connection(host, port):
+    """Returns:
+        pydoop.hdfs.hdfs object connected to the given namenode. 
+        The same object is returned for all calls with the same arguments.
+    """
+    key = (os.getpid(), host, port)
+    with _hdfs_connections_lock:
+        connection = _hdfs_connections.get(key)
+        if connection is None:
+            (hdfs, _) = import_hdfs_lib()
+            connection = hdfs.hdfs(host, port)
+            _hdfs_connections[key] = connection
+        return connection
+
+def split_hdfs_path(path):
+    """Splits an HDFS path into the namenode address and the path 
+    on the namenode. 
+
+    Returns:
+        tuple (host, port, path). If the path doesn't specify the namenode,
+        the default one, i.e. ('default', 0), is returned.
+    """
+    parsed = urlparse.urlparse(path)
+    if parsed.scheme != 'hdfs' or not parsed.netloc:
+        return ('default', 0, path)
+    return (parsed.hostname, parsed.port or 0, parsed.path or '/')
+
+## Basic properties of a file: `size` in bytes and `modification_time` given
+## as a number of seconds since the epoch
+FileStatus = namedtuple('FileStatus', ['size', 'modification_time'], 
+    verbose=False)
+
+## Properties of an existing file or directory: `is_dir` - True if it is
+## a directory, `size` and `modification_time` - see FileStatus
+FileInfo = namedtuple('FileInfo', ['is_dir', 'size', 'modification_time'],
+    verbose=False)
 
 class FileSystemPathFactory:
     local_fs_path_prefix = "local:"
@@ -72,15 +128,49 @@ class FileSystemPath:
         """
         raise NotImplementedError
 
+    def open_mapped(self):
+        """Open file for reading, mapping it into memory if possible
+
+        The returned file-like object supports the same operations as
+        the one returned by `open`. If it is a MappedFile object, parts of
+        the file can also be accessed without copying them.
+        """
+        return self.open("r")
+
     def ls(self):
         raise NotImplementedError
 
+    def ls_info(self):
+        """Lists the directory along with the properties of its entries
+
+        Returns:
+            list of pairs (name, FileInfo object)
+        """
+        return [(name, self.append(name).get_info()) for name in self.ls()]
+
     def exists(self):
         raise NotImplementedError
 
     def is_dir(self):
         raise NotImplementedError
 
+    def get_status(self):
+        """Returns:
+            a FileStatus object
+        """
+        raise NotImplementedError
+
+    def get_info(self):
+        """Checks the existence and the type of the path at once
+
+        Returns:
+            a FileInfo object or None if the path doesn't exist
+        """
+        if not self.exists():
+            return None
+        status = self.get_status()
+        return FileInfo(self.is_dir(), status.size, status.modification_time)
+
     def append(self, string):
         raise NotImplementedError
 
@@ -96,6 +186,14 @@ class LocalPath(FileSystemPath):
 
     def open(self, mode="r"):
         return open(self.__path, mode=mode)
+
+    def open_mapped(self):
+        with open(self.__path, mode="rb") as f:
+            try:
+                return MappedFile(f)
+            except (ValueError, EnvironmentError):
+                ## Empty files cannot be mapped
+                return self.open("r")
     
     def ls(self):
         return os.listdir(self.__path)
@@ -105,6 +203,20 @@ class LocalPath(FileSystemPath):
     
     def is_dir(self):
         return os.path.isdir(self.__path)
+
+    def get_status(self):
+        stat = os.stat(self.__path)
+        return FileStatus(stat.st_size, stat.st_mtime)
+
+    def get_info(self):
+        try:
+            stat = os.stat(self.__path)
+        except OSError as ex:
+            if ex.errno == errno.ENOENT:
+                return None
+            raise
+        return FileInfo(os.path.isdir(self.__path), stat.st_size, 
+                        stat.st_mtime)
     
     def append(self, string):
         return LocalPath(os.path.join(self.__path, string))
@@ -119,33 +231,122 @@ class LocalPath(FileSystemPath):
     def __str__(self):
         return self.__path
 
+class MappedFile:
+    """Read-only file-like object backed by a memory-mapped local file.
+
+    Reading data of a large file through the map avoids the system calls
+    and the copying done by the regular file object.
+    """
+
+    def __init__(self, f):
+        """
+        Args:
+            f: file object opened for reading. It can be closed 
+                after the object is created.
+        """
+        ## There is no need to hint sequential access with `madvise`;
+        ## the kernel reads ahead the pages of mapped files anyway.
+        self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, n=-1):
+        if n < 0:
+            n = len(self.__map) - self.__map.tell()
+        return self.__map.read(n)
+
+    def read_buffer(self, offset, length):
+        """Returns a part of the file without copying it.
+
+        The returned object is a read-only `buffer` which must not be used
+        after the file is closed.
+        """
+        return buffer(self.__map, offset, length)
+
+    def seek(self, offset, whence=0):
+        self.__map.seek(offset, whence)
+
+    def tell(self):
+        return self.__map.tell()
+
+    def close(self):
+        self.__map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
 class HDFSPath(FileSystemPath):
+    """Path in HDFS.
+
+    All the paths on the same namenode share a single connection to it
+    (see `get_hdfs_connection`), which is established when it is needed 
+    for the first time.
+    """
+
     def __init__(self, path):
-        (hdfs, hdfspath) = import_hdfs_lib()
-        self.hdfs = hdfs
-        self.hdfspath = hdfspath
+        ## Fails early if pydoop is not installed
+        import_hdfs_lib()
         self.__path = path
+        (self.__host, self.__port, self.__fs_path) = split_hdfs_path(path)
+
+    def __get_fs(self):
+        return get_hdfs_connection(self.__host, self.__port)
 
     def open(self, mode="r"):
-        return self.hdfs.open(self.__path, mode)
+        return self.__get_fs().open_file(self.__fs_path, mode)
     
     def ls(self):
-        files = []
-        for absolute_path in self.hdfs.ls(self.__path):    
-            files.append(os.path.basename(absolute_path))
-        return files
+        return [name for name, _ in self.ls_info()]
+
+    def ls_info(self):
+        return [(os.path.basename(entry['name'].rstrip('/')), 
+                 self.__to_file_info(entry)) 
+                for entry in self.__get_fs().list_directory(self.__fs_path)]
     
     def exists(self):
-        return self.hdfspath.exists(self.__path)
+        return self.__get_fs().exists(self.__fs_path)
     
     def is_dir(self):
-        return self.hdfspath.isdir(self.__path)
+        info = self.get_info()
+        return info is not None and info.is_dir
+
+    def get_status(self):
+        info = self.get_info()
+        if info is None:
+            raise IOError(errno.ENOENT, 'No such file or directory', 
+                self.__path)
+        return FileStatus(info.size, info.modification_time)
+
+    def get_info(self):
+        fs = self.__get_fs()
+        try:
+            return self.__to_file_info(fs.get_path_info(self.__fs_path))
+        except IOError:
+            ## The exception doesn't tell why the information is not 
+            ## available, so it is checked in a separate call
+            if not fs.exists(self.__fs_path):
+                return None
+            raise
+
+    @staticmethod
+    def __to_file_info(entry):
+        return FileInfo(entry['kind'] == 'directory', entry['size'],
+                        entry['last_mod'])
     
     def append(self, string):
         return HDFSPath("{}/{}".format(self.__path, string))
 
     def make_dirs(self):    
-        self.hdfs.mkdir(self.__path)
+        self.__get_fs().create_directory(self.__fs_path)
+
+    def __getstate__(self):
+        ## Connections can't be pickled, so they are established again 
+        ## after unpickling
+        return {'path': self.__path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
             
     def __str__(self):
         return self.__path
@@ -0,0 +1,192 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tarfile
+import time
+import zipfile
+from cStringIO import StringIO
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from avroknife.error import error
+
+## Default limit of the total size of the data waiting to be written
+DEFAULT_MAX_QUEUED_BYTES = 64 * 1024 * 1024
+
+## Formats supported by ArchiveWriter
+ARCHIVE_FORMATS = ['tar', 'zip']
+
+## Permissions of the files stored in archives
+_ARCHIVE_MEMBER_MODE = 0644
+
+def _write_file(path, data):
+    with path.open("w") as output:
+        output.write(data)
+
+class FileWriter:
+    """Writer of many small files, each one holding data of a single record.
+
+    Creating a file takes a round trip to the file system, which is
+    particularly long in case of HDFS. If threads are used, the files are
+    written in the background while the next records are being decoded.
+    The number of files and the total size of data waiting to be written
+    are limited.
+
+    Errors are reported along with the index of the record the file was
+    supposed to hold. In case of the background threads, the error is
+    raised by one of the next calls of `write` or by `close`.
+    """
+
+    def __init__(self, threads=0, max_queued_bytes=DEFAULT_MAX_QUEUED_BYTES):
+        """
+        Args:
+            threads: number of threads writing the files. If it is 0,
+                each file is written before `write` returns.
+            max_queued_bytes: maximum total size of the data of the files
+                waiting to be written. A single larger file is still
+                accepted if nothing else is waiting.
+        """
+        self.__pool = None
+        if threads > 0:
+            self.__pool = ThreadPool(threads)
+        self.__max_pending = 2 * threads
+        self.__max_queued_bytes = max_queued_bytes
+        ## Tuples (record index, size of data, AsyncResult)
+        self.__pending = deque()
+        self.__queued_bytes = 0
+
+    def write(self, index, path, data):
+        """Writes a file
+
+        Args:
+            index: index of the record the data comes from
+            path: a FileSystemPath object of the created file
+            data: binary string
+        """
+        if self.__pool is None:
+            self.__call(index, _write_file, path, data)
+            return
+        while len(self.__pending) > 0 and \
+                (len(self.__pending) >= self.__max_pending or
+                 self.__queued_bytes + len(data) > self.__max_queued_bytes):
+            self.__wait_for_oldest()
+        self.__pending.append((index, len(data),
+            self.__pool.apply_async(_write_file, (path, data))))
+        self.__queued_bytes = self.__queued_bytes + len(data)
+
+    def close(self):
+        """Waits until all the files are written"""
+        try:
+            while len(self.__pending) > 0:
+                self.__wait_for_oldest()
+        finally:
+            self.__stop()
+
+    def __wait_for_oldest(self):
+        index, size, result = self.__pending.popleft()
+        self.__queued_bytes = self.__queued_bytes - size
+        self.__call(index, result.get)
+
+    @staticmethod
+    def __call(index, function, *args):
+        try:
+            function(*args)
+        except Exception:
+            error("while processing record with index {}".format(index))
+            raise
+
+    def __stop(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            ## The files already submitted are still written, but their
+            ## errors are not reported
+            self.__pending.clear()
+            self.__stop()
+
+class ArchiveWriter:
+    """Writer of many small files as members of a single archive.
+
+    The archive is written sequentially, so creating it takes a single
+    file system operation instead of one per file. The members are
+    stored without compression.
+    """
+
+    def __init__(self, path, format_):
+        """
+        Args:
+            path: a FileSystemPath object of the created archive
+            format_: one of ARCHIVE_FORMATS
+        """
+        assert format_ in ARCHIVE_FORMATS
+        self.__format = format_
+        self.__time = time.time()
+        self.__file = path.open("w")
+        try:
+            if format_ == 'tar':
+                ## The stream mode doesn't require seeking in the file
+                self.__archive = tarfile.open(fileobj=self.__file, 
+                    mode='w|')
+            else:
+                self.__archive = zipfile.ZipFile(self.__file, 'w', 
+                    zipfile.ZIP_STORED, allowZip64=True)
+        except Exception:
+            self.__file.close()
+            raise
+
+    def write(self, index, name, data):
+        """Adds a file to the archive
+
+        Args:
+            index: index of the record the data comes from
+            name: name of the member of the archive. It can contain 
+                directories separated with "/".
+            data: binary string
+        """
+        try:
+            if self.__format == 'tar':
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = self.__time
+                info.mode = _ARCHIVE_MEMBER_MODE
+                self.__archive.addfile(info, StringIO(data))
+            else:
+                info = zipfile.ZipInfo(name, 
+                    time.localtime(self.__time)[:6])
+                info.external_attr = _ARCHIVE_MEMBER_MODE << 16
+                self.__archive.writestr(info, data)
+        except Exception:
+            error("while processing record with index {}".format(index))
+            raise
+
+    def close(self):
+        try:
+            self.__archive.close()
+        finally:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,155 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import json
+from collections import namedtuple
+
+from avroknife.container import ContainerReader
+
+## Position of an Avro block in the data store: `file_number` - number of
+## the file in the sorted list of data store files, `offset` - position of
+## the block in the file, `index` - global index of the first record of
+## the block, `local_index` - index of this record inside the file.
+BlockPosition = namedtuple('BlockPosition',
+    ['file_number', 'offset', 'index', 'local_index'], verbose=False)
+
+class OffsetIndex:
+    """Index of the positions of records in a data store.
+
+    For each Avro file of the data store, the index stores the offsets and
+    record counts of all of its data blocks. This allows to find the block
+    containing a record with given global index in logarithmic time.
+
+    The index is stored as a JSON file in the data store directory. Its name
+    starts with an underscore, so it is ignored when reading the data store.
+    Sizes and modification times of the indexed files are stored as well,
+    so that an outdated index can be detected.
+    """
+
+    file_name = '_avroknife_offsets.json'
+    __version = 1
+
+    def __init__(self, files):
+        """
+        Args:
+            files: list of dictionaries describing the indexed files.
+                See the `build` method for the description of their format.
+        """
+        self.__files = files
+        self.__block_starts = []
+        self.__block_positions = []
+        for file_number, file_ in enumerate(files):
+            local_index = 0
+            for index, offset, count in file_['blocks']:
+                self.__block_starts.append(index)
+                self.__block_positions.append(
+                    BlockPosition(file_number, offset, index, local_index))
+                local_index = local_index + count
+        self.__records_num = 0
+        if len(files) > 0:
+            last_file = files[-1]
+            self.__records_num = last_file['index'] + last_file['records']
+
+    @staticmethod
+    def build(paths, names, statuses):
+        """Creates the index by reading the headers of all Avro blocks
+
+        Args:
+            paths: list of FileSystemPath objects corresponding to
+                the Avro files of the data store, in the data store order
+            names: list of names of these files
+            statuses: list of FileStatus or FileInfo objects of these files
+        """
+        files = []
+        index = 0
+        for path, name, status in zip(paths, names, statuses):
+            blocks = []
+            file_index = index
+            with ContainerReader(path.open_mapped()) as reader:
+                for block in reader.iter_block_infos():
+                    if block.count > 0:
+                        blocks.append([index, block.offset, block.count])
+                        index = index + block.count
+            files.append({'name': name,
+                          'size': status.size,
+                          'modification_time': status.modification_time,
+                          'index': file_index,
+                          'records': index - file_index,
+                          'blocks': blocks})
+        return OffsetIndex(files)
+
+    @staticmethod
+    def load(path):
+        """Reads the index from a file
+
+        Args:
+            path: a FileSystemPath object
+        Returns:
+            an OffsetIndex object or None if the file doesn't contain a valid
+            index
+        """
+        with path.open("r") as f:
+            try:
+                content = json.loads(f.read())
+            except ValueError:
+                return None
+        if not isinstance(content, dict) or \
+                content.get('version') != OffsetIndex.__version or \
+                not isinstance(content.get('files'), list):
+            return None
+        try:
+            return OffsetIndex(content['files'])
+        except (KeyError, TypeError, ValueError):
+            ## The description of a file has a wrong format
+            return None
+
+    def save(self, path):
+        """Writes the index to a file
+
+        Args:
+            path: a FileSystemPath object
+        """
+        with path.open("w") as f:
+            f.write(json.dumps({'version': OffsetIndex.__version,
+                                'files': self.__files}))
+
+    def is_up_to_date(self, names, statuses):
+        """Checks if the index corresponds to the current data store files
+
+        Args:
+            names: list of names of the data store files in data store order
+            statuses: list of FileStatus or FileInfo objects of these files
+        """
+        if len(names) != len(self.__files):
+            return False
+        for name, status, file_ in zip(names, statuses, self.__files):
+            if name != file_['name'] or status.size != file_['size'] or \
+                    status.modification_time != file_['modification_time']:
+                return False
+        return True
+
+    def get_number_of_records(self):
+        return self.__records_num
+
+    def locate(self, index):
+        """Finds the block containing the record with given global index
+
+        Returns:
+            a BlockPosition object or None if there is no such record
+        """
+        if index < 0 or index >= self.__records_num:
+            return None
+        i = bisect.bisect_right(self.__block_starts, index) - 1
+        return self.__block_positions[i]
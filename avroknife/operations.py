@@ -15,12 +15,18 @@
 from __future__ import print_function
 
 import json
+import multiprocessing
+import time
 
-from avro.datafile import DataFileWriter
-from avro.io import DatumWriter
-
-from avroknife.error import error
-from avroknife.utils import encapsulate_strings, dict_to_json, to_byte_string
+from avroknife.container import WriterStatistics
+from avroknife.error import error, info
+from avroknife.file_writer import FileWriter, ArchiveWriter, \
+    DEFAULT_MAX_QUEUED_BYTES
+from avroknife.printer import StdoutPrinter, frame
+from avroknife.shards import plan_shards, write_shard, get_shard_file_name, \
+    SINGLE_FILE_NAME
+from avroknife.utils import dict_to_json, to_byte_string, \
+    FileAlreadyExistsException
 
 def to_json(data_store, record_selector, printer, pretty=False):
     """Converts selected records to JSON.
@@ -32,32 +38,42 @@ def to_json(data_store, record_selector, printer, pretty=False):
         printer: a Printer object that is used to print the JSON.
         pretty: True if the output should be a valid, pretty-printed JSON.
     """
-    first_record = True
+    texts = __iter_records_as_json(data_store, record_selector, pretty)
     if pretty:
         printer.print("[", end="") 
-    for record in record_selector.get_records(data_store):
+        printer.write_many(__prepend_separators(texts, ",\n"), end="")
+        printer.print("]")
+    else:
+        printer.write_many(texts)
+
+def __iter_records_as_json(data_store, record_selector, pretty):
+    ## Without pretty-printing and selection by content, the records are 
+    ## converted to JSON directly from their binary representation
+    as_json = not pretty and not record_selector.depends_on_content()
+    converter = data_store.get_json_converter()
+    for record in record_selector.get_records(data_store, as_json):
         try:
-            if first_record:
-                first_record = False
+            if as_json:
+                yield record.content
             else:
-                if pretty:
-                    printer.print(",")
-                else:
-                    printer.print("")
-            content = encapsulate_strings(record.content)
-            printer.print(dict_to_json(content, pretty), end="")
+                yield converter.convert(record.content, pretty)
         except Exception:
             error("while processing record with index {}".format(record.index))
             raise
-    if pretty:
-        printer.print("]")
-    else:
-        ## The case when no records were present
-        if not first_record:
-            printer.print("")
+
+def __prepend_separators(texts, separator):
+    first = True
+    for text in texts:
+        if first:
+            first = False
+            yield text
+        else:
+            yield separator + text
 
 def extract(data_store, record_selector, value_field, 
-    name_field=None, create_dirs=None, output_dir_path=None):
+    name_field=None, create_dirs=None, output_dir_path=None,
+    write_threads=0, max_queued_bytes=DEFAULT_MAX_QUEUED_BYTES,
+    archive=None, printer=None, framing='newline'):
     """Extract specified field from selected records
 
     Args:
@@ -77,66 +93,156 @@ def extract(data_store, record_selector, value_field,
         output_dir_path: a FileSystemPath object. This is where the extracted
             fields will be saved. If this is not given, the extracted fields
             are printed to stdout.
+        write_threads: number of threads writing the files in the output
+            directory while the next records are processed. If it is 0, 
+            each file is written before the next record is processed.
+        max_queued_bytes: maximum total size of the extracted fields 
+            waiting to be written by the threads
+        archive: format of an archive, "tar" or "zip", the files are to be
+            stored in instead of the output directory. In such a case,
+            `output_dir_path` is the path of the archive and the names of 
+            its members are the same as the names of the files would be 
+            inside the output directory. The threads are not used.
+        printer: a Printer object the extracted fields are printed with
+            if `output_dir_path` is not given. If None, they are printed 
+            to stdout without buffering.
+        framing: the way the printed fields are delimited; see 
+            `printer.frame`
     """
-    if output_dir_path is not None:
-        output_dir_path.make_dirs()
-    for record in record_selector.get_records(data_store):
-        datum = record.content
-        if datum: #check if there is any data to be written
-            field_value = __get_value(datum, value_field)
-            if output_dir_path is not None:
-                try:
-                    output_name = __get_output_name(record.index, datum, name_field)
-                    output_path = output_dir_path.append(output_name)
-                    file_path = None
-                    if create_dirs:
-                        file_path = __prepare_dir(output_path)
-                    else:
-                        file_path = __prepare_file(output_path, name_field) 
-                    with file_path.open("w") as output:
-                        output.write(to_byte_string(field_value))
-                except Exception:
-                    error("while processing record with index {}"\
-                        .format(record.index))
-                    raise
-            else:
-                print(to_byte_string(field_value))
-
-def __prepare_dir(output_dir):
-    if output_dir.exists():
-        if not output_dir.is_dir():
-            error("File with name '{}' already exists. "\
-                "Unable to create a directory with the same name".\
-                format(output_dir))
-            raise Exception()
+    if output_dir_path is None and printer is None:
+        printer = StdoutPrinter(buffer_size=0)
+    ## Names of the files in the output directory. Duplicate names are 
+    ## detected with it, without checking the file system for each record.
+    used_names = None
+    if archive is not None:
+        used_names = set()
+        writer = ArchiveWriter(output_dir_path, archive)
     else:
-        output_dir.make_dirs()
-    file_names = output_dir.ls()
-    new_number = 0
-    if len(file_names) > 0:
-        file_numbers = [int(f) for f in file_names]
-        new_number = max(file_numbers)+1
+        if output_dir_path is not None:
+            output_dir_path.make_dirs()
+            if not create_dirs:
+                used_names = set(output_dir_path.ls())
+        writer = FileWriter(write_threads, max_queued_bytes)
+    ## Numbers of the next files to be created in the directories 
+    ## of the `create_dirs` option, indexed by the paths of the directories
+    ## (or by the names of the directories inside the archive)
+    next_file_numbers = {}
+    with writer:
+        for record in record_selector.get_records(data_store):
+            datum = record.content
+            if datum: #check if there is any data to be written
+                field_value = __get_value(datum, value_field)
+                if output_dir_path is not None:
+                    try:
+                        output_name = __get_output_name(record.index, datum, 
+                            name_field)
+                        if archive is not None:
+                            file_path = __get_member_name(output_name, 
+                                create_dirs, next_file_numbers, used_names, 
+                                name_field)
+                        elif create_dirs:
+                            file_path = __prepare_dir(
+                                output_dir_path.append(output_name), 
+                                next_file_numbers)
+                        else:
+                            file_path = __prepare_file(
+                                output_dir_path.append(output_name), 
+                                output_name, used_names, name_field)
+                        data = to_byte_string(field_value)
+                    except Exception:
+                        error("while processing record with index {}"\
+                            .format(record.index))
+                        raise
+                    ## Errors of writing the file are reported by the writer
+                    writer.write(record.index, file_path, data)
+                else:
+                    printer.print(frame(to_byte_string(field_value), framing),
+                        end="")
+
+def __prepare_dir(output_dir, next_file_numbers):
+    """Returns the path of a new file in the given directory.
+
+    The files in the directory are named with consecutive numbers.
+    The directory is checked and listed only the first time it is seen;
+    after that, the number of the next file is taken from 
+    `next_file_numbers`.
+    """
+    key = str(output_dir)
+    new_number = next_file_numbers.get(key)
+    if new_number is None:
+        output_dir_info = output_dir.get_info()
+        if output_dir_info is not None:
+            if not output_dir_info.is_dir:
+                error("File with name '{}' already exists. "\
+                    "Unable to create a directory with the same name".\
+                    format(output_dir))
+                raise Exception()
+            file_names = output_dir.ls()
+        else:
+            output_dir.make_dirs()
+            file_names = []
+        new_number = 0
+        if len(file_names) > 0:
+            file_numbers = [int(f) for f in file_names]
+            new_number = max(file_numbers)+1
+    next_file_numbers[key] = new_number + 1
     new_file_name = str(new_number)
     return output_dir.append(new_file_name)
 
-def __prepare_file(output_file, name_field):
-    if output_file.exists():
-        ## There is a race condition between checking 
-        ## if the file exists and opening it for writing 
+def __prepare_file(output_file, output_name, used_names, name_field):
+    """Checks if a file with given name can be created in the output 
+    directory.
+
+    Args:
+        output_file: path of the file
+        output_name: name of the file relative to the output directory
+        used_names: set of names of the files in the output directory;
+            the name of the file is added to it
+        name_field: see `extract`
+    """
+    ## A file created before may still be waiting to be written, so 
+    ## the names used already are checked in any case. A file placed 
+    ## in a subdirectory, which wasn't listed, is checked in the file system
+    ## as well.
+    exists = output_name in used_names or \
+        ("/" in output_name and output_file.exists())
+    if exists:
+        ## There is a race condition between listing the output 
+        ## directory and opening the file for writing 
         ## but I don't see  an easy way to deal with it 
         ## in a way that would work for HDFS as well as 
         ## for local file system paths. Dealing with 
         ## this problem doesn't seem to be important anyway.
-        error_string = "The file with name '{}' "\
-            "already exists.".format(output_file) 
-        if name_field is not None:
-            error_string = error_string + " This is probably "\
-                "because the selected values of given field "\
-                "'{}' are not unique".format(name_field)
-        error(error_string)
-        raise Exception()
+        __report_existing_file(output_file, name_field)
+    used_names.add(output_name)
     return output_file
 
+def __get_member_name(output_name, create_dirs, next_file_numbers, 
+        used_names, name_field):
+    """Returns the name of a new member of the archive.
+
+    The names are the same as the ones of the files created in an empty 
+    output directory by `__prepare_dir` and `__prepare_file`.
+    """
+    if create_dirs:
+        new_number = next_file_numbers.get(output_name, 0)
+        next_file_numbers[output_name] = new_number + 1
+        return "{}/{}".format(output_name, new_number)
+    if output_name in used_names:
+        __report_existing_file(output_name, name_field)
+    used_names.add(output_name)
+    return output_name
+
+def __report_existing_file(name, name_field):
+    error_string = "The file with name '{}' "\
+        "already exists.".format(name) 
+    if name_field is not None:
+        error_string = error_string + " This is probably "\
+            "because the selected values of given field "\
+            "'{}' are not unique".format(name_field)
+    error(error_string)
+    raise FileAlreadyExistsException(error_string)
+
 def __get_output_name(record_index, datum, name_field):
     file_name = str(record_index)
     if name_field is not None:
@@ -158,23 +264,114 @@ def __get_value(datum, field_name):
         error("Field '{}' is not defined in the data".format(field_name))
         raise
 
-def copy(data_store, record_selector, output_dir_path):
+def copy(data_store, record_selector, output_dir_path, 
+        max_records_per_file=None, max_bytes_per_file=None, jobs=1,
+        codec=None, compression_level=None):
     """Dump selected records from the data store to another Avro file
     
+    Data blocks whose records are all selected are copied without decoding 
+    them, as long as they were written with the reader schema of the data 
+    store. They are not even decompressed if the codec of the copy is 
+    the same as the one of the data store and no compression level is given.
+
+    If a maximum number of records or bytes per file is given, the records
+    are split into files named "part-00000.avro", "part-00001.avro", etc. 
+    Otherwise, they are written to a single "content.avro" file.
+
+    At the end, the amounts of written data and the throughput of 
+    the compression are reported.
+
     Args:
         data_store: a DataStore object
         record_selector: a RecordSelector object. It defines which records
             should be processed.
         output_dir_path: a FileSystemPath object. This is where the dump will
             be saved.
+        max_records_per_file: see `shards.plan_shards`
+        max_bytes_per_file: see `shards.plan_shards`
+        jobs: number of worker processes writing the files. The result
+            doesn't depend on it. If the number of records is limited and 
+            a selection is given, the files are written one after another,
+            since it is not known in advance which one reaches the limit.
+        codec: name of the codec of the copy (see 
+            `container.get_available_codecs`). If None, the codec of 
+            the data store is used.
+        compression_level: see `container.compress`
+    Returns:
+        a container.WriterStatistics object
     """
+    start = time.time()
+    if codec is None:
+        codec = data_store.get_codec()
+    shards = plan_shards(record_selector.get_block_ranges(data_store), 
+        max_records_per_file, max_bytes_per_file)
+    split = max_records_per_file is not None or max_bytes_per_file is not None
+    selection = record_selector.get_selection()
+    ## The limit is already applied to the ranges of indexes of the shards
+    ## unless the records are selected by their contents
+    limit = None
+    if selection is not None:
+        limit = record_selector.get_limit()
     output_dir_path.make_dirs()
-    with output_dir_path.append("content.avro").open("w") as output:
-        with DataFileWriter(output, DatumWriter(), data_store.get_schema()) \
-                as writer:
-            records = record_selector.get_records(data_store)
-            for record in records:
-                writer.append(record.content)
+    tasks = [(data_store, shard, output_dir_path.append(
+                get_shard_file_name(shard.number) if split 
+                    else SINGLE_FILE_NAME),
+              codec, selection)
+             for shard in shards]
+    statistics = WriterStatistics()
+    if jobs > 1 and limit is None:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for task_statistics in pool.imap(__write_shard, 
+                    [task + (compression_level,) for task in tasks]):
+                statistics.add(task_statistics)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            if limit is not None and limit <= 0:
+                break
+            task_statistics = write_shard(*task, limit=limit, 
+                compression_level=compression_level, 
+                compression_threads=_COMPRESSION_THREADS)
+            statistics.add(task_statistics)
+            if limit is not None:
+                limit = limit - task_statistics.records
+    __report_copy(statistics, codec, time.time() - start)
+    return statistics
+
+## Number of threads compressing the blocks of an output file
+_COMPRESSION_THREADS = 2
+
+def __write_shard(task):
+    data_store, shard, output_path, codec, selection, compression_level = task
+    return write_shard(data_store, shard, output_path, codec, selection, 
+        compression_level=compression_level, 
+        compression_threads=_COMPRESSION_THREADS)
+
+def __report_copy(statistics, codec, seconds):
+    megabytes = 1024.0 * 1024.0
+    message = 'copied {} records in {:.2f} s'.format(statistics.records, 
+        seconds)
+    if statistics.uncompressed_bytes > 0 and codec == 'null':
+        message = message + '; wrote {:.2f} MB of uncompressed data'.format(
+            statistics.uncompressed_bytes / megabytes)
+    elif statistics.uncompressed_bytes > 0:
+        message = message + '; compressed {:.2f} MB of data into '\
+            '{:.2f} MB with the "{}" codec; the compression processed '\
+            '{:.2f} MB/s of raw and {:.2f} MB/s of compressed data'.format(
+                statistics.uncompressed_bytes / megabytes, 
+                statistics.compressed_bytes / megabytes, codec,
+                statistics.uncompressed_bytes / megabytes 
+                    / max(statistics.compression_seconds, 1e-6),
+                statistics.compressed_bytes / megabytes 
+                    / max(statistics.compression_seconds, 1e-6))
+    if statistics.copied_bytes > 0:
+        message = message + '; copied {:.2f} MB of compressed data '\
+            'without recompressing it'.format(
+                statistics.copied_bytes / megabytes)
+    info(message)
 
 def get_schema(data_store):
     """Get data store schema
@@ -186,6 +383,23 @@ def get_schema(data_store):
     """
     return dict_to_json(json.loads(str(data_store.get_schema())), True)
 
+def build_stats(data_store, field_names):
+    """Collect statistics of values of fields in each Avro block of the data
+    store. They are used to skip blocks which can't contain records matching
+    the condition given in the "select" option.
+
+    Args:
+        data_store: a DataStore object
+        field_names: list of names of fields, possibly nested
+    Returns:
+        a block_stats.BlockStatistics object
+    """
+    try:
+        return data_store.build_block_statistics(field_names)
+    except ValueError as ex:
+        error("unable to collect block statistics: {}".format(ex))
+        raise
+
 def count(data_store, record_selector):
     """Get the number of selected records in the data store
     
@@ -196,6 +410,9 @@ def count(data_store, record_selector):
     Returns:
         number
     """
+    if not record_selector.depends_on_content():
+        ## Fast path: the records don't have to be decoded
+        return record_selector.count_records(data_store.count_records())
     n = 0
     for _ in record_selector.get_records(data_store):
         n = n+1
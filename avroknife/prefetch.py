@@ -0,0 +1,192 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Opening and buffering of files ahead of reading them.
+
+In case of HDFS, opening a file and fetching its first bytes requires
+round trips to the namenode and to the datanodes. If a data store consists
+of many small files, these round trips take more time than decoding
+the records. Opening the next files in background threads, while
+the current one is being read, hides this latency.
+"""
+
+import functools
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from avroknife.file_system import MappedFile
+
+## Default limit of the memory taken by the buffered data of the files
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+
+class PrefetchedFile:
+    """Read-only file-like object whose beginning has been read into memory.
+
+    The remaining part of the file, if any, is read from the underlying
+    file object.
+    """
+
+    def __init__(self, f, size, data, release):
+        """
+        Args:
+            f: file object opened for reading or None if the whole file
+                has been read
+            size: size of the file in bytes
+            data: binary string with the beginning of the file
+            release: function called when the file is closed
+        """
+        self.__f = f
+        self.__size = size
+        self.__data = data
+        self.__release = release
+        self.__position = 0
+
+    def read(self, n=-1):
+        if n < 0:
+            n = self.__size - self.__position
+        start = self.__position
+        end = min(start + n, self.__size)
+        if end <= len(self.__data):
+            result = self.__data[start:end]
+        else:
+            self.__f.seek(start)
+            result = self.__f.read(end - start)
+        self.__position = start + len(result)
+        return result
+
+    def read_buffer(self, offset, length):
+        """Returns a part of the file, without copying it if it has been
+        read into memory. See `file_system.MappedFile.read_buffer`.
+        """
+        if offset + length <= len(self.__data):
+            return buffer(self.__data, offset, length)
+        self.__f.seek(offset)
+        return self.__f.read(length)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset = self.__position + offset
+        elif whence == 2:
+            offset = self.__size + offset
+        self.__position = offset
+
+    def tell(self):
+        return self.__position
+
+    def close(self):
+        if self.__f is not None:
+            self.__f.close()
+            self.__f = None
+        if self.__release is not None:
+            self.__release()
+            self.__release = None
+        self.__data = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class FilePrefetcher:
+    """Opens files in a pool of threads ahead of reading them.
+
+    Apart from opening the files, the threads read their beginnings,
+    or whole files if they are small enough, into memory. The total size
+    of the buffered data is limited; a file is only opened if there's
+    no memory left for its data. Files mapped into memory are not buffered
+    at all, since the operating system reads their data ahead anyway.
+    """
+
+    def __init__(self, files_num, max_memory=DEFAULT_MAX_MEMORY):
+        """
+        Args:
+            files_num: number of files opened ahead of the one being read
+            max_memory: maximum total size, in bytes, of the data of
+                the files kept in memory
+        """
+        assert files_num > 0
+        self.__files_num = files_num
+        self.__available_memory = max_memory
+        self.__lock = threading.Lock()
+
+    def iter_files(self, paths):
+        """Opens the files in the given order
+
+        Args:
+            paths: iterable of FileSystemPath objects. It is consumed only
+                as far as the files are opened.
+        Returns:
+            opened file-like objects. They have to be closed by the caller.
+            If opening a file fails, the exception is raised when the file
+            is requested.
+        """
+        paths = iter(paths)
+        pool = ThreadPool(self.__files_num)
+        pending = deque()
+        try:
+            while True:
+                ## The files following the one being read are opened
+                ## in the meantime
+                while len(pending) <= self.__files_num:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    pending.append(pool.apply_async(self.__open, (path,)))
+                if len(pending) == 0:
+                    return
+                yield pending.popleft().get()
+        finally:
+            ## Files which won't be read, e.g. because the iteration
+            ## has been stopped, are closed
+            pool.close()
+            for result in pending:
+                try:
+                    result.get().close()
+                except Exception:
+                    pass
+            pool.join()
+
+    def __open(self, path):
+        f = path.open_mapped()
+        if isinstance(f, MappedFile):
+            return f
+        try:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(0)
+            reserved = self.__reserve_memory(size)
+            data = f.read(reserved) if reserved > 0 else ''
+        except Exception:
+            f.close()
+            raise
+        if len(data) == size:
+            f.close()
+            f = None
+        return PrefetchedFile(f, size, data,
+            functools.partial(self.__release_memory, reserved))
+
+    def __reserve_memory(self, size):
+        """Returns:
+            number of bytes, up to `size`, which can be buffered
+        """
+        with self.__lock:
+            reserved = min(size, self.__available_memory)
+            self.__available_memory = self.__available_memory - reserved
+            return reserved
+
+    def __release_memory(self, size):
+        with self.__lock:
+            self.__available_memory = self.__available_memory + size
@@ -14,10 +14,111 @@
 
 from __future__ import print_function
 
+import errno
+import os
+import struct
+import sys
+
+from avroknife.utils import to_byte_string
+
+## Default number of bytes collected before they are written to the output
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+## Ways of delimiting binary values printed one after another (see `frame`)
+FRAMINGS = ['newline', 'nul', 'u32-length-prefix', 'netstring']
+
+_STRUCT_U32 = struct.Struct('>I')
+
+def frame(data, framing):
+    """Delimits a binary value so that it can be told apart from 
+    the following ones.
+
+    Args:
+        data: binary string
+        framing: one of FRAMINGS:
+            "newline" - the value is followed by a newline character,
+            "nul" - the value is followed by a NUL character,
+            "u32-length-prefix" - the value is preceded by its length
+                given as a 4-byte big-endian unsigned integer,
+            "netstring" - the value is written as a netstring, i.e. 
+                "<length>:<value>,", where the length is a decimal number.
+            Only the last two ones are lossless for arbitrary values.
+    Returns:
+        binary string
+    Raises:
+        ValueError: the value is too long to be framed
+    """
+    if framing == 'newline':
+        return data + '\n'
+    elif framing == 'nul':
+        return data + '\0'
+    elif framing == 'u32-length-prefix':
+        if len(data) > 0xffffffff:
+            raise ValueError('value of {} bytes is too long to be '\
+                'prefixed with its length'.format(len(data)))
+        return _STRUCT_U32.pack(len(data)) + data
+    elif framing == 'netstring':
+        return '{}:'.format(len(data)) + data + ','
+    raise ValueError('unknown framing "{}"'.format(framing))
+
+class OutputClosedException(Exception):
+    """Raised when the reader of the standard output has gone away, 
+    e.g., when the output is piped into `head`"""
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
 class Printer:
-    """Output printing abstraction"""
+    """Output printing abstraction.
+
+    The printed text is collected in a buffer and written to the output in
+    large chunks when the buffer is full and when the printer is closed.
+    """
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Args:
+            buffer_size: number of bytes collected before they are written.
+                If it is 0, each printed text is written immediately.
+        """
+        self.__buffer_size = buffer_size
+        self.__buffer = []
+        self.__buffered_bytes = 0
+
     def print(self, text, end="\n"):
-        raise NotImplementedError 
+        self.__buffer.append(to_byte_string(text))
+        self.__buffer.append(end)
+        self.__buffered_bytes += len(self.__buffer[-2]) + len(end)
+        if self.__buffered_bytes >= self.__buffer_size:
+            self.flush()
+
+    def write_many(self, texts, end="\n"):
+        """Prints many texts, each one followed by `end`
+
+        Args:
+            texts: an iterable of strings, e.g. a list or a generator 
+                of a batch of records
+        """
+        buffer_ = self.__buffer
+        buffer_size = self.__buffer_size
+        for text in texts:
+            text = to_byte_string(text)
+            buffer_.append(text)
+            buffer_.append(end)
+            self.__buffered_bytes += len(text) + len(end)
+            if self.__buffered_bytes >= buffer_size:
+                self.flush()
+
+    def flush(self):
+        """Writes the contents of the buffer to the output"""
+        if self.__buffered_bytes == 0:
+            return
+        data = ''.join(self.__buffer)
+        del self.__buffer[:]
+        self.__buffered_bytes = 0
+        self._write(data)
+
+    def _write(self, data):
+        """Writes data to the output; to be implemented by subclasses"""
+        raise NotImplementedError
 
     def __enter__(self):
         return self
@@ -31,20 +132,51 @@ class Printer:
 
 class StdoutPrinter(Printer):
     """Prints to stdout"""
-    def print(self, text, end="\n"):
-        print(text, end=end)
+    def __init__(self, buffer_size=None):
+        """
+        Args:
+            buffer_size: see Printer. If None, the output is buffered
+                unless it is a terminal.
+        """
+        if buffer_size is None:
+            buffer_size = DEFAULT_BUFFER_SIZE
+            if sys.stdout.isatty():
+                buffer_size = 0
+        Printer.__init__(self, buffer_size)
+        self.__closed = False
 
-    """Does nothing since this printer doesn't hold any resources"""
+    def _write(self, data):
+        if self.__closed:
+            return
+        try:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+        except IOError as ex:
+            if ex.errno != errno.EPIPE:
+                raise
+            self.__closed = True
+            ## Anything left in the buffer of sys.stdout would be flushed 
+            ## at exit, causing an error message to be printed
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+            raise OutputClosedException('the standard output has been closed')
+
+    """Writes the remaining buffered text"""
     def close(self):
-        pass
+        self.flush()
 
 class FilePrinter(Printer):
-    def __init__(self, fs_path):
+    def __init__(self, fs_path, buffer_size=DEFAULT_BUFFER_SIZE):
+        Printer.__init__(self, buffer_size)
         self.__f = fs_path.open("w")
 
     """Prints to file"""
-    def print(self, text, end="\n"):
-        print(text, file=self.__f, end=end)
+    def _write(self, data):
+        self.__f.write(data)
 
     def close(self):
-        self.__f.close()
+        try:
+            self.flush()
+        finally:
+            self.__f.close()
@@ -0,0 +1,200 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import avro.schema
+
+from avroknife.error import error
+
+## Marker of a record whose all fields are selected
+_ALL_FIELDS = None
+
+def project_schema(schema, field_names):
+    """Creates a reader schema containing only the given fields.
+
+    When records are read with such a schema, the fields that are not present
+    in it are skipped without being decoded.
+
+    Args:
+        schema: an avro.schema.RecordSchema object
+        field_names: list of names of the fields to be retained. A name can
+            refer to a nested field, e.g. 'field1.field2'. Nested fields
+            of records placed in arrays, maps and unions can be selected
+            this way as well.
+    Returns:
+        an avro.schema.RecordSchema object
+    """
+    if schema.type != 'record':
+        error('Fields can be selected only if the schema is a record')
+        raise ValueError(schema.type)
+    selections = {}
+    for field_name in field_names:
+        if not _is_defined(schema, field_name.split('.')):
+            error("Field '{}' is not defined in the schema".format(field_name))
+            raise KeyError(field_name)
+        tree = _ALL_FIELDS
+        for part in reversed(field_name.split('.')):
+            tree = {part: tree}
+        _collect_selections(schema, tree, selections)
+    projected = _project(schema, selections, set())
+    return avro.schema.parse(json.dumps(projected))
+
+def _merge(tree0, tree1):
+    if tree0 is _ALL_FIELDS or tree1 is _ALL_FIELDS:
+        return _ALL_FIELDS
+    merged = dict(tree0)
+    for name, subtree in tree1.items():
+        if name in merged:
+            merged[name] = _merge(merged[name], subtree)
+        else:
+            merged[name] = subtree
+    return merged
+
+def _get_record_schemas(schema):
+    """Returns record schemas directly reachable from the given one through
+    unions, arrays and maps"""
+    if schema.type in ['record', 'error']:
+        return [schema]
+    elif schema.type in ['union', 'error_union']:
+        records = []
+        for s in schema.schemas:
+            records.extend(_get_record_schemas(s))
+        return records
+    elif schema.type == 'array':
+        return _get_record_schemas(schema.items)
+    elif schema.type == 'map':
+        return _get_record_schemas(schema.values)
+    else:
+        return []
+
+def _is_defined(schema, parts):
+    """Tells whether the record schema defines a possibly nested field.
+
+    A field nested in a union is defined if any record of the union 
+    defines it.
+
+    Args:
+        parts: list of names of the nested fields, e.g. ['a', 'b']
+    """
+    field = schema.fields_dict.get(parts[0])
+    if field is None:
+        return False
+    if len(parts) == 1:
+        return True
+    return any(_is_defined(record, parts[1:]) 
+               for record in _get_record_schemas(field.type))
+
+def _filter_tree(schema, tree):
+    """Returns:
+        the part of the selection tree defined in the record schema or None
+        if no selected field is defined there
+    """
+    if tree is _ALL_FIELDS:
+        return _ALL_FIELDS
+    filtered = {}
+    for name, subtree in tree.items():
+        field = schema.fields_dict.get(name)
+        if field is None:
+            continue
+        if subtree is _ALL_FIELDS or any(
+                _filter_tree(record, subtree) is not None 
+                for record in _get_record_schemas(field.type)):
+            filtered[name] = subtree
+    if len(filtered) == 0:
+        return None
+    return filtered
+
+def _collect_selections(schema, tree, selections):
+    """Merges the selection tree into selections of fields of named records
+
+    Records of a union are pruned only if they define some of the selected
+    subfields; the other ones are left intact.
+
+    Args:
+        schema: a record schema
+        tree: dictionary mapping names of the selected fields of the record
+            to trees describing selected subfields or _ALL_FIELDS. All 
+            the fields have to be defined in the record.
+        selections: dictionary mapping full names of records to their
+            selection trees
+    """
+    if schema.fullname in selections:
+        merged = _merge(selections[schema.fullname], tree)
+        if merged == selections[schema.fullname]:
+            return
+    else:
+        merged = tree
+    selections[schema.fullname] = merged
+    if merged is _ALL_FIELDS:
+        for field in schema.fields:
+            for record in _get_record_schemas(field.type):
+                _collect_selections(record, _ALL_FIELDS, selections)
+        return
+    for name, subtree in merged.items():
+        field = schema.fields_dict[name]
+        for record in _get_record_schemas(field.type):
+            record_tree = _filter_tree(record, subtree)
+            if record_tree is not None:
+                _collect_selections(record, record_tree, selections)
+
+def _project(schema, selections, defined_names):
+    """Converts the schema into its JSON representation with some of
+    the record fields removed
+
+    Args:
+        schema: an avro.schema.Schema object
+        selections: dictionary mapping full names of records to their
+            selection trees
+        defined_names: full names of the types already defined in the
+            produced JSON representation
+    """
+    if schema.type in ['record', 'error']:
+        if schema.fullname in defined_names:
+            return schema.fullname
+        defined_names.add(schema.fullname)
+        tree = selections.get(schema.fullname, _ALL_FIELDS)
+        fields = []
+        for field in schema.fields:
+            if tree is not _ALL_FIELDS and field.name not in tree:
+                continue
+            ## Attributes like "default", "doc", "order" and "aliases"
+            ## are copied as they are
+            field_json = dict(field.props)
+            field_json['type'] = _project(field.type, selections, 
+                defined_names)
+            fields.append(field_json)
+        ## Attributes like "doc" and "aliases" are copied as they are
+        record_json = dict((key, value) for key, value in schema.props.items()
+                           if key not in ['namespace', 'fields'])
+        ## The full name is used so that the namespace is preserved
+        record_json['name'] = schema.fullname
+        record_json['fields'] = fields
+        return record_json
+    elif schema.type in ['enum', 'fixed']:
+        if schema.fullname in defined_names:
+            return schema.fullname
+        defined_names.add(schema.fullname)
+        return schema.to_json(avro.schema.Names())
+    elif schema.type in ['union', 'error_union']:
+        return [_project(s, selections, defined_names)
+                for s in schema.schemas]
+    elif schema.type == 'array':
+        return {'type': 'array',
+                'items': _project(schema.items, selections, defined_names)}
+    elif schema.type == 'map':
+        return {'type': 'map',
+                'values': _project(schema.values, selections, defined_names)}
+    else:
+        return schema.to_json()
@@ -15,34 +15,6 @@
 import sys
 from collections import namedtuple
 
-from avroknife.error import error
-
-class EqualitySelection:
-    """Specification of a desired value assigned to a key"
-    
-    The key can be nested, e.g. 'opt1.opt2'.
-    """
-    def __init__(self, string_):
-        """
-        Args:
-            string_: a string in a form of "opt1.opt2=val"
-        """
-        key, value = string_.split('=')
-        self.__key = key
-        self.__value = value
-    
-    def get_key_parts(self):
-        """Returns:
-            a list of all nesting components of the key
-        """
-        return self.__key.split('.')
-    
-    def get_value(self):
-        """Returns:
-            value assigned to the key
-        """
-        return self.__value
-
 class PositionWrtRange(object):
     SMALLER = 1
     INSIDE = 2
@@ -96,6 +68,32 @@ class Range:
             else:
                 return PositionWrtRange.INSIDE
 
+    def get_bounds(self):
+        """Returns:
+            pair (first, last) of the smallest and the largest index inside
+            the range. The `last` element is None if the range is unbounded
+            from above. Negative indexes are not considered.
+        """
+        first = 0
+        if self.range_[0] is not None:
+            first = self.range_[0]
+        return (first, self.range_[1])
+
+    def count_inside(self, number_of_elements):
+        """
+        Args:
+            number_of_elements: number of consecutive indexes, starting 
+                from 0, to be considered.
+        Returns:
+            number of these indexes that are inside the range
+        """
+        first, last = self.get_bounds()
+        if last is None:
+            last = number_of_elements - 1
+        else:
+            last = min(last, number_of_elements - 1)
+        return max(0, last - first + 1)
+
 Record = namedtuple('Record', ['index', 'content'], verbose=False)
 
 class RecordSelector:
@@ -107,8 +105,8 @@ class RecordSelector:
         Args:
             range_: a Range object. It defines range of accepted record 
                 indexes.
-            selection: an EqualitySelection object. It defines values of
-                accepted properties of records.
+            selection: a Selection object. It defines the condition
+                accepted records have to fulfill.
             limit: specifies that only this number of records matching all other 
                 constraints should be returned.
         """
@@ -123,72 +121,106 @@ class RecordSelector:
         self.__limit = limit
 
     @staticmethod
-    def __records_in_range(data_store, range_):
+    def __records_in_range(data_store, range_, as_json, selection):
         """
         Generates records in the specified range from the given data store
     
         Args:
             data_store: a DataStore object with records
             range_: a Range object specifying the desired records
+            as_json: if True, contents of records are JSON strings
+            selection: a Selection object or None. If given, only records
+                fulfilling its condition are generated.
         Returns:
             records from the given range
         """
-        for index, content in enumerate(data_store):
-            position = range_.get_position(index)
-            if position == PositionWrtRange.SMALLER:
-                pass
-            elif position == PositionWrtRange.INSIDE:
-                yield Record(index, content)
-            else: ## position == PositionWrtRange.LARGER:
-                raise StopIteration
+        first, last = range_.get_bounds()
+        for index, content in data_store.iter_records(first, last, as_json,
+                selection):
+            yield Record(index, content)
 
 
-    @staticmethod
-    def __record_fulfills_condition(record, selection):
-        """Checks whether a field in Avro records fulfills a condition
-    
+    def depends_on_content(self):
+        """Returns:
+            True if selecting records requires looking at their contents
+        """
+        return self.__selection is not None
+
+    def count_records(self, number_of_records):
+        """Counts records that would be selected without accessing them.
+
+        This can be used only if the selection does not depend on the
+        contents of the records.
+
         Args:
-            record: an Avro record as a Python dictionary
-            selection: an EqualitySelection object (optional)
+            number_of_records: number of all records in the data store
         Returns:
-            True if a record fulfill the condition
-            False otherwise
+            number of selected records
         """
-        if selection is None:
-            return True
-    
-        key_parts = selection.get_key_parts()
-        value = selection.get_value()
-    
-        content = record.content
-        try:
-            for key_part in key_parts:
-                content = content[key_part]
-        except KeyError:
-            error("Specified key not found in the schema: {}"\
-                    .format(".".join(key_parts)))
-            raise
-    
-        if content is None and value=="null":
-            return True
-        if unicode(content) == unicode(value):
-            return True
-        else:
-            return False
+        assert not self.depends_on_content()
+        return max(0, min(self.__range.count_inside(number_of_records), 
+                          self.__limit))
     
-    def get_records(self, data_store):
+    def get_records(self, data_store, as_json=False):
         """
         Args:
             data_store: a DataStore object with records
+            as_json: if True, contents of the records are given as JSON
+                strings. This can be used only if the selection does not
+                depend on the contents of the records.
         Returns:
             Record objects.
         """
-        records = self.__records_in_range(data_store, self.__range)
+        assert not (as_json and self.depends_on_content())
+        ## The records are selected by the data store while decoding them
+        records = self.__records_in_range(data_store, self.__range, as_json,
+            self.__selection)
         count = 0
         for record in records:
             if count < self.__limit:
-                if self.__record_fulfills_condition(record, self.__selection):
-                    count = count+1
-                    yield record
+                count = count+1
+                yield record
             else:
                 raise StopIteration
+
+    def get_selection(self):
+        return self.__selection
+
+    def get_limit(self):
+        """Returns:
+            maximum number of selected records or None if it is unlimited
+        """
+        if self.__limit == sys.maxint:
+            return None
+        return self.__limit
+
+    def get_block_ranges(self, data_store):
+        """Generates the ranges of indexes of the selected records in each 
+        Avro data block.
+
+        Only the headers of the blocks are read. If a selection is given,
+        the ranges include the records which don't fulfill its condition,
+        and the limit is not taken into account, since this requires 
+        decoding the records.
+
+        Args:
+            data_store: a DataStore object with records
+        Returns:
+            tuples (reference, first, last), where `reference` is 
+            a data_store.BlockReference object and `first` and `last` are
+            the indexes of the first and the last record of the range.
+        """
+        first, last = self.__range.get_bounds()
+        if self.__selection is None:
+            if self.__limit <= 0:
+                return
+            if last is None or last - first + 1 > self.__limit:
+                last = first + self.__limit - 1
+        for reference in data_store.get_block_references(first, last, 
+                self.__selection):
+            block_first = max(first, reference.index)
+            block_last = reference.index + reference.info.count - 1
+            if last is not None:
+                block_last = min(last, block_last)
+            if block_first <= block_last:
+                yield (reference, block_first, block_last)
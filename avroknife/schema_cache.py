@@ -0,0 +1,135 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import errno
+import hashlib
+import json
+import tempfile
+
+## Environment variable which can be used to override the location of
+## the cache
+CACHE_DIR_VARIABLE = 'AVROKNIFE_CACHE_DIR'
+
+def get_default_cache_dir():
+    """Returns:
+        path to the local directory where avroknife caches data
+    """
+    cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+    if cache_dir:
+        return cache_dir
+    base_dir = os.environ.get('XDG_CACHE_HOME')
+    if not base_dir:
+        base_dir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'avroknife')
+
+class SchemaCache:
+    """Persistent cache of schemas of Avro files.
+
+    The cache is kept in a local directory, one file per Avro file. Each entry
+    holds the size and the modification time of the Avro file it was created
+    for, so it is ignored once the file changes. Thanks to the cache, the
+    header of an Avro file residing in a remote file system doesn't have to
+    be fetched again.
+
+    The schemas are stored as JSON strings. Storing parsed schema objects
+    would change the order of the keys of their properties, and thus 
+    the way they are printed.
+    """
+
+    __version = 1
+
+    def __init__(self, cache_dir=None):
+        """
+        Args:
+            cache_dir: path to the local directory with the cache.
+                If None, the directory given by `get_default_cache_dir`
+                is used. It is created when the first entry is saved.
+        """
+        if cache_dir is None:
+            cache_dir = get_default_cache_dir()
+        self.__dir = os.path.join(cache_dir, 'schemas')
+
+    def get(self, path, status):
+        """Returns the cached schema of a file
+
+        Args:
+            path: a FileSystemPath object of the Avro file
+            status: the current FileInfo or FileStatus object of the file
+        Returns:
+            the schema as a JSON string or None if there is no up-to-date
+            entry for the file
+        """
+        try:
+            with open(self.__get_entry_path(path), 'r') as f:
+                entry = json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('version') != self.__version or \
+                entry.get('path') != self.__get_key(path) or \
+                entry.get('size') != status.size or \
+                entry.get('modification_time') != status.modification_time:
+            return None
+        return entry.get('schema')
+
+    def put(self, path, status, schema_json):
+        """Stores the schema of a file in the cache
+
+        The entry is written to a temporary file first and then renamed,
+        so concurrent readers never see a partially written entry.
+
+        Args:
+            path: a FileSystemPath object of the Avro file
+            status: the FileInfo or FileStatus object of the file 
+                the schema was read from
+            schema_json: the schema as a JSON string
+        Raises:
+            IOError, OSError: if the entry could not be saved
+        """
+        try:
+            os.makedirs(self.__dir)
+        except OSError as ex:
+            if not (ex.errno == errno.EEXIST and os.path.isdir(self.__dir)):
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=self.__dir, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps({'version': self.__version,
+                                    'path': self.__get_key(path),
+                                    'size': status.size,
+                                    'modification_time': 
+                                        status.modification_time,
+                                    'schema': schema_json}))
+            os.rename(tmp_path, self.__get_entry_path(path))
+        except:
+            os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def __get_key(path):
+        """Returns:
+            unicode string identifying the file
+        """
+        ## Local and HDFS paths may look the same
+        name = path.__class__.__name__
+        try:
+            key = '{}:{}'.format(name, path)
+        except UnicodeEncodeError:
+            ## Unicode path containing non-ASCII characters
+            return u'{}:{}'.format(name, path)
+        return key.decode('utf-8', 'replace')
+
+    def __get_entry_path(self, path):
+        name = hashlib.sha1(self.__get_key(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.__dir, name)
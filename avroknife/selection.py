@@ -0,0 +1,731 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Conditions on the values of fields of records.
+
+A condition is written in a small language resembling the WHERE clause
+of SQL, e.g.
+
+    position >= 10 AND position < 20 AND NOT (name IN ('Ben', 'Alyssa'))
+    favorite_color IS NULL OR favorite_color LIKE 'bl%'
+    sub.level2 = 2
+
+The grammar is as follows (keywords are case-insensitive):
+
+    condition := conjunction (OR conjunction)*
+    conjunction := negation (AND negation)*
+    negation := NOT negation | '(' condition ')' | FIELD predicate
+    predicate := OPERATOR value
+        | [NOT] IN '(' value (',' value)* ')'
+        | [NOT] LIKE value
+        | [NOT] REGEXP value
+        | IS [NOT] NULL
+    OPERATOR := '=' | '==' | '!=' | '<>' | '<' | '<=' | '>' | '>='
+    value := NULL | quoted string | unquoted word
+
+Fields are given by their names, nested fields with names joined with dots.
+A value is interpreted according to the type of the field it is compared
+with, so unquoted words can be numbers, booleans ("true", "false"), strings
+or enum symbols. In LIKE patterns, "%" matches any sequence of characters
+and "_" matches a single character; REGEXP matches if a part of the value
+matches the regular expression.
+
+A null value is equal only to NULL and it doesn't match any ordering
+comparison, LIKE or REGEXP predicate. NOT negates the result, so, e.g.,
+"a != 1" is true when "a" is null. As in the former "FIELD=VALUE" form of 
+the selection, a field which can hold strings is also equal to NULL if it
+holds the "null" string; "IS NULL" matches only null values.
+
+A field whose type is a union of several non-null types is compared with
+the value converted to the type of the value held by the field, e.g., 
+"a = 1" matches both the number 1 and the "1" string. Values of types
+the given value can't be converted to are not equal to it. In such unions,
+enum symbols are ordered as strings.
+
+For compatibility with the former "FIELD=VALUE" form of the selection,
+a string which is not a valid condition, but consists of a field name
+followed by a single "=", is treated as a comparison with the rest of
+the string, e.g., "name=Ben Smith" or "favorite_color=".
+
+The condition is checked against the schema of the records once and
+compiled into a Python function. The function compares the decoded values
+directly with values of corresponding types, without converting them
+to strings.
+"""
+
+import re
+import operator
+from collections import namedtuple
+
+class InvalidSelectionException(Exception):
+    pass
+
+## Nodes of the syntax tree of a condition
+_Or = namedtuple('_Or', ['operands'], verbose=False)
+_And = namedtuple('_And', ['operands'], verbose=False)
+_Not = namedtuple('_Not', ['operand'], verbose=False)
+## `operator` - one of the comparison operators, 'in', 'like' or 'regexp';
+## `value` - a _Value object or, for the 'in' operator, a list of them.
+_Predicate = namedtuple('_Predicate', ['field_name', 'operator', 'value'],
+    verbose=False)
+## `kind` - 'null', 'string' (quoted) or 'word' (unquoted). The `text` of 
+## a null value is None in case of "IS [NOT] NULL" predicates.
+_Value = namedtuple('_Value', ['kind', 'text'], verbose=False)
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<operator>==|!=|<>|<=|>=|=|<|>)
+      | (?P<punctuation>[(),])
+      | (?P<word>[^\s()=<>!,'"]+)
+    )""", re.VERBOSE | re.DOTALL)
+
+_STRING_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+_LEGACY_RE = re.compile(r'^\s*([^\s()=<>!,\'"]+)\s*=([^=]*)$', re.DOTALL)
+
+_COMPARISON_OPERATORS = {'=': '=', '==': '=', '!=': '!=', '<>': '!=',
+                         '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+_KEYWORDS = set(['AND', 'OR', 'NOT', 'IN', 'LIKE', 'REGEXP', 'IS', 'NULL'])
+
+def _tokenize(string_):
+    """Returns:
+        list of pairs (token type, text), where the type is one of
+        'string', 'operator', 'punctuation', 'word' or 'keyword'
+    """
+    tokens = []
+    position = 0
+    string_ = string_.rstrip()
+    while position < len(string_):
+        match = _TOKEN_RE.match(string_, position)
+        if match is None:
+            raise InvalidSelectionException(
+                'unexpected character at position {}: {}'.format(
+                    position, string_[position:]))
+        type_ = match.lastgroup
+        text = match.group(type_)
+        if type_ == 'word' and text.upper() in _KEYWORDS:
+            type_ = 'keyword'
+            text = text.upper()
+        tokens.append((type_, text))
+        position = match.end()
+    return tokens
+
+class _Parser:
+    """Recursive descent parser of conditions"""
+
+    def __init__(self, string_):
+        self.__tokens = _tokenize(string_)
+        self.__position = 0
+
+    def parse(self):
+        condition = self.__parse_condition()
+        if self.__peek() is not None:
+            raise InvalidSelectionException(
+                'unexpected "{}"'.format(self.__peek()[1]))
+        return condition
+
+    def __peek(self):
+        if self.__position < len(self.__tokens):
+            return self.__tokens[self.__position]
+        return None
+
+    def __next(self, description):
+        token = self.__peek()
+        if token is None:
+            raise InvalidSelectionException(
+                'unexpected end of the condition, expected {}'.format(
+                    description))
+        self.__position = self.__position + 1
+        return token
+
+    def __accept(self, type_, text):
+        if self.__peek() == (type_, text):
+            self.__position = self.__position + 1
+            return True
+        return False
+
+    def __expect(self, type_, text):
+        token = self.__next('"{}"'.format(text))
+        if token != (type_, text):
+            raise InvalidSelectionException(
+                'expected "{}" instead of "{}"'.format(text, token[1]))
+
+    def __parse_condition(self):
+        operands = [self.__parse_conjunction()]
+        while self.__accept('keyword', 'OR'):
+            operands.append(self.__parse_conjunction())
+        if len(operands) == 1:
+            return operands[0]
+        return _Or(operands)
+
+    def __parse_conjunction(self):
+        operands = [self.__parse_negation()]
+        while self.__accept('keyword', 'AND'):
+            operands.append(self.__parse_negation())
+        if len(operands) == 1:
+            return operands[0]
+        return _And(operands)
+
+    def __parse_negation(self):
+        if self.__accept('keyword', 'NOT'):
+            return _Not(self.__parse_negation())
+        if self.__accept('punctuation', '('):
+            condition = self.__parse_condition()
+            self.__expect('punctuation', ')')
+            return condition
+        type_, text = self.__next('a field name')
+        if type_ != 'word':
+            raise InvalidSelectionException(
+                'expected a field name instead of "{}"'.format(text))
+        return self.__parse_predicate(text)
+
+    def __parse_predicate(self, field_name):
+        type_, text = self.__next('an operator')
+        if type_ == 'operator':
+            return _Predicate(field_name, _COMPARISON_OPERATORS[text],
+                self.__parse_value())
+        if (type_, text) == ('keyword', 'IS'):
+            negated = self.__accept('keyword', 'NOT')
+            self.__expect('keyword', 'NULL')
+            predicate = _Predicate(field_name, '=', _Value('null', None))
+            return _Not(predicate) if negated else predicate
+        negated = False
+        if (type_, text) == ('keyword', 'NOT'):
+            negated = True
+            type_, text = self.__next('"IN", "LIKE" or "REGEXP"')
+        if (type_, text) == ('keyword', 'IN'):
+            self.__expect('punctuation', '(')
+            values = [self.__parse_value()]
+            while self.__accept('punctuation', ','):
+                values.append(self.__parse_value())
+            self.__expect('punctuation', ')')
+            predicate = _Predicate(field_name, 'in', values)
+        elif (type_, text) in [('keyword', 'LIKE'), ('keyword', 'REGEXP')]:
+            predicate = _Predicate(field_name, text.lower(),
+                self.__parse_value())
+        else:
+            raise InvalidSelectionException(
+                'expected an operator after "{}" instead of "{}"'.format(
+                    field_name, text))
+        return _Not(predicate) if negated else predicate
+
+    def __parse_value(self):
+        type_, text = self.__next('a value')
+        if type_ == 'string':
+            return _Value('string',
+                _STRING_ESCAPE_RE.sub(lambda m: m.group(1), text[1:-1]))
+        elif type_ == 'word':
+            return _Value('word', text)
+        elif (type_, text) == ('keyword', 'NULL'):
+            return _Value('null', 'null')
+        raise InvalidSelectionException(
+            'expected a value instead of "{}"'.format(text))
+
+def _parse(string_):
+    try:
+        return _Parser(string_).parse()
+    except InvalidSelectionException:
+        match = _LEGACY_RE.match(string_)
+        if match is None:
+            raise
+        field_name, value = match.groups()
+        if value.strip().upper() == 'NULL':
+            return _Predicate(field_name, '=', _Value('null', 'null'))
+        return _Predicate(field_name, '=', _Value('word', value))
+
+class Selection:
+    """Condition on the values of fields of records.
+
+    See the module documentation for the syntax of conditions.
+    """
+
+    def __init__(self, string_):
+        """
+        Args:
+            string_: the condition, e.g. "opt1.opt2=val" or
+                "a >= 10 AND b IS NOT NULL"
+        Raises:
+            InvalidSelectionException: if the condition is not valid
+        """
+        if isinstance(string_, unicode):
+            string_ = string_.encode('utf-8')
+        self.__string = string_
+        self.__condition = _parse(string_)
+
+    def get_field_names(self):
+        """Returns:
+            list of names of the fields the selection depends on
+        """
+        names = []
+        _collect_field_names(self.__condition, names)
+        return names
+
+    def compile(self, schema):
+        """Checks the condition against the schema of records and converts
+        it into a function.
+
+        Args:
+            schema: an avro.schema.RecordSchema object
+        Returns:
+            a function taking a record decoded as a Python dictionary and
+            returning True if the record fulfills the condition
+        Raises:
+            InvalidSelectionException: if the condition refers to fields
+                missing from the schema or compares them with values of
+                incompatible types
+        """
+        return _compile(self.__condition, schema)
+
+    def compile_statistics_check(self, schema):
+        """Converts the condition into a function telling whether a group
+        of records, e.g. an Avro block, can contain a record fulfilling it.
+
+        Args:
+            schema: an avro.schema.RecordSchema object
+        Returns:
+            a function taking a dictionary which maps names of fields to 
+            objects describing the values of these fields in the group 
+            (see `block_stats.FieldStatistics`). The function returns False
+            only if no record of the group can fulfill the condition. 
+            Fields missing from the dictionary can have any values.
+        Raises:
+            InvalidSelectionException: see `compile`
+        """
+        return _compile_check(self.__condition, schema)
+
+    def __str__(self):
+        return self.__string
+
+def _collect_field_names(condition, names):
+    if isinstance(condition, (_Or, _And)):
+        for operand in condition.operands:
+            _collect_field_names(operand, names)
+    elif isinstance(condition, _Not):
+        _collect_field_names(condition.operand, names)
+    elif condition.field_name not in names:
+        names.append(condition.field_name)
+
+def _compile(condition, schema):
+    if isinstance(condition, _Or):
+        return _compile_any([_compile(c, schema) for c in condition.operands])
+    elif isinstance(condition, _And):
+        return _compile_all([_compile(c, schema) for c in condition.operands])
+    elif isinstance(condition, _Not):
+        predicate = _compile(condition.operand, schema)
+        return lambda record: not predicate(record)
+    else:
+        return _compile_predicate(condition, schema)
+
+def _compile_check(condition, schema):
+    """Compiles the condition into a function checking statistics of
+    values of fields (see `Selection.compile_statistics_check`)"""
+    if isinstance(condition, _Or):
+        checks = [_compile_check(c, schema) for c in condition.operands]
+        return lambda statistics: any(c(statistics) for c in checks)
+    elif isinstance(condition, _And):
+        checks = [_compile_check(c, schema) for c in condition.operands]
+        return lambda statistics: all(c(statistics) for c in checks)
+    elif isinstance(condition, _Not):
+        operand = condition.operand
+        if isinstance(operand, _Predicate) and operand.operator == '=' and \
+                operand.value.kind == 'null':
+            ## "IS NOT NULL"
+            resolve_field(schema, operand.field_name)
+            return _compile_field_check(operand.field_name,
+                lambda stats: stats.has_values)
+        ## The negation of a condition which might be fulfilled can be 
+        ## fulfilled as well, so nothing is known in general
+        _compile(condition, schema)
+        return lambda statistics: True
+    else:
+        return _compile_predicate_check(condition, schema)
+
+def _compile_field_check(field_name, check):
+    def check_field(statistics):
+        stats = statistics.get(field_name)
+        return stats is None or check(stats)
+    return check_field
+
+def _may_be_equal(stats, value):
+    if value is None:
+        return stats.has_null
+    if not stats.has_values:
+        return False
+    if stats.min is not None and not (stats.min <= value <= stats.max):
+        return False
+    return stats.may_contain(value)
+
+def _compile_predicate_check(predicate, schema):
+    ## Compiling the predicate validates it against the schema
+    _compile_predicate(predicate, schema)
+    field_name = predicate.field_name
+    type_, _ = resolve_field(schema, field_name)
+    op = predicate.operator
+    if type_.type == 'union':
+        ## Statistics are not collected for such fields
+        return lambda statistics: True
+    if op in ['like', 'regexp']:
+        return _compile_field_check(field_name, 
+            lambda stats: stats.has_values)
+    if op == 'in':
+        values = _convert_values(predicate.value, type_, field_name)
+    else:
+        value = _convert_value(predicate.value, type_, field_name)
+        if op == '=' and _is_null_string(predicate.value, type_):
+            values = _NULL_VALUES
+            op = 'in'
+        elif op not in ['=', '!='] and type_.type == 'enum':
+            compare = _OPERATOR_FUNCTIONS[op]
+            index = type_.symbols.index(value)
+            values = frozenset(s for i, s in enumerate(type_.symbols)
+                               if compare(i, index))
+            op = 'in'
+    if op == 'in':
+        check = lambda stats: any(_may_be_equal(stats, v) for v in values)
+    elif op == '=':
+        check = lambda stats: _may_be_equal(stats, value)
+    elif op == '!=':
+        if value is None:
+            check = lambda stats: stats.has_values
+        else:
+            check = lambda stats: stats.has_null or stats.min is None or \
+                not (stats.min == value == stats.max)
+    else:
+        ## Null values don't fulfill ordering comparisons
+        if op == '<':
+            compare = lambda stats: stats.min < value
+        elif op == '<=':
+            compare = lambda stats: stats.min <= value
+        elif op == '>':
+            compare = lambda stats: stats.max > value
+        else:
+            compare = lambda stats: stats.max >= value
+        check = lambda stats: stats.has_values and \
+            (stats.min is None or compare(stats))
+    return _compile_field_check(field_name, check)
+
+def _compile_any(predicates):
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda record: first(record) or second(record)
+    return lambda record: any(p(record) for p in predicates)
+
+def _compile_all(predicates):
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda record: first(record) and second(record)
+    return lambda record: all(p(record) for p in predicates)
+
+def _get_non_null_type(schema):
+    """Returns:
+        pair (type, nullable) where `type` is the given schema or, in case of
+        a union with a single non-null type, this type
+    """
+    if schema.type != 'union':
+        return (schema, schema.type == 'null')
+    types = [s for s in schema.schemas if s.type != 'null']
+    nullable = len(types) < len(schema.schemas)
+    if len(types) != 1:
+        return (schema, nullable)
+    return (types[0], nullable)
+
+def resolve_field(schema, field_name):
+    """Finds the type of a possibly nested field
+
+    Args:
+        schema: an avro.schema.RecordSchema object
+        field_name: name of the field, e.g. 'a' or 'a.b'
+    Returns:
+        pair (type, nullable), where `type` is the schema of the field 
+        (or its only non-null type in case of a union) and `nullable` is 
+        True if the value of the field, or of any of the records containing 
+        it, can be null
+    Raises:
+        InvalidSelectionException: the field is not defined in the schema
+    """
+    nullable = False
+    type_ = schema
+    for part in field_name.split('.'):
+        if type_.type not in ['record', 'error'] or \
+                part not in type_.fields_dict:
+            raise InvalidSelectionException(
+                'field "{}" is not defined in the schema'.format(field_name))
+        type_, nullable_part = _get_non_null_type(
+            type_.fields_dict[part].type)
+        nullable = nullable or nullable_part
+    return (type_, nullable)
+
+def create_field_getter(field_name):
+    """Returns:
+        a function extracting the value of a possibly nested field from 
+        a decoded record. The value is None if any of the records 
+        containing the field is null.
+    """
+    parts = field_name.split('.')
+    if len(parts) == 1:
+        return operator.itemgetter(parts[0])
+    def get_nested(record):
+        for part in parts:
+            if record is None:
+                return None
+            record = record[part]
+        return record
+    return get_nested
+
+_OPERATOR_FUNCTIONS = {'=': operator.eq, '!=': operator.ne,
+                       '<': operator.lt, '<=': operator.le,
+                       '>': operator.gt, '>=': operator.ge}
+
+## Values equal to NULL in case of fields holding strings
+_NULL_VALUES = frozenset([None, u'null'])
+
+def _is_null_string(value, type_):
+    """Tells whether the value is NULL given in a comparison with a field
+    which can hold strings; such a NULL is also equal to the "null" string"""
+    if value.kind != 'null' or value.text is None:
+        return False
+    if type_.type == 'union':
+        return any(s.type == 'string' for s in type_.schemas)
+    return type_.type == 'string'
+
+def _convert_values(values, type_, field_name):
+    """Converts values given in the condition to a set of values of 
+    the type of the field they are compared with"""
+    converted = set(_convert_value(v, type_, field_name) for v in values)
+    if any(_is_null_string(v, type_) for v in values):
+        converted.update(_NULL_VALUES)
+    return frozenset(converted)
+
+def _convert_value(value, type_, field_name):
+    """Converts a value given in the condition to the type of the values
+    of the field it is compared with"""
+    if value.kind == 'null':
+        return None
+    def fail(expected):
+        raise InvalidSelectionException(
+            'field "{}" is compared with "{}", which is not {}'.format(
+                field_name, value.text, expected))
+    if type_.type in ['int', 'long', 'float', 'double']:
+        if value.kind != 'word':
+            fail('a number')
+        try:
+            number = int(value.text)
+        except ValueError:
+            try:
+                number = float(value.text)
+            except ValueError:
+                fail('a number')
+        if type_.type in ['float', 'double']:
+            number = float(number)
+        return number
+    elif type_.type == 'boolean':
+        if value.kind != 'word' or value.text.lower() not in ['true', 'false']:
+            fail('a boolean value')
+        return value.text.lower() == 'true'
+    elif type_.type == 'string':
+        return _decode_utf8(value.text)
+    elif type_.type in ['bytes', 'fixed']:
+        return value.text
+    elif type_.type == 'enum':
+        symbol = value.text
+        if symbol not in type_.symbols:
+            fail('one of the symbols of the enum ({})'.format(
+                ', '.join(type_.symbols)))
+        return symbol
+    elif type_.type == 'null':
+        fail('null')
+    raise InvalidSelectionException(
+        'field "{}" of type "{}" cannot be compared with values'.format(
+            field_name, type_.type))
+
+def _decode_utf8(text):
+    try:
+        return text.decode('utf-8')
+    except UnicodeDecodeError:
+        raise InvalidSelectionException(
+            '"{}" is not a valid UTF-8 string'.format(text))
+
+def _like_to_regex(pattern):
+    parts = []
+    for c in pattern:
+        if c == '%':
+            parts.append('.*')
+        elif c == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(c))
+    return ''.join(parts) + r'\Z'
+
+def _compile_pattern(predicate, decode):
+    if predicate.value.kind == 'null':
+        raise InvalidSelectionException('NULL cannot be used as a pattern')
+    pattern = predicate.value.text
+    if decode:
+        pattern = _decode_utf8(pattern)
+    try:
+        if predicate.operator == 'like':
+            return re.compile(_like_to_regex(pattern), re.DOTALL).match
+        else:
+            return re.compile(pattern).search
+    except re.error as ex:
+        raise InvalidSelectionException(
+            'invalid pattern "{}": {}'.format(predicate.value.text, ex))
+
+def _compile_predicate(predicate, schema):
+    field_name = predicate.field_name
+    type_, nullable = resolve_field(schema, field_name)
+    get = create_field_getter(field_name)
+    op = predicate.operator
+    if type_.type == 'union':
+        return _compile_union_predicate(predicate, type_, get)
+    if op == 'in':
+        values = _convert_values(predicate.value, type_, field_name)
+        return lambda record: get(record) in values
+    if op in ['like', 'regexp']:
+        if type_.type not in _TEXT_TYPES:
+            raise InvalidSelectionException(
+                'operator {} cannot be applied to field "{}" of type "{}"'\
+                    .format(op.upper(), field_name, type_.type))
+        match = _compile_pattern(predicate, type_.type == 'string')
+        if nullable:
+            def match_nullable(record):
+                value = get(record)
+                return value is not None and match(value) is not None
+            return match_nullable
+        return lambda record: match(get(record)) is not None
+    value = _convert_value(predicate.value, type_, field_name)
+    if value is None:
+        if op not in ['=', '!=']:
+            raise InvalidSelectionException(
+                'field "{}" is compared with NULL using "{}" operator; '\
+                    'only "=" and "!=" can be used'.format(field_name, op))
+        if _is_null_string(predicate.value, type_):
+            if op == '=':
+                return lambda record: get(record) in _NULL_VALUES
+            return lambda record: get(record) not in _NULL_VALUES
+        if op == '=':
+            return lambda record: get(record) is None
+        return lambda record: get(record) is not None
+    if op not in ['=', '!='] and type_.type == 'enum':
+        ## Enum symbols are ordered as in the schema, so an ordering
+        ## comparison is equivalent to checking membership in a set of them
+        compare = _OPERATOR_FUNCTIONS[op]
+        index = type_.symbols.index(value)
+        values = frozenset(s for i, s in enumerate(type_.symbols)
+                           if compare(i, index))
+        return lambda record: get(record) in values
+    compare = _OPERATOR_FUNCTIONS[op]
+    if nullable and op not in ['=', '!=']:
+        ## In Python 2, None is smaller than any value
+        def compare_nullable(record):
+            field_value = get(record)
+            return field_value is not None and compare(field_value, value)
+        return compare_nullable
+    return lambda record: compare(get(record), value)
+
+## Types of values which can be matched with LIKE and REGEXP patterns
+_TEXT_TYPES = ['string', 'bytes', 'fixed', 'enum']
+
+## Kinds of values of types which can be compared with values given in
+## the condition; values of types of the same kind are comparable
+_KINDS = {'boolean': 'boolean', 'int': 'number', 'long': 'number', 
+          'float': 'number', 'double': 'number', 'string': 'text', 
+          'bytes': 'text', 'fixed': 'text', 'enum': 'text'}
+
+def _get_kind(value):
+    """Returns:
+        kind of a decoded value (see `_KINDS`) or None if it is a value
+        of another type, e.g. null or a record
+    """
+    if isinstance(value, bool):
+        return 'boolean'
+    elif isinstance(value, (int, long, float)):
+        return 'number'
+    elif isinstance(value, basestring):
+        return 'text'
+    return None
+
+def _convert_union_value(value, type_, field_name):
+    """Converts a value given in the condition to the types of the branches
+    of a union
+
+    Returns:
+        list of pairs (kind, converted value)
+    """
+    if value.kind == 'null':
+        converted = [(None, None)]
+        if _is_null_string(value, type_):
+            converted.append(('text', u'null'))
+        return converted
+    converted = []
+    for branch in type_.schemas:
+        if branch.type not in _KINDS:
+            continue
+        try:
+            converted.append((_KINDS[branch.type], 
+                              _convert_value(value, branch, field_name)))
+        except InvalidSelectionException:
+            pass
+    if len(converted) == 0:
+        raise InvalidSelectionException(
+            'field "{}" is compared with "{}", which cannot be converted '\
+                'to any of the types of the field ({})'.format(field_name, 
+                    value.text, ', '.join(s.type for s in type_.schemas)))
+    return converted
+
+def _compile_union_predicate(predicate, type_, get):
+    """Compiles a predicate on a field whose type is a union of several
+    non-null types"""
+    field_name = predicate.field_name
+    op = predicate.operator
+    if op in ['like', 'regexp']:
+        branch_types = [s.type for s in type_.schemas]
+        if not any(t in _TEXT_TYPES for t in branch_types):
+            raise InvalidSelectionException(
+                'operator {} cannot be applied to field "{}" of type "{}"'\
+                    .format(op.upper(), field_name, type_.type))
+        match = _compile_pattern(predicate, 'string' in branch_types)
+        def match_union(record):
+            value = get(record)
+            return isinstance(value, basestring) and \
+                match(value) is not None
+        return match_union
+    values = predicate.value if op == 'in' else [predicate.value]
+    ## Dictionary mapping kinds of values to the values given in 
+    ## the condition converted to the types of this kind
+    converted = {}
+    for value in values:
+        for kind, converted_value in _convert_union_value(value, type_, 
+                field_name):
+            converted.setdefault(kind, []).append(converted_value)
+    if op in ['=', '!=', 'in']:
+        def equal(record):
+            value = get(record)
+            return value in converted.get(_get_kind(value), ())
+        if op == '!=':
+            return lambda record: not equal(record)
+        return equal
+    if predicate.value.kind == 'null':
+        raise InvalidSelectionException(
+            'field "{}" is compared with NULL using "{}" operator; '\
+                'only "=" and "!=" can be used'.format(field_name, op))
+    compare = _OPERATOR_FUNCTIONS[op]
+    def compare_union(record):
+        value = get(record)
+        converted_values = converted.get(_get_kind(value))
+        return converted_values is not None and \
+            compare(value, converted_values[0])
+    return compare_union
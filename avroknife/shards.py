@@ -0,0 +1,149 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Splitting of copied records into many output Avro files (shards).
+
+The shards are planned up front, using only the headers of the Avro data
+blocks, so the result doesn't depend on the number of processes writing
+them. Concatenating the shards in the order of their numbers gives the same
+records as writing all of them into a single file.
+"""
+
+import itertools
+
+import avro.schema
+from avro.io import DatumWriter
+
+from avroknife.container import ContainerWriter
+
+## Name of the output file if the records are not split
+SINGLE_FILE_NAME = 'content.avro'
+
+def get_shard_file_name(number):
+    return 'part-{:05d}.avro'.format(number)
+
+class Shard:
+    """Records to be written into a single output file
+
+    Attributes:
+        number: number of the shard, starting from 0
+        block_ranges: list of tuples (reference, first, last) as generated
+            by `record_selector.RecordSelector.get_block_ranges`
+    """
+    def __init__(self, number, block_ranges):
+        self.number = number
+        self.block_ranges = block_ranges
+
+def plan_shards(block_ranges, max_records_per_file=None,
+        max_bytes_per_file=None):
+    """Splits records into shards
+
+    Args:
+        block_ranges: tuples (reference, first, last) as generated by
+            `record_selector.RecordSelector.get_block_ranges`
+        max_records_per_file: maximum number of records in a shard.
+            The records are counted before a selection is applied, so
+            the shards contain fewer records if some of them are rejected.
+            The ranges of indexes are split if needed.
+        max_bytes_per_file: maximum size of data of the blocks of a shard,
+            as stored in the data store. A single block is never split, so
+            a shard can be larger if it consists of one such block only.
+    Returns:
+        list of Shard objects. There is always at least one, possibly empty,
+        shard.
+    """
+    shards = []
+    current = []
+    records_num = 0
+    bytes_num = 0
+    for reference, first, last in block_ranges:
+        while first <= last:
+            count = last - first + 1
+            if max_records_per_file is not None:
+                count = min(count, max_records_per_file - records_num)
+            size = reference.info.data_length * count // reference.info.count
+            if max_bytes_per_file is not None and len(current) > 0 and \
+                    bytes_num + size > max_bytes_per_file:
+                shards.append(Shard(len(shards), current))
+                current = []
+                records_num = 0
+                bytes_num = 0
+                continue
+            current.append((reference, first, first + count - 1))
+            records_num = records_num + count
+            bytes_num = bytes_num + size
+            first = first + count
+            if max_records_per_file is not None and \
+                    records_num >= max_records_per_file:
+                shards.append(Shard(len(shards), current))
+                current = []
+                records_num = 0
+                bytes_num = 0
+    if len(current) > 0 or len(shards) == 0:
+        shards.append(Shard(len(shards), current))
+    return shards
+
+def write_shard(data_store, shard, output_path, codec, selection=None,
+        limit=None, compression_level=None, compression_threads=0):
+    """Writes records of a shard to an Avro file
+
+    Data blocks whose records are all selected are copied without decoding
+    them, as long as they were written with the reader schema of the data
+    store.
+
+    Args:
+        data_store: a DataStore object the records come from
+        shard: a Shard object
+        output_path: a FileSystemPath object of the created file
+        codec: name of the codec of the created file
+        selection: a Selection object or None. If given, only the records
+            fulfilling its condition are written.
+        limit: maximum number of records to be written or None
+        compression_level: see `container.compress`
+        compression_threads: number of threads compressing the blocks
+    Returns:
+        a container.WriterStatistics object
+    """
+    schema = data_store.get_schema()
+    ## Results of comparing writer schemas with the reader schema
+    schema_matches = {}
+    written = 0
+    with output_path.open("w") as output:
+        with ContainerWriter(output, DatumWriter(), schema, codec, 
+                compression_level, compression_threads) as writer:
+            blocks = data_store.read_blocks(
+                reference for reference, _, _ in shard.block_ranges)
+            for block, (_, first, last) in \
+                    itertools.izip(blocks, shard.block_ranges):
+                if limit is not None and written >= limit:
+                    break
+                if selection is None and first == block.index and \
+                        last == block.index + block.count - 1 and \
+                        (limit is None or written + block.count <= limit):
+                    writers_schema_json = block.get_writers_schema_json()
+                    if writers_schema_json not in schema_matches:
+                        schema_matches[writers_schema_json] = \
+                            avro.schema.parse(writers_schema_json) == schema
+                    if schema_matches[writers_schema_json]:
+                        writer.write_raw_block(block.count,
+                            block.read_raw_data(), block.get_codec())
+                        written = written + block.count
+                        continue
+                for _, record in block.iter_records(first, last,
+                        selection=selection):
+                    if limit is not None and written >= limit:
+                        break
+                    writer.append(record)
+                    written = written + 1
+    return writer.statistics
@@ -0,0 +1,187 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os
+import os.path
+
+from avroknife.block_stats import BloomFilter, FieldStatistics, \
+    BlockStatistics
+from avroknife.container import read_header
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath, HDFSPath
+from avroknife.selection import Selection
+from avroknife.test import example_data_stores
+from avroknife.test.fake_hdfs import FakeHDFS
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom_filter = BloomFilter.create(1000)
+        for i in range(1000):
+            bloom_filter.add(str(i))
+        restored = BloomFilter.from_json(bloom_filter.to_json())
+        for i in range(1000):
+            self.assertTrue(restored.may_contain(str(i)))
+
+    def test_false_positive_rate(self):
+        bloom_filter = BloomFilter.create(1000)
+        for i in range(1000):
+            bloom_filter.add(str(i))
+        false_positives = sum(1 for i in range(1000, 11000)
+                              if bloom_filter.may_contain(str(i)))
+        self.assertLess(false_positives, 300)
+
+class FieldStatisticsTestCase(unittest.TestCase):
+    def test_collect(self):
+        stats = FieldStatistics.from_json(FieldStatistics.collect(
+            [u'b', None, u'a', u'c'], True).to_json())
+        self.assertEqual((u'a', u'c'), (stats.min, stats.max))
+        self.assertTrue(stats.has_null)
+        self.assertTrue(stats.has_values)
+        self.assertTrue(stats.may_contain(u'b'))
+        self.assertTrue(stats.may_contain('b'))
+
+    def test_numbers_of_different_types_are_equal(self):
+        stats = FieldStatistics.collect([1, 2.5], True)
+        self.assertTrue(stats.may_contain(1.0))
+        self.assertTrue(stats.may_contain(2.5))
+
+    def test_only_nulls(self):
+        stats = FieldStatistics.collect([None, None], True)
+        self.assertTrue(stats.has_null)
+        self.assertFalse(stats.has_values)
+        self.assertEqual((None, None), (stats.min, stats.max))
+
+class BlockStatisticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(self.__ds_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __get_positions(self, condition, jobs=1):
+        ds = DataStore(LocalPath(self.__ds_dir), jobs=jobs)
+        return [record['position'] for _, record in
+                ds.iter_records(selection=Selection(condition))]
+
+    def __get_block_checks(self, condition):
+        """Returns results of checking statistics of each block"""
+        ds = DataStore(LocalPath(self.__ds_dir))
+        schema = ds.get_schema()
+        block_statistics = ds.build_block_statistics(
+            ['position', 'name', 'favorite_color'])
+        check = Selection(condition).compile_statistics_check(schema)
+        results = []
+        for name in sorted(os.listdir(self.__ds_dir)):
+            if name.startswith('_'):
+                continue
+            path = LocalPath(os.path.join(self.__ds_dir, name))
+            file_stats = block_statistics.get_file_statistics(name,
+                path.get_status(), ['position', 'name', 'favorite_color'])
+            results.extend(
+                check(file_stats.get_block_statistics(offset))
+                for offset in sorted(file_stats.get_block_offsets()))
+        return results
+
+    def test_checks(self):
+        ## There are 5 blocks with 3 records each
+        for condition, expected in [
+                ('position = 4', [False, True, False, False, False]),
+                ('position > 10', [False, False, False, True, True]),
+                ('position <= 2 OR position = 14',
+                    [True, False, False, False, True]),
+                ('position IN (3, 9)', [False, True, False, True, False]),
+                ('name = "name7"', [False, False, True, False, False]),
+                ('position = 4 AND name = "name13"', [False] * 5),
+                ('NOT position = 4', [True] * 5),
+                ('favorite_color IS NULL', [True] * 5),
+                ('favorite_color IS NOT NULL', [False] * 5),
+                ('favorite_color = "red"', [False] * 5),
+                ('name LIKE "x%"', [True] * 5)]:
+            self.assertEqual(expected, self.__get_block_checks(condition),
+                condition)
+
+    def test_same_results_with_statistics(self):
+        conditions = ['position = 4', 'position > 11 OR name = "name1"',
+                      'favorite_number IN (30, 140)', 'position != 3']
+        expected = [self.__get_positions(c) for c in conditions]
+        DataStore(LocalPath(self.__ds_dir)).build_block_statistics(
+            ['position', 'name', 'favorite_number'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.__ds_dir, BlockStatistics.file_name)))
+        for jobs in [1, 3]:
+            self.assertEqual(expected,
+                [self.__get_positions(c, jobs) for c in conditions])
+
+    def test_files_are_skipped(self):
+        path = os.path.join(self.__ds_dir, 'part-m-00001.avro')
+        ## Modification times set with a whole number of seconds are 
+        ## restored exactly
+        os.utime(path, (1000000000, 1000000000))
+        DataStore(LocalPath(self.__ds_dir)).build_block_statistics(
+            ['position'])
+        ## Damage the blocks of the second file, keeping its size and
+        ## modification time, so the statistics still apply to it
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            header_end = read_header(f).end_offset
+            f.seek(header_end)
+            f.write('\xff' * (size - header_end))
+        os.utime(path, (1000000000, 1000000000))
+        self.assertEqual(range(9), self.__get_positions('position < 9'))
+        os.remove(os.path.join(self.__ds_dir, BlockStatistics.file_name))
+        self.assertRaises(Exception, self.__get_positions, 'position < 9')
+
+    def test_outdated_statistics_are_ignored(self):
+        DataStore(LocalPath(self.__ds_dir)).build_block_statistics(
+            ['position'])
+        path = os.path.join(self.__ds_dir, 'part-m-00001.avro')
+        os.rename(path, os.path.join(self.__ds_dir, 'part-m-00002.avro'))
+        example_data_stores.create_blocks(
+            os.path.join(self.__dir, 'blocks2'))
+        shutil.copy(os.path.join(self.__dir, 'blocks2', 'part-m-00000.avro'),
+            path)
+        self.assertEqual([4, 4], self.__get_positions('position = 4'))
+
+    def test_invalid_statistics_are_ignored(self):
+        stats_path = os.path.join(self.__ds_dir, BlockStatistics.file_name)
+        for content in ['not json', '[1, 2]', '"text"', '{"version": 1}',
+                        '{"version": 1, "field_types": {}, "files": [1]}']:
+            with open(stats_path, 'w') as f:
+                f.write(content)
+            self.assertIsNone(BlockStatistics.load(LocalPath(stats_path)), 
+                content)
+            self.assertEqual([4], self.__get_positions('position = 4'))
+
+    def test_hdfs_files_are_listed_once(self):
+        with FakeHDFS(os.path.join(self.__dir, 'hdfs')) as hdfs:
+            shutil.copytree(self.__ds_dir, 
+                os.path.join(self.__dir, 'hdfs', 'default_0', 'blocks'))
+            DataStore(HDFSPath('/blocks')).build_block_statistics(
+                ['position'])
+            ## The sizes and modification times of the files come 
+            ## from the listing of the data store directory
+            self.assertEqual(0, hdfs.calls['get_path_info'])
+            ds = DataStore(HDFSPath('/blocks'))
+            self.assertEqual([4], [record['position'] for _, record in 
+                ds.iter_records(selection=Selection('position = 4'))])
+            self.assertEqual(0, hdfs.calls['get_path_info'])
+
+    def test_unsupported_field(self):
+        ds = DataStore(LocalPath(self.__ds_dir))
+        self.assertRaises(ValueError, ds.build_block_statistics, ['unknown'])
@@ -0,0 +1,132 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+import avro.schema
+from avro.datafile import DataFileException
+from avro.io import DatumReader, DatumWriter
+
+from avroknife.container import ContainerReader, ContainerWriter, \
+    BufferDecoder, compress, decompress, decode_records, \
+    get_available_codecs, COMPRESSION_LEVELS
+from avroknife.test import example_data_stores
+
+class ContainerWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(self.__ds_dir)
+        schema_path = os.path.join(os.path.dirname(__file__), 'data/user.avsc')
+        self.__schema = avro.schema.parse(open(schema_path).read())
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __copy(self, codec, compression_level=None, threads=0):
+        """Copies blocks of the data store to a new file, appending
+        a record between them"""
+        output_path = os.path.join(self.__dir, 'copy.avro')
+        with ContainerWriter(open(output_path, 'wb'), DatumWriter(), 
+                self.__schema, codec, compression_level, threads) as writer:
+            for name in ['part-m-00000.avro', 'part-m-00001.avro']:
+                path = os.path.join(self.__ds_dir, name)
+                with ContainerReader(open(path, 'rb')) as reader:
+                    for block in reader.iter_block_infos():
+                        writer.write_raw_block(block.count, 
+                            reader.read_raw_block_data(block), 
+                            reader.get_codec())
+                writer.append(example_data_stores.create_blocks_record(100))
+        self.assertEqual(17, writer.statistics.records)
+        return output_path
+
+    def test_write_raw_block(self):
+        expected = range(9) + [100] + range(9, 15) + [100]
+        for codec, compression_level, threads in [
+                ('null', None, 0), ('deflate', None, 0), ('deflate', 1, 2), 
+                ('bzip2', 9, 3)]:
+            output_path = self.__copy(codec, compression_level, threads)
+            with ContainerReader(open(output_path, 'rb')) as reader:
+                self.assertEqual(codec, reader.get_codec())
+                datum_reader = DatumReader(avro.schema.parse(
+                    reader.get_schema_json()))
+                self.assertEqual(expected, [r['position'] 
+                    for block in reader.iter_block_infos() 
+                    for r in decode_records(reader.read_block_data(block), 
+                                            block.count, datum_reader)])
+            with ContainerReader(open(output_path, 'rb')) as reader:
+                self.assertEqual([3, 3, 3, 1, 3, 3, 1], 
+                    [b.count for b in reader.iter_block_infos()])
+
+    def test_compression_level_forces_recompression(self):
+        source_path = os.path.join(self.__dir, 'source.avro')
+        with ContainerWriter(open(source_path, 'wb'), DatumWriter(), 
+                self.__schema, 'deflate', 1) as writer:
+            for position in range(2000):
+                writer.append(
+                    example_data_stores.create_blocks_record(position % 50))
+        blocks = {}
+        for compression_level in [None, 1, 9]:
+            output_path = os.path.join(self.__dir, 'copy.avro')
+            with ContainerWriter(open(output_path, 'wb'), DatumWriter(), 
+                    self.__schema, 'deflate', compression_level) as writer:
+                with ContainerReader(open(source_path, 'rb')) as reader:
+                    for block in reader.iter_block_infos():
+                        writer.write_raw_block(block.count, 
+                            reader.read_raw_block_data(block), 'deflate')
+            if compression_level is None:
+                self.assertGreater(writer.statistics.copied_bytes, 0)
+            else:
+                self.assertEqual(0, writer.statistics.copied_bytes)
+            with ContainerReader(open(output_path, 'rb')) as reader:
+                blocks[compression_level] = [
+                    str(reader.read_raw_block_data(block)) 
+                    for block in reader.iter_block_infos()]
+        self.assertEqual(blocks[None], blocks[1])
+        self.assertNotEqual(blocks[1], blocks[9])
+
+    def test_compress(self):
+        data = 'abc' * 1000
+        for codec in get_available_codecs():
+            self.assertEqual(data, decompress(codec, compress(codec, data)))
+            for level in COMPRESSION_LEVELS.get(codec, []):
+                self.assertEqual(data, 
+                    decompress(codec, compress(codec, data, level)))
+
+    def test_builtin_codecs_are_available(self):
+        self.assertTrue(set(['null', 'deflate', 'bzip2']) <= 
+                        set(get_available_codecs()))
+
+class BufferDecoderTestCase(unittest.TestCase):
+    def test_read(self):
+        decoder = BufferDecoder('\x96\x01\x06abc\x01')
+        self.assertEqual(75, decoder.read_long())
+        self.assertEqual('abc', decoder.read_bytes())
+        decoder.skip_long()
+        self.assertRaises(DataFileException, decoder.read_long)
+
+    def test_truncated_data(self):
+        truncated = [('read_long', ['', '\x96', '\x96\x96']),
+                     ('skip_long', ['', '\x96', '\x96\x96']),
+                     ('read_bytes', ['', '\x96', '\x06ab']),
+                     ('read_utf8', ['', '\x06ab']),
+                     ('skip_bytes', ['', '\x06ab']),
+                     ('read_double', ['', '\x06ab'])]
+        for method, values in truncated:
+            for data in values:
+                decoder = BufferDecoder(data)
+                self.assertRaises(DataFileException, 
+                    getattr(decoder, method))
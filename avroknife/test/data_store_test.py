@@ -0,0 +1,83 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+
+from avroknife import data_store
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath
+from avroknife.selection import Selection
+from avroknife.test import example_data_stores
+
+class DataStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(self.__ds_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __get_positions(self, first, last, jobs, decompression_threads=0,
+            selection=None):
+        ds = DataStore(LocalPath(self.__ds_dir), jobs=jobs,
+            decompression_threads=decompression_threads)
+        return [(index, record['position']) for index, record in 
+                ds.iter_records(first, last, selection=selection)]
+
+    def test_parallel_decoding_preserves_order(self):
+        records_per_task = data_store._RECORDS_PER_DECODING_TASK
+        data_store._RECORDS_PER_DECODING_TASK = 2
+        try:
+            for first, last in [(0, None), (1, 13), (10, 10), (15, None)]:
+                self.assertEqual(self.__get_positions(first, last, 1),
+                                 self.__get_positions(first, last, 3))
+        finally:
+            data_store._RECORDS_PER_DECODING_TASK = records_per_task
+
+    def test_decompression_threads_preserve_order(self):
+        selection = Selection('position != 7')
+        for first, last in [(0, None), (1, 13), (10, 10), (15, None)]:
+            for threads in [1, 2]:
+                self.assertEqual(self.__get_positions(first, last, 1),
+                    self.__get_positions(first, last, 1, threads))
+                self.assertEqual(
+                    self.__get_positions(first, last, 1, 0, selection),
+                    self.__get_positions(first, last, 1, threads, selection))
+
+    def test_decompression_threads_stop_early(self):
+        ds = DataStore(LocalPath(self.__ds_dir), decompression_threads=2)
+        records = ds.iter_records()
+        self.assertEqual(0, next(records)[0])
+        records.close()
+
+    def test_selection(self):
+        selection = Selection(
+            'position >= 4 AND favorite_number IN (20, 40, 50, 80, 100, 120)')
+        for jobs, generic_decoder in [(1, False), (3, False), (1, True)]:
+            ds = DataStore(LocalPath(self.__ds_dir), jobs=jobs,
+                generic_decoder=generic_decoder)
+            self.assertEqual([(4, 4), (5, 5), (8, 8), (10, 10)], 
+                [(index, record['position']) for index, record in 
+                 ds.iter_records(2, 10, selection=selection)])
+
+    def test_parallel_decoding_stops_early(self):
+        ds = DataStore(LocalPath(self.__ds_dir), jobs=2)
+        records = ds.iter_records()
+        self.assertEqual(0, next(records)[0])
+        self.assertEqual(1, next(records)[0])
+        records.close()
@@ -0,0 +1,243 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import json
+from StringIO import StringIO
+
+import avro.schema
+from avro.io import BinaryEncoder, DatumWriter, SchemaResolutionException
+
+from avroknife.container import BufferDecoder
+from avroknife.data_store import _FieldsOrderPreservingDatumReader
+from avroknife.decoder import CompiledDatumReader, JSONTranscoder, REJECTED
+from avroknife.test.utils_test import legacy_dict_to_json
+
+_WRITERS_SCHEMA = {
+    'type': 'record', 'name': 'Node', 'namespace': 'avroknife.test',
+    'fields': [
+        {'name': 'id', 'type': 'int'},
+        {'name': 'name', 'type': ['null', 'string']},
+        {'name': 'ratio', 'type': 'float'},
+        {'name': 'flag', 'type': 'boolean'},
+        {'name': 'payload', 'type': 'bytes'},
+        {'name': 'hash', 'type': {'type': 'fixed', 'name': 'Hash', 'size': 4}},
+        {'name': 'color', 'type': {'type': 'enum', 'name': 'Color',
+            'symbols': ['RED', 'GREEN', 'BLUE']}},
+        {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+        {'name': 'weights', 'type': {'type': 'map', 'values': 'double'}},
+        {'name': 'children', 'type': {'type': 'array', 'items': 'Node'}},
+        {'name': 'ignored', 'type': {'type': 'map', 'values':
+            {'type': 'array', 'items': 'long'}}}]}
+
+def _create_node(id_, children):
+    return {'id': id_, 'name': None if id_ % 2 else u'n\u00f3de{}'.format(id_),
+            'ratio': 0.5 * id_, 'flag': id_ % 3 == 0, 'payload': '\x00\xff',
+            'hash': 'abcd', 'color': ['RED', 'GREEN', 'BLUE'][id_ % 3],
+            'tags': ['t{}'.format(i) for i in range(id_)],
+            'weights': {'w{}'.format(i): i / 3.0 for i in range(id_)},
+            'children': children,
+            'ignored': {'k': range(id_)}}
+
+def _encode(schema, records):
+    out = StringIO()
+    encoder = BinaryEncoder(out)
+    writer = DatumWriter(schema)
+    for record in records:
+        writer.write(record, encoder)
+    return out.getvalue()
+
+def _decode(datum_reader, data, count):
+    decoder = BufferDecoder(data)
+    return [datum_reader.read(decoder) for _ in range(count)]
+
+def _create_records():
+    return [_create_node(i, [_create_node(10 * i + j, [])
+                             for j in range(i % 3)])
+            for i in range(20)]
+
+class CompiledDatumReaderTestCase(unittest.TestCase):
+    def __encode(self, schema, records):
+        return _encode(schema, records)
+
+    def __decode(self, datum_reader, data, count):
+        return _decode(datum_reader, data, count)
+
+    def __check_same_as_generic(self, readers_schema_json, records):
+        writers_schema = avro.schema.parse(json.dumps(_WRITERS_SCHEMA))
+        readers_schema = avro.schema.parse(json.dumps(readers_schema_json))
+        data = self.__encode(writers_schema, records)
+        expected = self.__decode(_FieldsOrderPreservingDatumReader(
+            writers_schema, readers_schema), data, len(records))
+        actual = self.__decode(
+            CompiledDatumReader(writers_schema, readers_schema),
+            data, len(records))
+        self.assertEqual(expected, actual)
+        self.assertEqual([r.keys() for r in expected],
+                         [r.keys() for r in actual])
+        return actual
+
+    def __create_records(self):
+        return _create_records()
+
+    def test_same_schemas(self):
+        records = self.__check_same_as_generic(
+            _WRITERS_SCHEMA, self.__create_records())
+        self.assertEqual([f['name'] for f in _WRITERS_SCHEMA['fields']],
+            records[0].keys())
+
+    def test_schema_resolution(self):
+        readers_schema = {
+            'type': 'record', 'name': 'Node', 'namespace': 'avroknife.test',
+            'fields': [
+                {'name': 'color', 'type': {'type': 'enum', 'name': 'Color',
+                    'symbols': ['BLUE', 'GREEN', 'RED', 'BLACK']}},
+                {'name': 'id', 'type': 'double'},
+                {'name': 'name', 'type': ['null', 'string']},
+                {'name': 'ratio', 'type': ['null', 'double']},
+                {'name': 'children', 'type': {'type': 'array', 'items': 'Node'}},
+                {'name': 'extra', 'type': 'int', 'default': 7},
+                {'name': 'extra_list', 'type': {'type': 'array',
+                    'items': 'int'}, 'default': [1, 2]}]}
+        records = self.__check_same_as_generic(
+            readers_schema, self.__create_records())
+        records[0]['extra_list'].append(3)
+        self.assertEqual([1, 2], records[1]['extra_list'])
+
+    def test_missing_enum_symbol(self):
+        readers_schema = dict(_WRITERS_SCHEMA)
+        readers_schema['fields'] = [{'name': 'color', 'type': {'type': 'enum',
+            'name': 'Color', 'symbols': ['RED', 'GREEN']}}]
+        writers_schema = avro.schema.parse(json.dumps(_WRITERS_SCHEMA))
+        datum_reader = CompiledDatumReader(writers_schema,
+            avro.schema.parse(json.dumps(readers_schema)))
+        data = self.__encode(writers_schema, self.__create_records()[:3])
+        with self.assertRaises(SchemaResolutionException):
+            self.__decode(datum_reader, data, 3)
+
+    def test_missing_default_value(self):
+        readers_schema = dict(_WRITERS_SCHEMA)
+        readers_schema['fields'] = [{'name': 'other', 'type': 'int'}]
+        with self.assertRaises(SchemaResolutionException):
+            CompiledDatumReader(avro.schema.parse(json.dumps(_WRITERS_SCHEMA)),
+                avro.schema.parse(json.dumps(readers_schema)))
+
+    def test_negative_block_counts(self):
+        schema = avro.schema.parse(json.dumps(
+            {'type': 'record', 'name': 'R', 'fields': [
+                {'name': 'skipped', 'type': {'type': 'array', 'items': 'int'}},
+                {'name': 'items', 'type': {'type': 'array', 'items': 'int'}}]}))
+        readers_schema = avro.schema.parse(json.dumps(
+            {'type': 'record', 'name': 'R', 'fields': [
+                {'name': 'items', 'type': {'type': 'array', 'items': 'int'}}]}))
+        ## Blocks with negative counts followed by sizes in bytes:
+        ## [1, 2] and [3] + [4]
+        data = '\x03\x04\x02\x04\x00' + '\x01\x02\x06\x02\x08\x00'
+        for datum_reader in [
+                _FieldsOrderPreservingDatumReader(schema, readers_schema),
+                CompiledDatumReader(schema, readers_schema)]:
+            self.assertEqual([{'items': [3, 4]}],
+                             self.__decode(datum_reader, data, 1))
+
+class SelectiveReaderTestCase(unittest.TestCase):
+    def __check(self, readers_schema_json, predicate, field_names, 
+            decoded_fields):
+        writers_schema = avro.schema.parse(json.dumps(_WRITERS_SCHEMA))
+        readers_schema = avro.schema.parse(json.dumps(readers_schema_json))
+        records = _create_records()
+        data = _encode(writers_schema, records)
+        all_records = _decode(
+            CompiledDatumReader(writers_schema, readers_schema),
+            data, len(records))
+        seen_fields = set()
+        def checked_predicate(record):
+            seen_fields.update(record.keys())
+            return predicate(record)
+        selected = _decode(CompiledDatumReader(writers_schema, 
+            readers_schema, checked_predicate, field_names), 
+            data, len(records))
+        self.assertEqual(
+            [r if predicate(r) else REJECTED for r in all_records], selected)
+        self.assertTrue(any(r is REJECTED for r in selected))
+        self.assertEqual(set(decoded_fields), seen_fields)
+
+    def test_early_field(self):
+        self.__check(_WRITERS_SCHEMA, lambda r: r['name'] is None, 
+            ['name'], ['id', 'name'])
+
+    def test_nested_field(self):
+        self.__check(_WRITERS_SCHEMA, lambda r: len(r['children']) == 1,
+            ['children.id'], [f['name'] for f in _WRITERS_SCHEMA['fields']
+                              if f['name'] != 'ignored'])
+
+    def test_default_field(self):
+        readers_schema = dict(_WRITERS_SCHEMA)
+        readers_schema['fields'] = [
+            {'name': 'id', 'type': 'int'},
+            {'name': 'payload', 'type': 'bytes'},
+            {'name': 'extra', 'type': 'int', 'default': 7}]
+        self.__check(readers_schema, lambda r: r['extra'] == 7 and 
+            r['id'] % 2 == 0, ['extra', 'id'], ['id', 'payload', 'extra'])
+
+    def test_no_fields(self):
+        self.__check(_WRITERS_SCHEMA, lambda r: False, [], [])
+
+class JSONTranscoderTestCase(unittest.TestCase):
+    def __check_same_as_generic(self, writers_schema_json, readers_schema_json,
+            records):
+        writers_schema = avro.schema.parse(json.dumps(writers_schema_json))
+        readers_schema = avro.schema.parse(json.dumps(readers_schema_json))
+        data = _encode(writers_schema, records)
+        expected = [legacy_dict_to_json(r) for r in _decode(
+            _FieldsOrderPreservingDatumReader(writers_schema, readers_schema),
+            data, len(records))]
+        actual = _decode(JSONTranscoder(writers_schema, readers_schema),
+            data, len(records))
+        self.assertEqual(expected, actual)
+
+    def test_same_schemas(self):
+        self.__check_same_as_generic(_WRITERS_SCHEMA, _WRITERS_SCHEMA,
+            _create_records())
+
+    def test_schema_resolution(self):
+        readers_schema = {
+            'type': 'record', 'name': 'Node', 'namespace': 'avroknife.test',
+            'fields': [
+                {'name': 'hash', 'type': {'type': 'fixed', 'name': 'Hash', 
+                    'size': 4}},
+                {'name': 'id', 'type': 'long'},
+                {'name': 'weights', 'type': {'type': 'map', 
+                    'values': 'double'}},
+                {'name': 'children', 'type': {'type': 'array', 'items': 'Node'}},
+                {'name': 'color', 'type': ['null', {'type': 'enum', 
+                    'name': 'Color', 'symbols': ['BLUE', 'GREEN', 'RED']}]},
+                {'name': 'extra', 'type': {'type': 'map', 'values': 'string'},
+                    'default': {'b': u'\u0142', 'a': 'x', 'c': ''}},
+                {'name': 'extra_bytes', 'type': 'bytes', 'default': 'abc'}]}
+        self.__check_same_as_generic(_WRITERS_SCHEMA, readers_schema,
+            _create_records())
+
+    def test_special_values(self):
+        schema = {'type': 'record', 'name': 'R', 'fields': [
+            {'name': 'f', 'type': 'float'},
+            {'name': 'd', 'type': ['null', 'double']},
+            {'name': 's', 'type': 'string'},
+            {'name': 'm', 'type': {'type': 'map', 'values': 'boolean'}},
+            {'name': 'empty', 'type': {'type': 'array', 'items': 'null'}}]}
+        values = [float('nan'), float('inf'), float('-inf'), 0.1, -0.0, 1e30]
+        records = [{'f': v, 'd': v, 's': u'"\\\n\u20ac\U0001f600', 
+                    'm': {str(i): i % 2 == 0 for i in range(20)}, 'empty': []}
+                   for v in values]
+        records.append({'f': 1.5, 'd': None, 's': '', 'm': {}, 'empty': []})
+        self.__check_same_as_generic(schema, schema, records)
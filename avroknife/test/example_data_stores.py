@@ -17,12 +17,14 @@ import avro.schema
 from avro.datafile import DataFileWriter
 from avro.io import DatumWriter
 
-def create(standard_out_path, nested_out_path, binary_out_path):
+def create(standard_out_path, nested_out_path, binary_out_path, 
+        blocks_out_path):
     """Create example Avro data stores"""
 
     __create_standard(standard_out_path)
     __create_nested(nested_out_path)
     __create_binary(binary_out_path)
+    create_blocks(blocks_out_path)
 
 def __create_standard(out_path):
     os.makedirs(out_path)
@@ -73,3 +75,27 @@ def __create_binary(out_path):
                             'data/binary_stuff/greetings.tar.gz')).read()
             writer.append({'description': 'greetings', 
                            'packed_files': greetings_data})
+
+def create_blocks_record(position):
+    """Create a record stored in the data store with many Avro blocks"""
+    return {'position': position, 'name': 'name{}'.format(position), 
+            'favorite_number': 10*position}
+
+def create_blocks(out_path):
+    """Create data store where each file consists of many Avro blocks.
+    
+    It contains 15 records, 3 records per block.
+    """
+    os.makedirs(out_path)
+    schema_path = os.path.join(os.path.dirname(__file__), 'data/user.avsc')
+    schema = avro.schema.parse(open(schema_path).read())
+    position = 0
+    for file_name, codec, blocks_num in [('part-m-00000.avro', 'null', 3), 
+                                        ('part-m-00001.avro', 'deflate', 2)]:
+        with DataFileWriter(open(os.path.join(out_path, file_name), 'w'), 
+                DatumWriter(), schema, codec) as writer:
+            for _ in range(blocks_num):
+                for _ in range(3):
+                    writer.append(create_blocks_record(position))
+                    position = position + 1
+                writer.sync()
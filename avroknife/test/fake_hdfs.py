@@ -0,0 +1,118 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fake of the HDFS part of pydoop package, backed by a local directory.
+
+It allows to test `file_system.HDFSPath` without a Hadoop cluster.
+The calls made to the file system are counted, so the tests can check
+how many round trips to the namenode the real file system would need.
+"""
+
+import os
+import os.path
+from collections import Counter
+
+from avroknife import file_system
+
+class FakeHDFS:
+    """Replacement of the `pydoop.hdfs` module
+
+    Each namenode is represented by a subdirectory of the root directory
+    named after the host and the port of the namenode.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        ## Numbers of calls of the file system methods and of
+        ## the established connections ("connect")
+        self.calls = Counter()
+        self.__saved_state = None
+
+    def hdfs(self, host='default', port=0):
+        self.calls['connect'] += 1
+        return _FakeConnection(self, host, port)
+
+    def install(self):
+        """Makes `file_system` module use this file system instead of
+        the real HDFS"""
+        self.__saved_state = (file_system._hdfs_lib,
+                              dict(file_system._hdfs_connections))
+        file_system._hdfs_lib = (self, None)
+        file_system._hdfs_connections.clear()
+
+    def uninstall(self):
+        file_system._hdfs_lib, connections = self.__saved_state
+        file_system._hdfs_connections.clear()
+        file_system._hdfs_connections.update(connections)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.uninstall()
+
+class _FakeConnection:
+    """Replacement of the `pydoop.hdfs.hdfs` class"""
+
+    def __init__(self, fake_hdfs, host, port):
+        self.__fake_hdfs = fake_hdfs
+        self.__calls = fake_hdfs.calls
+        self.__host = host
+        self.__port = port
+        self.__dir = os.path.join(fake_hdfs.root_dir,
+            '{}_{}'.format(host, port))
+        if not os.path.isdir(self.__dir):
+            os.makedirs(self.__dir)
+
+    def __local_path(self, path):
+        return os.path.join(self.__dir, path.lstrip('/'))
+
+    def __get_info(self, path, name):
+        stat = os.stat(path)
+        return {'name': name,
+                'kind': 'directory' if os.path.isdir(path) else 'file',
+                'size': stat.st_size,
+                'last_mod': stat.st_mtime}
+
+    def open_file(self, path, mode='r'):
+        self.__calls['open_file'] += 1
+        return open(self.__local_path(path), mode)
+
+    def list_directory(self, path):
+        self.__calls['list_directory'] += 1
+        local_path = self.__local_path(path)
+        if not os.path.isdir(local_path):
+            raise IOError('Cannot list "{}"'.format(path))
+        return [self.__get_info(os.path.join(local_path, name),
+                    'hdfs://{}:{}/{}/{}'.format(self.__host, self.__port,
+                        path.strip('/'), name))
+                for name in sorted(os.listdir(local_path))]
+
+    def get_path_info(self, path):
+        self.__calls['get_path_info'] += 1
+        local_path = self.__local_path(path)
+        if not os.path.exists(local_path):
+            raise IOError('Cannot get information about "{}"'.format(path))
+        return self.__get_info(local_path, path)
+
+    def exists(self, path):
+        self.__calls['exists'] += 1
+        return os.path.exists(self.__local_path(path))
+
+    def create_directory(self, path):
+        self.__calls['create_directory'] += 1
+        local_path = self.__local_path(path)
+        if not os.path.isdir(local_path):
+            os.makedirs(local_path)
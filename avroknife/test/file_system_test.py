@@ -0,0 +1,153 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+import pickle
+
+from avroknife import file_system
+from avroknife.container import ContainerReader
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath, MappedFile, HDFSPath, \
+    FileInfo, split_hdfs_path
+from avroknife.test.fake_hdfs import FakeHDFS
+from avroknife.test import example_data_stores
+
+class MappedFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __create_file(self, name, content):
+        path = os.path.join(self.__dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return LocalPath(path)
+
+    def test_read(self):
+        path = self.__create_file('file', '0123456789')
+        with path.open_mapped() as f:
+            self.assertIsInstance(f, MappedFile)
+            self.assertEqual('012', f.read(3))
+            f.seek(-2, 2)
+            self.assertEqual(8, f.tell())
+            self.assertEqual('89', f.read())
+            self.assertEqual('', f.read(1))
+            self.assertEqual('345', str(f.read_buffer(3, 3)))
+
+    def test_empty_file(self):
+        path = self.__create_file('empty', '')
+        with path.open_mapped() as f:
+            self.assertEqual('', f.read())
+
+    def test_same_blocks_as_regular_file(self):
+        ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(ds_dir)
+        for name in sorted(os.listdir(ds_dir)):
+            path = LocalPath(os.path.join(ds_dir, name))
+            with ContainerReader(path.open("r")) as reader:
+                expected = [(block, reader.read_block_data(block)) 
+                            for block in reader.iter_block_infos()]
+            with ContainerReader(path.open_mapped()) as reader:
+                actual = [(block, str(reader.read_block_data(block))) 
+                          for block in reader.iter_block_infos()]
+            self.assertEqual(expected, actual)
+
+
+class LocalPathTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def test_info(self):
+        with open(os.path.join(self.__dir, 'file'), 'w') as f:
+            f.write('abc')
+        os.mkdir(os.path.join(self.__dir, 'dir'))
+        path = LocalPath(self.__dir)
+        self.assertTrue(path.get_info().is_dir)
+        self.assertIsNone(path.append('missing').get_info())
+        self.assertEqual([('dir', True), ('file', False)],
+            sorted((name, info.is_dir) for name, info in path.ls_info()))
+        self.assertEqual(3, dict(path.ls_info())['file'].size)
+
+class HDFSPathTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__hdfs = FakeHDFS(self.__dir)
+        self.__hdfs.install()
+        self.__local_dir = os.path.join(self.__dir, 'default_0', 'data')
+        os.makedirs(self.__local_dir)
+        with open(os.path.join(self.__local_dir, 'file'), 'w') as f:
+            f.write('abc')
+        os.mkdir(os.path.join(self.__local_dir, 'dir'))
+
+    def tearDown(self):
+        self.__hdfs.uninstall()
+        shutil.rmtree(self.__dir)
+
+    def test_split_path(self):
+        self.assertEqual(('default', 0, 'a/b'), split_hdfs_path('a/b'))
+        self.assertEqual(('default', 0, '/a/b'), split_hdfs_path('/a/b'))
+        self.assertEqual(('nn', 8020, '/a/b'), 
+            split_hdfs_path('hdfs://nn:8020/a/b'))
+
+    def test_lib_is_imported_once(self):
+        self.assertIs(file_system.import_hdfs_lib(), 
+            file_system.import_hdfs_lib())
+
+    def test_connection_is_shared(self):
+        path = HDFSPath('/data')
+        for i in range(10):
+            self.assertFalse(path.append(str(i)).exists())
+        self.assertEqual('abc', path.append('file').open().read())
+        self.assertEqual(1, self.__hdfs.calls['connect'])
+        HDFSPath('hdfs://other:8020/data').exists()
+        self.assertEqual(2, self.__hdfs.calls['connect'])
+
+    def test_connection_is_established_again_after_unpickling(self):
+        path = pickle.loads(pickle.dumps(HDFSPath('/data')))
+        self.assertEqual('abc', path.append('file').open().read())
+
+    def test_info(self):
+        path = HDFSPath('/data')
+        self.assertEqual([('dir', True), ('file', False)],
+            [(name, info.is_dir) for name, info in path.ls_info()])
+        self.assertEqual(1, self.__hdfs.calls['list_directory'])
+        self.assertEqual(['dir', 'file'], path.ls())
+        info = path.append('file').get_info()
+        self.assertIsInstance(info, FileInfo)
+        self.assertEqual((False, 3), (info.is_dir, info.size))
+        self.assertTrue(path.get_info().is_dir)
+        self.assertEqual(2, self.__hdfs.calls['get_path_info'])
+        self.assertIsNone(path.append('missing').get_info())
+        self.assertFalse(path.append('missing').is_dir())
+        self.assertRaises(IOError, path.append('missing').get_status)
+
+    def test_make_dirs(self):
+        HDFSPath('/data/a/b').make_dirs()
+        self.assertTrue(os.path.isdir(os.path.join(self.__local_dir, 'a', 'b')))
+
+    def test_data_store(self):
+        ds_dir = os.path.join(self.__local_dir, 'blocks')
+        example_data_stores.create_blocks(ds_dir)
+        ds = DataStore(HDFSPath('/data/blocks'))
+        self.assertEqual(range(15), 
+            [record['position'] for _, record in ds.iter_records()])
+        self.assertEqual(1, self.__hdfs.calls['connect'])
@@ -0,0 +1,98 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os
+import os.path
+import threading
+import time
+
+from avroknife import file_writer
+from avroknife.file_system import LocalPath
+from avroknife.file_writer import FileWriter
+
+class _BlockedPath(LocalPath):
+    """Local path whose files can't be opened until the event is set"""
+
+    def __init__(self, path, event, opened):
+        LocalPath.__init__(self, path)
+        self.__event = event
+        self.__opened = opened
+
+    def open(self, mode="r"):
+        self.__opened.append(str(self))
+        self.__event.wait()
+        return LocalPath.open(self, mode)
+
+class FileWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __path(self, name):
+        return LocalPath(os.path.join(self.__dir, name))
+
+    def __read_dir(self):
+        return dict((name, open(os.path.join(self.__dir, name)).read())
+                    for name in os.listdir(self.__dir))
+
+    def test_write(self):
+        for threads in [0, 1, 3]:
+            with FileWriter(threads, max_queued_bytes=10) as writer:
+                for i in range(20):
+                    writer.write(i, self.__path(str(i)), 'x' * i)
+            self.assertEqual(dict((str(i), 'x' * i) for i in range(20)),
+                self.__read_dir())
+
+    def test_queued_bytes_are_limited(self):
+        event = threading.Event()
+        opened = []
+        writer = FileWriter(4, max_queued_bytes=10)
+        writer.write(0, _BlockedPath(
+            os.path.join(self.__dir, '0'), event, opened), 'x' * 6)
+        ## The writer waits for the first file since the data of both files
+        ## doesn't fit in the limit
+        thread = threading.Thread(target=writer.write,
+            args=(1, self.__path('1'), 'y' * 6))
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual([], os.listdir(self.__dir))
+        event.set()
+        thread.join()
+        writer.close()
+        self.assertEqual({'0': 'x' * 6, '1': 'y' * 6}, self.__read_dir())
+
+    def test_error_is_raised(self):
+        errors = []
+        error = file_writer.error
+        file_writer.error = errors.append
+        try:
+            missing_dir = os.path.join(self.__dir, 'missing')
+            for threads in [0, 2]:
+                del errors[:]
+                with self.assertRaises(IOError):
+                    with FileWriter(threads) as writer:
+                        writer.write(3, self.__path('a'), 'a')
+                        writer.write(7, LocalPath(
+                            os.path.join(missing_dir, 'b')), 'b')
+                        writer.write(9, self.__path('c'), 'c')
+                self.assertEqual(
+                    ['while processing record with index 7'], errors)
+        finally:
+            file_writer.error = error
@@ -0,0 +1,46 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of converting decoded records to JSON.
+
+The current implementation, `utils.JSONConverter`, is compared with the
+legacy one, which copied each record with all strings wrapped in
+additional objects before passing it to the `json` module.
+
+Run it with:
+    python -m avroknife.test.json_benchmark
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from avroknife.test.utils_test import SCHEMA, create_records, \
+    legacy_dict_to_json
+from avroknife.utils import JSONConverter
+
+def main():
+    records = create_records() * 100
+    repeats = 5
+    converter = JSONConverter(SCHEMA)
+    for name, convert in [
+            ('legacy', legacy_dict_to_json),
+            ('schema-aware', converter.convert)]:
+        seconds = min(timeit.repeat(
+            lambda: [convert(r) for r in records], number=1, repeat=repeats))
+        print('{:>12}: {:8.1f} us/record'.format(
+            name, 1e6 * seconds / len(records)))
+
+if __name__ == '__main__':
+    main()
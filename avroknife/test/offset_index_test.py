@@ -0,0 +1,96 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+import avro.schema
+from avro.datafile import DataFileWriter
+from avro.io import DatumWriter
+
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath, HDFSPath
+from avroknife.offset_index import OffsetIndex
+from avroknife.test import example_data_stores
+from avroknife.test.fake_hdfs import FakeHDFS
+
+class OffsetIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(self.__ds_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __get_positions(self, first, last):
+        data_store = DataStore(LocalPath(self.__ds_dir), use_offset_index=True)
+        return [(index, record['position']) 
+                for index, record in data_store.iter_records(first, last)]
+
+    def test_index_created(self):
+        self.assertEqual([(i, i) for i in range(4, 11)], 
+                         self.__get_positions(4, 10))
+        index_path = os.path.join(self.__ds_dir, OffsetIndex.file_name)
+        self.assertTrue(os.path.exists(index_path))
+        self.assertEqual([(i, i) for i in range(10, 15)], 
+                         self.__get_positions(10, None))
+        self.assertEqual([], self.__get_positions(15, None))
+
+    def test_locate(self):
+        self.__get_positions(0, 0)
+        index = OffsetIndex.load(LocalPath(
+            os.path.join(self.__ds_dir, OffsetIndex.file_name)))
+        self.assertEqual(15, index.get_number_of_records())
+        position = index.locate(13)
+        self.assertEqual((1, 12, 3), (position.file_number, position.index, 
+                                     position.local_index))
+        self.assertIsNone(index.locate(15))
+
+    def test_invalid_index_is_recreated(self):
+        index_path = os.path.join(self.__ds_dir, OffsetIndex.file_name)
+        for content in ['not json', '[1, 2]', '"text"', '{"version": 1}',
+                        '{"version": 1, "files": [{"name": "a"}]}']:
+            with open(index_path, 'w') as f:
+                f.write(content)
+            self.assertIsNone(OffsetIndex.load(LocalPath(index_path)), 
+                content)
+            self.assertEqual([(i, i) for i in range(10, 15)], 
+                             self.__get_positions(10, None))
+
+    def test_outdated_index_is_recreated(self):
+        self.assertEqual([(14, 14)], self.__get_positions(14, None))
+        schema_path = os.path.join(os.path.dirname(__file__), 'data/user.avsc')
+        schema = avro.schema.parse(open(schema_path).read())
+        with DataFileWriter(open(os.path.join(self.__ds_dir, 'part-m-00002.avro'), 'w'), 
+                DatumWriter(), schema) as writer:
+            writer.append(example_data_stores.create_blocks_record(15))
+        self.assertEqual([(14, 14), (15, 15)], self.__get_positions(14, None))
+        data_store = DataStore(LocalPath(self.__ds_dir), use_offset_index=True)
+        self.assertEqual(16, data_store.count_records())
+
+    def test_hdfs_files_are_listed_once(self):
+        with FakeHDFS(os.path.join(self.__dir, 'hdfs')) as hdfs:
+            shutil.copytree(self.__ds_dir, 
+                os.path.join(self.__dir, 'hdfs', 'default_0', 'blocks'))
+            for _ in range(2):
+                hdfs.calls.clear()
+                data_store = DataStore(HDFSPath('/blocks'), 
+                    use_offset_index=True)
+                self.assertEqual(range(10, 15), [record['position'] 
+                    for _, record in data_store.iter_records(10, None)])
+                ## The sizes and modification times of the files come 
+                ## from the listing of the data store directory
+                self.assertEqual(0, hdfs.calls['get_path_info'])
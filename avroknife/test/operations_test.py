@@ -0,0 +1,136 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os
+import os.path
+import time
+
+import avro.schema
+from avro.datafile import DataFileWriter
+from avro.io import DatumWriter
+
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath, HDFSPath
+from avroknife.operations import extract
+from avroknife.record_selector import RecordSelector, Range
+from avroknife.test import example_data_stores
+from avroknife.test.fake_hdfs import FakeHDFS
+from avroknife.utils import FileAlreadyExistsException
+
+class _DelayedPath(LocalPath):
+    """Local path whose files are opened with a delay"""
+
+    def __init__(self, path, delay):
+        LocalPath.__init__(self, path)
+        self.__delay = delay
+
+    def open(self, mode="r"):
+        time.sleep(self.__delay)
+        return LocalPath.open(self, mode)
+
+    def append(self, string):
+        return _DelayedPath(str(LocalPath.append(self, string)), self.__delay)
+
+class ExtractTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__hdfs = FakeHDFS(os.path.join(self.__dir, 'hdfs'))
+        self.__hdfs.install()
+        self.__ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(self.__ds_dir)
+        self.__out_dir = os.path.join(self.__dir, 'hdfs', 'default_0', 'out')
+
+    def tearDown(self):
+        self.__hdfs.uninstall()
+        shutil.rmtree(self.__dir)
+
+    def __extract(self, index, name_field=None, create_dirs=False):
+        extract(DataStore(LocalPath(self.__ds_dir)),
+            RecordSelector(Range(index)), 'name', name_field, create_dirs,
+            HDFSPath('/out'))
+
+    def __read_dir(self, path):
+        return dict((name, open(os.path.join(path, name)).read())
+                    for name in os.listdir(path))
+
+    def test_create_dirs_continues_numbering(self):
+        ## All the records have null "favorite_color", so they go to 
+        ## the same directory
+        os.makedirs(os.path.join(self.__out_dir, 'null'))
+        for name in ['0', '4']:
+            with open(os.path.join(self.__out_dir, 'null', name), 'w') as f:
+                f.write('old')
+        self.__extract('0-14', 'favorite_color', True)
+        expected = {'0': 'old', '4': 'old'}
+        for position in range(15):
+            expected[str(position + 5)] = 'name{}'.format(position)
+        self.assertEqual(expected, 
+            self.__read_dir(os.path.join(self.__out_dir, 'null')))
+        ## The directory is checked and listed only once
+        self.assertEqual(1, self.__hdfs.calls['list_directory'])
+        self.assertEqual(1, self.__hdfs.calls['get_path_info'])
+
+    def test_create_dirs_new_directories_are_not_listed(self):
+        self.__extract('3-9', create_dirs=True)
+        for position in range(3, 10):
+            self.assertEqual({'0': 'name{}'.format(position)}, 
+                self.__read_dir(os.path.join(self.__out_dir, str(position))))
+        self.assertEqual(0, self.__hdfs.calls['list_directory'])
+
+    def test_name_field_checks_names_without_file_system(self):
+        self.__extract('2-11', 'name')
+        self.assertEqual(
+            dict(('name{}'.format(i), 'name{}'.format(i)) 
+                 for i in range(2, 12)),
+            self.__read_dir(self.__out_dir))
+        self.assertEqual(1, self.__hdfs.calls['list_directory'])
+        self.assertEqual(0, self.__hdfs.calls['exists'])
+
+    def test_name_field_with_existing_file(self):
+        os.makedirs(self.__out_dir)
+        with open(os.path.join(self.__out_dir, 'name7'), 'w') as f:
+            f.write('old')
+        self.assertRaises(Exception, self.__extract, '2-11', 'name')
+        self.assertEqual('old', 
+            open(os.path.join(self.__out_dir, 'name7')).read())
+
+    def test_name_field_with_repeated_names(self):
+        ## All the records have null "favorite_color"
+        self.assertRaises(Exception, self.__extract, '2-11', 
+            'favorite_color')
+        self.assertEqual({'null': 'name2'}, self.__read_dir(self.__out_dir))
+
+    def test_repeated_nested_name_with_write_threads(self):
+        ds_dir = os.path.join(self.__dir, 'nested_names')
+        os.makedirs(ds_dir)
+        schema_path = os.path.join(os.path.dirname(__file__), 
+            'data/user.avsc')
+        schema = avro.schema.parse(open(schema_path).read())
+        with DataFileWriter(open(os.path.join(ds_dir, 'part-m-00000.avro'), 
+                'w'), DatumWriter(), schema) as writer:
+            for position, name in enumerate(['dir/a', 'dir/b', 'dir/a']):
+                writer.append({'position': position, 'name': name})
+        out_dir = os.path.join(self.__dir, 'nested_out')
+        os.makedirs(os.path.join(out_dir, 'dir'))
+        ## The first file is still waiting to be written when the name 
+        ## of the last one is checked
+        with self.assertRaises(FileAlreadyExistsException):
+            extract(DataStore(LocalPath(ds_dir)), RecordSelector(), 
+                'position', 'name', False, _DelayedPath(out_dir, 0.2), 
+                write_threads=2)
+        self.assertEqual({'a': '0', 'b': '1'}, 
+            self.__read_dir(os.path.join(out_dir, 'dir')))
@@ -0,0 +1,211 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+import threading
+import time
+
+import avro.schema
+from avro.io import DatumWriter
+
+from avroknife.container import ContainerWriter
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath
+from avroknife.prefetch import FilePrefetcher, PrefetchedFile
+from avroknife.test import example_data_stores
+
+class SlowPath(LocalPath):
+    """Local path whose files are opened with a delay, like in HDFS.
+
+    The files are not mapped into memory; the numbers of opened and closed
+    files are counted.
+    """
+
+    def __init__(self, path, latency, counters=None):
+        LocalPath.__init__(self, path)
+        self.__latency = latency
+        if counters is None:
+            counters = {'opened': 0, 'closed': 0, 'lock': threading.Lock()}
+        self.counters = counters
+
+    def open(self, mode="r"):
+        time.sleep(self.__latency)
+        with self.counters['lock']:
+            self.counters['opened'] = self.counters['opened'] + 1
+        return _CountedFile(LocalPath.open(self, mode), self.counters)
+
+    def open_mapped(self):
+        return self.open("r")
+
+    def append(self, string):
+        return SlowPath(str(LocalPath.append(self, string)),
+            self.__latency, self.counters)
+
+class _CountedFile:
+    def __init__(self, f, counters):
+        self.__f = f
+        self.__counters = counters
+
+    def __getattr__(self, name):
+        return getattr(self.__f, name)
+
+    def close(self):
+        with self.__counters['lock']:
+            self.__counters['closed'] = self.__counters['closed'] + 1
+        self.__f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+def _create_many_files(out_path, files_num, records_per_file):
+    schema_path = os.path.join(os.path.dirname(__file__), 'data/user.avsc')
+    schema = avro.schema.parse(open(schema_path).read())
+    os.makedirs(out_path)
+    position = 0
+    for file_number in range(files_num):
+        file_path = os.path.join(out_path,
+            'part-m-{:05d}.avro'.format(file_number))
+        with open(file_path, 'wb') as f:
+            with ContainerWriter(f, DatumWriter(), schema) as writer:
+                for _ in range(records_per_file):
+                    writer.append(
+                        example_data_stores.create_blocks_record(position))
+                    position = position + 1
+
+class PrefetchedFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__path = os.path.join(self.__dir, 'file')
+        with open(self.__path, 'w') as f:
+            f.write('0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def test_read(self):
+        released = []
+        for buffered in [0, 4, 10]:
+            f = PrefetchedFile(open(self.__path), 10, '0123456789'[:buffered],
+                lambda: released.append(buffered))
+            self.assertEqual('012', f.read(3))
+            self.assertEqual(3, f.tell())
+            self.assertEqual('345', f.read(3))
+            f.seek(-2, 2)
+            self.assertEqual('89', f.read())
+            self.assertEqual('', f.read(1))
+            f.seek(2)
+            self.assertEqual('23', str(f.read_buffer(2, 2)))
+            self.assertEqual('5678', str(f.read_buffer(5, 4)))
+            f.close()
+        self.assertEqual([0, 4, 10], released)
+
+class FilePrefetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__paths = []
+        for i in range(6):
+            path = os.path.join(self.__dir, str(i))
+            with open(path, 'w') as f:
+                f.write(str(i) * 100)
+            self.__paths.append(SlowPath(path, 0.01))
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def test_files_are_opened_in_order(self):
+        prefetcher = FilePrefetcher(3, max_memory=250)
+        contents = []
+        for f in prefetcher.iter_files(self.__paths):
+            with f:
+                contents.append(f.read())
+        self.assertEqual([str(i) * 100 for i in range(6)], contents)
+        counters = self.__paths[0].counters
+        self.assertEqual(counters['opened'], counters['closed'])
+
+    def test_memory_is_limited(self):
+        prefetcher = FilePrefetcher(1, max_memory=150)
+        files = prefetcher.iter_files(self.__paths)
+        first = next(files)
+        ## The data of the first file is kept in memory, so only a part
+        ## of the second one can be read
+        second = next(files)
+        self.assertEqual(100, len(first.read_buffer(0, 100)))
+        self.assertEqual(50, len(second.read_buffer(0, 50)))
+        self.assertEqual(str(1) * 100, second.read())
+        first.close()
+        second.close()
+        ## The released memory is used by the next files
+        third = next(files)
+        self.assertIsInstance(third.read_buffer(0, 100), buffer)
+        third.close()
+        files.close()
+        counters = self.__paths[0].counters
+        self.assertEqual(counters['opened'], counters['closed'])
+
+    def test_missing_file(self):
+        paths = self.__paths[:2] + [SlowPath(
+            os.path.join(self.__dir, 'missing'), 0)] + self.__paths[2:]
+        files = FilePrefetcher(3).iter_files(paths)
+        next(files).close()
+        next(files).close()
+        self.assertRaises(IOError, next, files)
+
+class DataStorePrefetchingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__ds_dir = os.path.join(self.__dir, 'many_files')
+        _create_many_files(self.__ds_dir, 10, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def __read(self, latency, prefetch_files, first=0, last=None):
+        path = SlowPath(self.__ds_dir, latency)
+        ds = DataStore(path, prefetch_files=prefetch_files,
+            prefetch_memory=1000)
+        ds.get_schema()
+        start = time.time()
+        positions = [record['position']
+                     for _, record in ds.iter_records(first, last)]
+        return (positions, time.time() - start, path.counters)
+
+    def test_same_records(self):
+        for first, last in [(0, None), (4, 17), (29, None), (5, 5)]:
+            expected, _, _ = self.__read(0, 0, first, last)
+            for prefetch_files in [1, 4, 20]:
+                positions, _, counters = self.__read(0, prefetch_files,
+                    first, last)
+                self.assertEqual(expected, positions)
+                self.assertEqual(counters['opened'], counters['closed'])
+
+    def test_latency_is_hidden(self):
+        positions, serial_time, _ = self.__read(0.05, 0)
+        self.assertEqual(range(30), positions)
+        positions, prefetching_time, _ = self.__read(0.05, 10)
+        self.assertEqual(range(30), positions)
+        self.assertLess(prefetching_time, serial_time / 2)
+
+    def test_count_and_blocks(self):
+        ds = DataStore(SlowPath(self.__ds_dir, 0), prefetch_files=3)
+        self.assertEqual(30, ds.count_records())
+        references = list(ds.get_block_references(2, 20))
+        self.assertEqual(range(2, 21),
+            [record['position'] for block in ds.read_blocks(references)
+             for _, record in block.iter_records(2, 20)])
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import errno
+import os.path
+import shutil
+import sys
+import tempfile
+
+from avroknife.file_system import LocalPath
+from avroknife.printer import Printer, StdoutPrinter, FilePrinter, \
+    OutputClosedException, frame
+
+class _ListPrinter(Printer):
+    def __init__(self, buffer_size):
+        Printer.__init__(self, buffer_size)
+        self.writes = []
+
+    def _write(self, data):
+        self.writes.append(data)
+
+    def close(self):
+        self.flush()
+
+class _ClosedStdout:
+    def __init__(self, f):
+        self.__f = f
+
+    def write(self, data):
+        raise IOError(errno.EPIPE, 'Broken pipe')
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        return self.__f.fileno()
+
+class PrinterTestCase(unittest.TestCase):
+    def test_buffering(self):
+        printer = _ListPrinter(10)
+        printer.print('abc')
+        printer.print('def', end='')
+        self.assertEqual([], printer.writes)
+        printer.write_many(['12', '345'], end=',')
+        self.assertEqual(['abc\ndef12,'], printer.writes)
+        printer.write_many(iter([u'ł']))
+        printer.close()
+        self.assertEqual(['abc\ndef12,', '345,\xc5\x82\n'], printer.writes)
+
+    def test_unbuffered(self):
+        printer = _ListPrinter(0)
+        printer.write_many(['a', 'b'])
+        printer.print(7)
+        self.assertEqual(['a\n', 'b\n', '7\n'], printer.writes)
+
+    def test_file_printer(self):
+        dir_ = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir_, 'out.txt')
+            with FilePrinter(LocalPath(path), 4) as printer:
+                printer.write_many(str(i) for i in range(5))
+            with open(path) as f:
+                self.assertEqual('0\n1\n2\n3\n4\n', f.read())
+        finally:
+            shutil.rmtree(dir_)
+
+    def test_closed_stdout(self):
+        stdout = sys.stdout
+        with tempfile.TemporaryFile() as f:
+            sys.stdout = _ClosedStdout(f)
+            try:
+                printer = StdoutPrinter(0)
+                with self.assertRaises(OutputClosedException):
+                    printer.print('abc')
+                ## Nothing is written once the output is closed
+                printer.print('def')
+                printer.close()
+            finally:
+                sys.stdout = stdout
+
+class FrameTestCase(unittest.TestCase):
+    def test_framings(self):
+        for framing, expected in [
+                ('newline', 'a\nb\n\n\n'),
+                ('nul', 'a\0b\n\0\0'),
+                ('u32-length-prefix', 
+                    '\0\0\0\x01a\0\0\0\x02b\n\0\0\0\0'),
+                ('netstring', '1:a,2:b\n,0:,')]:
+            self.assertEqual(expected, 
+                ''.join(frame(v, framing) for v in ['a', 'b\n', '']))
+
+    def test_unknown_framing(self):
+        self.assertRaises(ValueError, frame, 'a', 'unknown')
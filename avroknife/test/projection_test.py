@@ -0,0 +1,80 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import json
+
+import avro.schema
+
+from avroknife.projection import project_schema
+
+_SCHEMA = avro.schema.parse(json.dumps({
+    'type': 'record', 'name': 'R', 'namespace': 'ns', 'doc': 'Record',
+    'aliases': ['OldR'], 'custom': {'a': 1}, 'fields': [
+        {'name': 'id', 'type': 'long', 'doc': 'Identifier',
+         'order': 'descending', 'aliases': ['old_id']},
+        {'name': 'name', 'type': 'string', 'default': 'none'},
+        {'name': 'sub', 'type': ['null', {'type': 'record', 'name': 'Sub',
+            'doc': 'Nested record', 'fields': [
+                {'name': 'level1', 'type': 'int'},
+                {'name': 'level2', 'type': 'int', 'doc': 'Level'}]}]}]}))
+
+class ProjectSchemaTestCase(unittest.TestCase):
+    def test_fields_are_removed(self):
+        projected = project_schema(_SCHEMA, ['name', 'sub.level2'])
+        self.assertEqual(['name', 'sub'], [f.name for f in projected.fields])
+        sub = projected.fields_dict['sub'].type.schemas[1]
+        self.assertEqual(['level2'], [f.name for f in sub.fields])
+
+    def test_attributes_are_preserved(self):
+        projected = project_schema(_SCHEMA, ['id', 'name', 'sub.level2'])
+        projected_json = projected.to_json()
+        self.assertEqual('ns.R', projected.fullname)
+        self.assertEqual('Record', projected_json['doc'])
+        self.assertEqual(['OldR'], projected_json['aliases'])
+        self.assertEqual({'a': 1}, projected_json['custom'])
+        id_json, name_json, sub_json = projected_json['fields']
+        self.assertEqual({'name': 'id', 'type': 'long', 'doc': 'Identifier',
+            'order': 'descending', 'aliases': ['old_id']}, id_json)
+        self.assertEqual({'name': 'name', 'type': 'string',
+            'default': 'none'}, name_json)
+        sub = sub_json['type'][1]
+        self.assertEqual('Nested record', sub['doc'])
+        self.assertEqual([{'name': 'level2', 'type': 'int', 'doc': 'Level'}],
+            sub['fields'])
+
+    def test_union_of_different_records(self):
+        schema = avro.schema.parse(json.dumps({
+            'type': 'record', 'name': 'R', 'fields': [
+                {'name': 'i', 'type': 'int'},
+                {'name': 'e', 'type': 'string'},
+                {'name': 'u', 'type': ['null',
+                    {'type': 'record', 'name': 'S', 'fields': [
+                        {'name': 'b', 'type': 'int'},
+                        {'name': 's', 'type': 'string'}]},
+                    {'type': 'record', 'name': 'T', 'fields': [
+                        {'name': 't', 'type': 'int'}, 
+                        {'name': 'v', 'type': 'int'}]}]}]}))
+        projected = project_schema(schema, ['u.s', 'i'])
+        self.assertEqual(['i', 'u'], [f.name for f in projected.fields])
+        _, s, t = projected.fields_dict['u'].type.schemas
+        ## Only the record defining the field is pruned
+        self.assertEqual(['s'], [f.name for f in s.fields])
+        self.assertEqual(['t', 'v'], [f.name for f in t.fields])
+        projected = project_schema(schema, ['u.t', 'u.b', 'e'])
+        _, s, t = projected.fields_dict['u'].type.schemas
+        self.assertEqual(['b'], [f.name for f in s.fields])
+        self.assertEqual(['t'], [f.name for f in t.fields])
+        self.assertRaises(KeyError, project_schema, schema, ['u.x'])
+        self.assertRaises(KeyError, project_schema, schema, ['i.x'])
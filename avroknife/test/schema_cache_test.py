@@ -0,0 +1,88 @@
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+import os.path
+
+import avro.schema
+
+from avroknife.data_store import DataStore
+from avroknife.file_system import LocalPath, HDFSPath, FileStatus
+from avroknife.schema_cache import SchemaCache
+from avroknife.test import example_data_stores
+from avroknife.test.fake_hdfs import FakeHDFS
+
+_SCHEMA_JSON = '{"type": "record", "name": "R", '\
+    '"fields": [{"name": "a", "type": "int"}]}'
+
+class SchemaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__cache = SchemaCache(os.path.join(self.__dir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir)
+
+    def test_get(self):
+        path = LocalPath('/some/file.avro')
+        status = FileStatus(10, 1000.5)
+        self.assertIsNone(self.__cache.get(path, status))
+        self.__cache.put(path, status, _SCHEMA_JSON)
+        self.assertEqual(_SCHEMA_JSON, self.__cache.get(path, status))
+        self.assertIsNone(self.__cache.get(path, FileStatus(11, 1000.5)))
+        self.assertIsNone(self.__cache.get(path, FileStatus(10, 1001.5)))
+        self.assertIsNone(
+            self.__cache.get(LocalPath('/some/other.avro'), status))
+
+    def test_non_ascii_paths(self):
+        status = FileStatus(10, 1000.5)
+        unicode_path = LocalPath(u'/some/z\xf6.avro')
+        self.__cache.put(unicode_path, status, _SCHEMA_JSON)
+        self.assertEqual(_SCHEMA_JSON, self.__cache.get(unicode_path, status))
+        ## The same path given as a UTF-8 encoded string
+        self.assertEqual(_SCHEMA_JSON, self.__cache.get(
+            LocalPath('/some/z\xc3\xb6.avro'), status))
+
+    def test_data_store_uses_cache(self):
+        ds_dir = os.path.join(self.__dir, 'blocks')
+        example_data_stores.create_blocks(ds_dir)
+        ds_path = LocalPath(ds_dir)
+        schema = DataStore(ds_path, schema_cache=self.__cache).get_schema()
+        self.assertEqual(schema, DataStore(ds_path).get_schema())
+        first_path = ds_path.append(sorted(os.listdir(ds_dir))[0])
+        self.assertEqual(schema, avro.schema.parse(
+            self.__cache.get(first_path, first_path.get_status())))
+        ## The schema is taken from the cache as long as the file 
+        ## is not modified
+        self.__cache.put(first_path, first_path.get_status(), _SCHEMA_JSON)
+        self.assertEqual(avro.schema.parse(_SCHEMA_JSON), 
+            DataStore(ds_path, schema_cache=self.__cache).get_schema())
+
+    def test_hdfs_cache_hit_takes_single_request(self):
+        with FakeHDFS(os.path.join(self.__dir, 'hdfs')) as hdfs:
+            example_data_stores.create_blocks(
+                os.path.join(self.__dir, 'hdfs', 'default_0', 'blocks'))
+            ds_path = HDFSPath('/blocks')
+            schema = DataStore(ds_path, schema_cache=self.__cache).get_schema()
+            hdfs.calls.clear()
+            self.assertEqual(schema, 
+                DataStore(ds_path, schema_cache=self.__cache).get_schema())
+            ## One request lists the data store, the other one checks 
+            ## the first file; the file itself is not opened
+            self.assertEqual(1, hdfs.calls['list_directory'])
+            self.assertEqual(1, hdfs.calls['get_path_info'])
+            self.assertEqual(0, hdfs.calls['open_file'])
+            self.assertEqual(0, hdfs.calls['exists'])
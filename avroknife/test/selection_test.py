@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2015 University of Warsaw
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import json
+
+import avro.schema
+
+from avroknife.selection import Selection, InvalidSelectionException
+
+_SCHEMA = avro.schema.parse(json.dumps({
+    'type': 'record', 'name': 'R', 'fields': [
+        {'name': 'id', 'type': 'long'},
+        {'name': 'name', 'type': 'string'},
+        {'name': 'score', 'type': ['null', 'double']},
+        {'name': 'flag', 'type': 'boolean'},
+        {'name': 'color', 'type': {'type': 'enum', 'name': 'Color',
+            'symbols': ['RED', 'GREEN', 'BLUE']}},
+        {'name': 'data', 'type': 'bytes'},
+        {'name': 'sub', 'type': ['null', {'type': 'record', 'name': 'Sub', 
+            'fields': [{'name': 'level2', 'type': 'int'}]}]},
+        {'name': 'tags', 'type': {'type': 'array', 'items': 'string'}},
+        {'name': 'label', 'type': ['null', 'string']},
+        {'name': 'mixed', 'type': ['null', 'int', 'string']}]}))
+
+def _create_record(id_):
+    return {'id': id_, 'name': [u'Ben', u'Alyssa', u'Zoë', u''][id_ % 4],
+            'score': None if id_ % 3 == 0 else id_ / 2.0,
+            'flag': id_ % 2 == 0, 'color': ['RED', 'GREEN', 'BLUE'][id_ % 3],
+            'data': '\x00{}'.format(id_),
+            'sub': None if id_ % 5 == 0 else {'level2': id_ % 5},
+            'tags': [], 'label': [None, u'null', u'x'][id_ % 3],
+            'mixed': [None, id_, unicode(id_), u'null', u'abc'][id_ % 5]}
+
+_RECORDS = [_create_record(i) for i in range(12)]
+
+class SelectionTestCase(unittest.TestCase):
+    def __select(self, condition):
+        predicate = Selection(condition).compile(_SCHEMA)
+        return [r['id'] for r in _RECORDS if predicate(r)]
+
+    def __check(self, condition, expected_filter):
+        self.assertEqual([r['id'] for r in _RECORDS if expected_filter(r)],
+                         self.__select(condition))
+
+    def test_comparisons(self):
+        self.__check('id=3', lambda r: r['id'] == 3)
+        self.__check('id == 3', lambda r: r['id'] == 3)
+        self.__check('id != 3', lambda r: r['id'] != 3)
+        self.__check('id <> 3', lambda r: r['id'] != 3)
+        self.__check('id < 3', lambda r: r['id'] < 3)
+        self.__check('id <= 3', lambda r: r['id'] <= 3)
+        self.__check('id > 3.5', lambda r: r['id'] > 3.5)
+        self.__check('id >= -1', lambda r: True)
+        self.__check('flag = TRUE', lambda r: r['flag'])
+        self.__check('name = Ben', lambda r: r['name'] == u'Ben')
+        self.__check('name > "B"', lambda r: r['name'] > u'B')
+        self.__check('data = "\\x005"', lambda r: r['data'] == 'x005')
+        self.__check('sub.level2 = 2', 
+            lambda r: r['sub'] is not None and r['sub']['level2'] == 2)
+
+    def test_null(self):
+        self.__check('score IS NULL', lambda r: r['score'] is None)
+        self.__check('score = null', lambda r: r['score'] is None)
+        self.__check('score IS NOT NULL', lambda r: r['score'] is not None)
+        self.__check('sub.level2 IS NULL', lambda r: r['sub'] is None)
+        self.__check('score < 3', 
+            lambda r: r['score'] is not None and r['score'] < 3)
+        self.__check('score != 1', lambda r: r['score'] != 1)
+        self.__check('sub.level2 <= 1', 
+            lambda r: r['sub'] is not None and r['sub']['level2'] <= 1)
+
+    def test_null_string(self):
+        ## As in the former "FIELD=VALUE" selection, NULL is equal to
+        ## the "null" string
+        self.__check('label = null', lambda r: r['label'] in [None, u'null'])
+        self.__check('label=null', lambda r: r['label'] in [None, u'null'])
+        self.__check('label != NULL', 
+            lambda r: r['label'] not in [None, u'null'])
+        self.__check('label IN (null, x)', 
+            lambda r: r['label'] in [None, u'null', u'x'])
+        self.__check('label = "null"', lambda r: r['label'] == u'null')
+        self.__check('label IS NULL', lambda r: r['label'] is None)
+        self.__check('label IS NOT NULL', lambda r: r['label'] is not None)
+
+    def test_union_of_several_types(self):
+        self.__check('mixed = 3', lambda r: r['mixed'] in [3, u'3'])
+        self.__check('mixed=7', lambda r: r['mixed'] in [7, u'7'])
+        self.__check('mixed != 3', lambda r: r['mixed'] not in [3, u'3'])
+        self.__check('mixed = abc', lambda r: r['mixed'] == u'abc')
+        self.__check('mixed IN (1, abc)', 
+            lambda r: r['mixed'] in [1, u'1', u'abc'])
+        self.__check('mixed = null', lambda r: r['mixed'] in [None, u'null'])
+        self.__check('mixed IS NULL', lambda r: r['mixed'] is None)
+        self.__check('mixed IS NOT NULL', lambda r: r['mixed'] is not None)
+        self.__check('mixed < 5', lambda r: 
+            (isinstance(r['mixed'], int) and r['mixed'] < 5) or
+            (isinstance(r['mixed'], unicode) and r['mixed'] < u'5'))
+        self.__check('mixed >= 2.5', lambda r: 
+            (isinstance(r['mixed'], int) and r['mixed'] >= 2.5) or
+            (isinstance(r['mixed'], unicode) and r['mixed'] >= u'2.5'))
+        self.__check("mixed LIKE '1%'", lambda r: 
+            isinstance(r['mixed'], unicode) and r['mixed'].startswith('1'))
+
+    def test_in(self):
+        self.__check('id IN (1, 5, 7)', lambda r: r['id'] in [1, 5, 7])
+        self.__check('id NOT IN (1, 5, 7)', lambda r: r['id'] not in [1, 5, 7])
+        self.__check('score IN (NULL, 1.0)', lambda r: r['score'] in [None, 1])
+        self.__check("name IN ('Ben', 'Zo\xc3\xab')", 
+            lambda r: r['name'] in [u'Ben', u'Zoë'])
+
+    def test_like_and_regexp(self):
+        self.__check("name LIKE 'A%'", lambda r: r['name'].startswith('A'))
+        self.__check("name LIKE '_o_'", lambda r: r['name'] == u'Zoë')
+        self.__check("name NOT LIKE '%y%'", lambda r: 'y' not in r['name'])
+        self.__check("name REGEXP 'ys+a'", lambda r: 'yssa' in r['name'])
+        self.__check("color LIKE '%E%'", lambda r: 'E' in r['color'])
+
+    def test_enum(self):
+        self.__check('color = GREEN', lambda r: r['color'] == 'GREEN')
+        self.__check('color >= GREEN', lambda r: r['color'] != 'RED')
+        with self.assertRaises(InvalidSelectionException):
+            Selection('color = BLACK').compile(_SCHEMA)
+
+    def test_boolean_logic(self):
+        self.__check('id > 2 AND id < 8 AND NOT flag = true', 
+            lambda r: 2 < r['id'] < 8 and not r['flag'])
+        self.__check('id = 1 OR id = 2 AND flag = false',
+            lambda r: r['id'] == 1 or (r['id'] == 2 and not r['flag']))
+        self.__check('(id = 1 OR id = 2) AND flag = false',
+            lambda r: r['id'] == 1)
+        self.__check('not (id < 10) or name = ""',
+            lambda r: r['id'] >= 10 or r['name'] == u'')
+
+    def test_legacy_form(self):
+        self.__check('name=', lambda r: r['name'] == u'')
+        self.__check('name=Ben Smith', lambda r: False)
+        self.__check("name=Alyssa's", lambda r: False)
+
+    def test_field_names(self):
+        self.assertEqual(['id', 'sub.level2', 'name'], Selection(
+            'id = 1 OR (sub.level2 IS NULL AND NOT name = id)')\
+                .get_field_names())
+
+    def test_syntax_errors(self):
+        for condition in ['', 'id', 'id < 1 OR', '(id < 1', 'id IN 1', 
+                          'id IS 1', 'id = 1 OR id = 2 id', '= 1']:
+            with self.assertRaises(InvalidSelectionException):
+                Selection(condition)
+
+    def test_type_errors(self):
+        for condition in ['missing = 1', 'id.x = 1', 'id = abc', 
+                          'id = "1"', 'flag = yes', 'tags = 1', 
+                          'id LIKE "1%"', 'score < NULL', 'name REGEXP "("',
+                          'mixed < NULL', 'mixed REGEXP "("']:
+            with self.assertRaises(InvalidSelectionException):
+                Selection(condition).compile(_SCHEMA)
@@ -0,0 +1,75 @@
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from avroknife.container import BlockInfo
+from avroknife.data_store import BlockReference
+from avroknife.shards import plan_shards
+
+def _create_block_ranges(counts, first=0, last=None):
+    """Returns ranges of blocks with given numbers of records, 100 bytes 
+    of data per record"""
+    ranges = []
+    index = 0
+    for count in counts:
+        reference = BlockReference(None, 
+            BlockInfo(index, count, index, 100 * count), index, index)
+        block_first = max(first, index)
+        block_last = index + count - 1
+        if last is not None:
+            block_last = min(last, block_last)
+        if block_first <= block_last:
+            ranges.append((reference, block_first, block_last))
+        index = index + count
+    return ranges
+
+def _get_shard_ranges(shards):
+    return [[(first, last) for _, first, last in shard.block_ranges] 
+            for shard in shards]
+
+class PlanShardsTestCase(unittest.TestCase):
+    def test_no_limits(self):
+        shards = plan_shards(_create_block_ranges([3, 3, 2], 1, 6))
+        self.assertEqual([[(1, 2), (3, 5), (6, 6)]], _get_shard_ranges(shards))
+        self.assertEqual([0], [s.number for s in shards])
+
+    def test_max_records(self):
+        shards = plan_shards(_create_block_ranges([3, 3, 2]), 
+            max_records_per_file=4)
+        self.assertEqual([[(0, 2), (3, 3)], [(4, 5), (6, 7)]], 
+            _get_shard_ranges(shards))
+        self.assertEqual([0, 1], [s.number for s in shards])
+
+    def test_max_records_smaller_than_block(self):
+        shards = plan_shards(_create_block_ranges([5]), 
+            max_records_per_file=2)
+        self.assertEqual([[(0, 1)], [(2, 3)], [(4, 4)]], 
+            _get_shard_ranges(shards))
+
+    def test_max_bytes(self):
+        shards = plan_shards(_create_block_ranges([3, 3, 5, 2]), 
+            max_bytes_per_file=600)
+        self.assertEqual([[(0, 2), (3, 5)], [(6, 10)], [(11, 12)]], 
+            _get_shard_ranges(shards))
+
+    def test_max_records_and_bytes(self):
+        shards = plan_shards(_create_block_ranges([3, 3, 3]), 
+            max_records_per_file=4, max_bytes_per_file=350)
+        self.assertEqual([[(0, 2)], [(3, 5)], [(6, 8)]], 
+            _get_shard_ranges(shards))
+
+    def test_empty(self):
+        shards = plan_shards([], max_records_per_file=4)
+        self.assertEqual([[]], _get_shard_ranges(shards))
@@ -20,7 +20,11 @@ import tempfile
 import os.path
 import itertools
 import filecmp
+import tarfile
+import zipfile
 import distutils.dir_util
+from avro.datafile import DataFileReader
+from avro.io import DatumReader
 
 from avroknife.test.command_line_runner import CommandLineRunner, \
     CommandLineRunnerException
@@ -41,8 +45,9 @@ class CommandLineTestCaseBase(unittest.TestCase):
         standard_ds_path = os.path.join(cls.__source_data_dir, 'standard')
         nested_ds_path = os.path.join(cls.__source_data_dir, 'nested')
         binary_ds_path = os.path.join(cls.__source_data_dir, 'binary')
+        blocks_ds_path = os.path.join(cls.__source_data_dir, 'blocks')
         example_data_stores.create(
-            standard_ds_path, nested_ds_path, binary_ds_path)
+            standard_ds_path, nested_ds_path, binary_ds_path, blocks_ds_path)
         enforce_local = True
         env_name = CommandLineTestCaseBase.__hdfs_tests_env_name
         if os.getenv(env_name, 'FALSE')=='TRUE':
@@ -160,6 +165,15 @@ class CommandLineTestCaseBase(unittest.TestCase):
 {"position": 7, "name": "Mikel", "favorite_number": null, "favorite_color": "", "secret": null}
 """
 
+    @staticmethod
+    def _get_expected_blocks_contents(indexes):
+        lines = []
+        for i in indexes:
+            lines.append('{{"position": {0}, "name": "name{0}", '\
+                '"favorite_number": {1}, "favorite_color": null, '\
+                '"secret": null}}\n'.format(i, 10*i))
+        return ''.join(lines)
+
 
 class GetSchemaTestsCase(CommandLineTestCaseBase):
     def test_basic(self):
@@ -303,6 +317,76 @@ class ToJSONTestsCase(CommandLineTestCaseBase):
 {"position": 7, "name": "Mikel", "favorite_number": null, "favorite_color": "", "secret": null}
 """, in_local, out_local)
 
+    def test_blocks_range(self):
+        self._iterate(self.subtest_blocks_range)
+    def subtest_blocks_range(self, in_local, out_local):
+        self._check_output('tojson @in:blocks --index 5-10', 
+            self._get_expected_blocks_contents(range(5, 11)), 
+            in_local, out_local)
+
+    def test_blocks_range_starting_in_second_file(self):
+        self._iterate(self.subtest_blocks_range_starting_in_second_file)
+    def subtest_blocks_range_starting_in_second_file(self, in_local, out_local):
+        self._check_output('tojson @in:blocks --index 12-', 
+            self._get_expected_blocks_contents(range(12, 15)), 
+            in_local, out_local)
+
+    def test_blocks_range_exceeding_data_store(self):
+        self._iterate(self.subtest_blocks_range_exceeding_data_store)
+    def subtest_blocks_range_exceeding_data_store(self, in_local, out_local):
+        self._check_output('tojson @in:blocks --index 20-30', '', 
+            in_local, out_local)
+
+    def test_blocks_range_offset_index(self):
+        self._iterate(self.subtest_blocks_range_offset_index)
+    def subtest_blocks_range_offset_index(self, in_local, out_local):
+        for _ in range(2):
+            ## The index is created in the first run and used in the second
+            self._check_output('tojson @in:blocks --index 7-13 --offset_index', 
+                self._get_expected_blocks_contents(range(7, 14)), 
+                in_local, out_local)
+
+
+class ParallelDecodingTestsCase(CommandLineTestCaseBase):
+    def test_tojson(self):
+        self._iterate(self.subtest_tojson)
+    def subtest_tojson(self, in_local, out_local):
+        self._check_output('tojson @in:standard --jobs 3', 
+            self._get_expected_standard_contents(), in_local, out_local)
+
+    def test_tojson_blocks_range(self):
+        self._iterate(self.subtest_tojson_blocks_range)
+    def subtest_tojson_blocks_range(self, in_local, out_local):
+        self._check_output('tojson @in:blocks --index 4-12 --jobs 2', 
+            self._get_expected_blocks_contents(range(4, 13)), 
+            in_local, out_local)
+
+    def test_select_with_limit(self):
+        self._iterate(self.subtest_select_with_limit)
+    def subtest_select_with_limit(self, in_local, out_local):
+        self._check_output('tojson @in:standard --select favorite_color=blue --limit 1 --jobs 2', """\
+{"position": 3, "name": "Ben2", "favorite_number": 8, "favorite_color": "blue", "secret": "MDk4NzY1NDMyMQ=="}
+""", in_local, out_local)
+
+    def test_count_select(self):
+        self._iterate(self.subtest_count_select)
+    def subtest_count_select(self, in_local, out_local):
+        self._check_output('count @in:standard --select favorite_color=null --jobs 2', 
+            '3\n', in_local, out_local)
+
+    def test_extract(self):
+        self._iterate(self.subtest_extract)
+    def subtest_extract(self, in_local, out_local):
+        self._check_output('extract @in:standard --index 2-4 --value_field name --jobs 2', 
+            'Alyssa2\nBen2\nBen3\n', in_local, out_local)
+
+    def test_decompression_threads(self):
+        self._iterate(self.subtest_decompression_threads)
+    def subtest_decompression_threads(self, in_local, out_local):
+        self._check_output('tojson @in:blocks --index 4-12 --decompression_threads 2', 
+            self._get_expected_blocks_contents(range(4, 13)), 
+            in_local, out_local)
+
 
 class CopyTestsCase(CommandLineTestCaseBase):  
     def test_basic(self):
@@ -311,6 +395,95 @@ class CopyTestsCase(CommandLineTestCaseBase):
         self._check_output_avro_file('copy @in:standard --output @out:whole_copy', 
             self._get_expected_standard_contents(), 'whole_copy', in_local, out_local)
 
+    def test_blocks(self):
+        self._iterate(self.subtest_blocks)
+    def subtest_blocks(self, in_local, out_local):
+        self._check_output_avro_file('copy @in:blocks --output @out:blocks_copy', 
+            self._get_expected_blocks_contents(range(15)), 'blocks_copy', 
+            in_local, out_local)
+
+    def test_blocks_index_and_limit(self):
+        self._iterate(self.subtest_blocks_index_and_limit)
+    def subtest_blocks_index_and_limit(self, in_local, out_local):
+        for args, positions in [
+                ('--index 2-12', range(2, 13)),
+                ('--index 3-11', range(3, 12)),
+                ('--index 4- --limit 7', range(4, 11)),
+                ('--index 3-', range(3, 15)),
+                ('--select "position IN (1, 2, 3, 14)" --limit 3', [1, 2, 3])]:
+            self._check_output_avro_file(
+                'copy @in:blocks {} --output @out:blocks_part'.format(args), 
+                self._get_expected_blocks_contents(positions), 'blocks_part', 
+                in_local, out_local)
+
+    def __check_shards(self, command_args, expected_positions, 
+            output_name, in_local, out_local):
+        ret = self._r.run(command_args, in_local, out_local)
+        output_path = ret.get_output_path(output_name)
+        names = ['part-{:05d}.avro'.format(i) 
+                 for i in range(len(expected_positions))]
+        self.assertEqual(names, sorted(os.listdir(output_path)))
+        for name, positions in zip(names, expected_positions):
+            with DataFileReader(open(os.path.join(output_path, name), 'rb'),
+                    DatumReader()) as reader:
+                self.assertEqual(positions, [r['position'] for r in reader])
+
+    def test_max_records_per_file(self):
+        self._iterate(self.subtest_max_records_per_file)
+    def subtest_max_records_per_file(self, in_local, out_local):
+        for jobs in [1, 3]:
+            self.__check_shards('copy @in:blocks --index 1- '
+                '--max_records_per_file 4 --jobs {} '
+                '--output @out:shards_{}'.format(jobs, jobs), 
+                [range(1, 5), range(5, 9), range(9, 13), range(13, 15)], 
+                'shards_{}'.format(jobs), in_local, out_local)
+
+    def test_max_records_per_file_with_select(self):
+        self._iterate(self.subtest_max_records_per_file_with_select)
+    def subtest_max_records_per_file_with_select(self, in_local, out_local):
+        self.__check_shards('copy @in:blocks --select "position != 2" '
+            '--max_records_per_file 6 --limit 9 --jobs 2 '
+            '--output @out:select_shards', 
+            [[0, 1, 3, 4, 5], [6, 7, 8, 9]], 
+            'select_shards', in_local, out_local)
+
+    def test_max_bytes_per_file(self):
+        self._iterate(self.subtest_max_bytes_per_file)
+    def subtest_max_bytes_per_file(self, in_local, out_local):
+        ## Each Avro block is larger than 1 byte
+        self.__check_shards('copy @in:blocks --max_bytes_per_file 1 '
+            '--output @out:block_shards', 
+            [range(i, i + 3) for i in range(0, 15, 3)], 
+            'block_shards', in_local, out_local)
+
+    def test_codec(self):
+        self._iterate(self.subtest_codec)
+    def subtest_codec(self, in_local, out_local):
+        for args in ['--codec null', '--codec deflate', 
+                     '--codec bzip2 --compression_level 1',
+                     '--codec deflate --compression_level 9 --max_records_per_file 100']:
+            self._check_output_avro_file(
+                'copy @in:blocks {} --output @out:codec_copy'.format(args), 
+                self._get_expected_blocks_contents(range(15)), 'codec_copy', 
+                in_local, out_local)
+
+    def test_invalid_codec(self):
+        self._iterate(self.subtest_invalid_codec)
+    def subtest_invalid_codec(self, in_local, out_local):
+        for args in ['--codec unknown', '--codec deflate --compression_level 0',
+                     '--codec null --compression_level 1']:
+            with self.assertRaises(CommandLineRunnerException):
+                self._r.run('copy @in:blocks {} --output @out:codec_copy'\
+                    .format(args), in_local, out_local)
+
+    def test_blocks_fields(self):
+        self._iterate(self.subtest_blocks_fields)
+    def subtest_blocks_fields(self, in_local, out_local):
+        self._check_output_avro_file(
+            'copy @in:blocks --index 11-13 --fields position --output @out:blocks_fields', 
+            '{"position": 11}\n{"position": 12}\n{"position": 13}\n', 
+            'blocks_fields', in_local, out_local)
+
 
 class ExtractTestsCase(CommandLineTestCaseBase):     
     def test_text_fields(self):
@@ -410,6 +583,43 @@ class ExtractTestsCase(CommandLineTestCaseBase):
         self.assertEqual('Mallet', blue1)
         self.assertEqual('Mikel', empty)
 
+    def test_write_threads(self):
+        self._iterate(self.subtest_write_threads)
+    def subtest_write_threads(self, in_local, out_local):
+        ret = self._r.run('extract @in:standard --value_field name --name_field favorite_color --create_dirs --write_threads 3 --write_memory 10 --output @out:extracted_name', 
+            in_local, out_local)
+        output_path = ret.get_output_path('extracted_name')
+        self.assertEqual(['Alyssa', 'Alyssa2', 'Alyssa3', 'Mikel'], 
+            [self._read(os.path.join(output_path, 'null', str(i))) 
+             for i in range(4)])
+        self.assertEqual(['Ben2', 'Mallet'], 
+            [self._read(os.path.join(output_path, 'blue', str(i))) 
+             for i in range(2)])
+
+    def test_archive(self):
+        self._iterate(self.subtest_archive)
+    def subtest_archive(self, in_local, out_local):
+        expected = [('null/0', 'Alyssa'), ('red/0', 'Ben'), 
+            ('null/1', 'Alyssa2'), ('blue/0', 'Ben2'), ('green/0', 'Ben3'), 
+            ('null/2', 'Alyssa3'), ('blue/1', 'Mallet'), ('null/3', 'Mikel')]
+        ret = self._r.run('extract @in:standard --value_field name --name_field favorite_color --create_dirs --archive tar --output @out:extracted.tar', 
+            in_local, out_local)
+        with tarfile.open(ret.get_output_path('extracted.tar')) as archive:
+            self.assertEqual(expected, 
+                [(m.name, archive.extractfile(m).read()) for m in archive])
+        ret = self._r.run('extract @in:standard --value_field name --name_field favorite_color --create_dirs --archive zip --output @out:extracted.zip', 
+            in_local, out_local)
+        archive = zipfile.ZipFile(ret.get_output_path('extracted.zip'))
+        self.assertEqual(expected, 
+            [(name, archive.read(name)) for name in archive.namelist()])
+
+    def test_archive_with_repeated_names(self):
+        self._iterate(self.subtest_archive_with_repeated_names)
+    def subtest_archive_with_repeated_names(self, in_local, out_local):
+        with self.assertRaises(CommandLineRunnerException):
+            self._r.run('extract @in:standard --index 3-7 --value_field name --name_field favorite_color --archive zip --output @out:extracted.zip', 
+                in_local, out_local, discard_stderr=True)
+
     @staticmethod
     def __are_files_identical(path0, path1):
         return filecmp.cmp(path0, path1, shallow=False)
@@ -434,6 +644,29 @@ class ExtractTestsCase(CommandLineTestCaseBase):
 Alyssa2
 """, in_local, out_local)
     
+    def test_framing(self):
+        self._iterate(self.subtest_framing)
+    def subtest_framing(self, in_local, out_local):
+        for framing, expected in [
+                ('newline', 'Alyssa2\nBen2\n'), 
+                ('nul', 'Alyssa2\0Ben2\0'), 
+                ('u32-length-prefix', '\0\0\0\x07Alyssa2\0\0\0\x04Ben2'),
+                ('netstring', '7:Alyssa2,4:Ben2,')]:
+            self._check_output('extract @in:standard --index 2-3 --value_field name --framing {}'.format(framing), 
+                expected, in_local, out_local)
+
+    def test_framing_of_binary_fields(self):
+        self._iterate(self.subtest_framing_of_binary_fields)
+    def subtest_framing_of_binary_fields(self, in_local, out_local):
+        ret = self._r.run('extract @in:binary --value_field packed_files --framing netstring --buffer_size 100', 
+            in_local, out_local)
+        expected = ''
+        for name in ['various_stuff.tar.gz', 'greetings.tar.gz']:
+            content = self._read(os.path.join(os.path.dirname(__file__), 
+                'data/binary_stuff', name))
+            expected = expected + '{}:{},'.format(len(content), content)
+        self.assertEqual(expected, ret.get_stdout())
+
     def test_nested_fields(self):
         self._iterate(self.subtest_nested_fields)
     def subtest_nested_fields(self, in_local, out_local):
@@ -516,6 +749,28 @@ class SelectTestsCase(CommandLineTestCaseBase):
         self._check_output('tojson @in:nested --select sub.level2=2', """\
 {"sup": 1, "sub": {"level2": 2}}
 """, in_local, out_local)
+
+    def test_condition(self):
+        self._iterate(self.subtest_condition)
+    def subtest_condition(self, in_local, out_local):
+        self._check_output('tojson @in:standard --select "position >= 2 AND position < 6 AND favorite_color IS NOT NULL"', """\
+{"position": 3, "name": "Ben2", "favorite_number": 8, "favorite_color": "blue", "secret": "MDk4NzY1NDMyMQ=="}
+{"position": 4, "name": "Ben3", "favorite_number": 2, "favorite_color": "green", "secret": "MTIzNDVhYmNk"}
+""", in_local, out_local)
+
+    def test_in_and_like(self):
+        self._iterate(self.subtest_in_and_like)
+    def subtest_in_and_like(self, in_local, out_local):
+        self._check_output('count @in:standard --select "favorite_number IN (4, 8, 16) OR name LIKE \'M%\'"', 
+            '5\n', in_local, out_local)
+
+    def test_invalid_condition(self):
+        self._iterate(self.subtest_invalid_condition)
+    def subtest_invalid_condition(self, in_local, out_local):
+        for condition in ['"position <"', 'position=abc', 'unknown=1']:
+            with self.assertRaises(CommandLineRunnerException):
+                self._r.run('tojson @in:standard --select ' + condition, 
+                    in_local, out_local, discard_stderr=True)
  
 
 class LimitTestsCase(CommandLineTestCaseBase):  
@@ -575,6 +830,111 @@ class SchemaProjectionTestsCase(CommandLineTestCaseBase):
 """, 'projected', in_local, out_local)
 
 
+class FieldsProjectionTestsCase(CommandLineTestCaseBase): 
+    def test_tojson(self):
+        self._iterate(self.subtest_tojson)
+    def subtest_tojson(self, in_local, out_local):
+        self._check_output('tojson @in:standard --index 3-4 --fields secret,name', """\
+{"name": "Ben2", "secret": "MDk4NzY1NDMyMQ=="}
+{"name": "Ben3", "secret": "MTIzNDVhYmNk"}
+""", in_local, out_local)
+
+    def test_nested(self):
+        self._iterate(self.subtest_nested)
+    def subtest_nested(self, in_local, out_local):
+        self._check_output('tojson @in:nested --fields sub.level2', """\
+{"sub": {"level2": 2}}
+{"sub": {"level2": 1}}
+""", in_local, out_local)
+
+    def test_select(self):
+        self._iterate(self.subtest_select)
+    def subtest_select(self, in_local, out_local):
+        self._check_output('tojson @in:standard --fields name,favorite_color --select favorite_color=blue', """\
+{"name": "Ben2", "favorite_color": "blue"}
+{"name": "Mallet", "favorite_color": "blue"}
+""", in_local, out_local)
+
+    def test_select_field_not_listed(self):
+        self._iterate(self.subtest_select_field_not_listed)
+    def subtest_select_field_not_listed(self, in_local, out_local):
+        with self.assertRaises(CommandLineRunnerException):
+            self._r.run('tojson @in:standard --fields name --select favorite_color=blue', 
+                in_local, out_local, discard_stderr=True)
+
+    def test_unknown_field(self):
+        self._iterate(self.subtest_unknown_field)
+    def subtest_unknown_field(self, in_local, out_local):
+        with self.assertRaises(CommandLineRunnerException):
+            self._r.run('tojson @in:standard --fields name,unknown', 
+                in_local, out_local, discard_stderr=True)
+
+    def test_copy(self):
+        self._iterate(self.subtest_copy)
+    def subtest_copy(self, in_local, out_local):
+        self._check_output_avro_file('copy @in:standard --index 6- --fields position,favorite_color --output @out:projected', 
+            """\
+{"position": 6, "favorite_color": "blue"}
+{"position": 7, "favorite_color": ""}
+""", 'projected', in_local, out_local)
+
+class GenericDecoderTestsCase(CommandLineTestCaseBase): 
+    def test_tojson(self):
+        self._iterate(self.subtest_tojson)
+    def subtest_tojson(self, in_local, out_local):
+        self._check_output('tojson @in:standard --generic_decoder', 
+                    self._get_expected_standard_contents(), in_local, out_local)
+
+    def test_nested(self):
+        self._iterate(self.subtest_nested)
+    def subtest_nested(self, in_local, out_local):
+        self.assertEqual(
+            self._r.run('tojson @in:nested', in_local, out_local).get_stdout(),
+            self._r.run('tojson @in:nested --generic_decoder', 
+                in_local, out_local).get_stdout())
+
+    def test_fields(self):
+        self._iterate(self.subtest_fields)
+    def subtest_fields(self, in_local, out_local):
+        self._check_output('tojson @in:nested --fields sub.level2 --generic_decoder', """\
+{"sub": {"level2": 2}}
+{"sub": {"level2": 1}}
+""", in_local, out_local)
+
+
+class BlockStatisticsTestsCase(CommandLineTestCaseBase):
+    def test_select(self):
+        self._iterate(self.subtest_select)
+    def subtest_select(self, in_local, out_local):
+        commands = [
+            ('count @in:blocks --select "position = 4 OR name = \'name13\'"', 
+                '2\n'),
+            ('count @in:blocks --index 4-13 --select "position >= 9"', '5\n'),
+            ('tojson @in:blocks --select "favorite_number IN (20, 140)"', """\
+{"position": 2, "name": "name2", "favorite_number": 20, "favorite_color": null, "secret": null}
+{"position": 14, "name": "name14", "favorite_number": 140, "favorite_color": null, "secret": null}
+""")]
+        for command, expected in commands:
+            self._check_output(command, expected, in_local, out_local)
+        self._check_output(
+            'buildstats @in:blocks --fields position,name,favorite_number', 
+            '', in_local, out_local)
+        for command, expected in commands:
+            self._check_output(command, expected, in_local, out_local)
+
+    def test_fields_are_mandatory(self):
+        self._iterate(self.subtest_fields_are_mandatory)
+    def subtest_fields_are_mandatory(self, in_local, out_local):
+        with self.assertRaises(CommandLineRunnerException):
+            self._r.run('buildstats @in:blocks', in_local, out_local)
+
+    def test_unsupported_field(self):
+        self._iterate(self.subtest_unsupported_field)
+    def subtest_unsupported_field(self, in_local, out_local):
+        with self.assertRaises(CommandLineRunnerException):
+            self._r.run('buildstats @in:nested --fields sub', 
+                in_local, out_local)
+
 class CountTestsCase(CommandLineTestCaseBase):     
     def test_basic(self):
         self._iterate(self.subtest_basic)
@@ -591,3 +951,29 @@ class CountTestsCase(CommandLineTestCaseBase):
         self._iterate(self.subtest_select)
     def subtest_select(self, in_local, out_local):
         self._check_output('count @in:standard --select name=Ben', '1\n', in_local, out_local)
+
+    def test_blocks(self):
+        self._iterate(self.subtest_blocks)
+    def subtest_blocks(self, in_local, out_local):
+        self._check_output('count @in:blocks', '15\n', in_local, out_local)
+
+    def test_blocks_select_with_index(self):
+        self._iterate(self.subtest_blocks_select_with_index)
+    def subtest_blocks_select_with_index(self, in_local, out_local):
+        self._check_output('count @in:blocks --index 4-13 --select favorite_color=null', 
+            '10\n', in_local, out_local)
+
+    def test_index(self):
+        self._iterate(self.subtest_index)
+    def subtest_index(self, in_local, out_local):
+        self._check_output('count @in:standard --index 3-4', '2\n', in_local, out_local)
+
+    def test_index_exceeding_data_store(self):
+        self._iterate(self.subtest_index_exceeding_data_store)
+    def subtest_index_exceeding_data_store(self, in_local, out_local):
+        self._check_output('count @in:standard --index 6-20', '2\n', in_local, out_local)
+
+    def test_limit(self):
+        self._iterate(self.subtest_limit)
+    def subtest_limit(self, in_local, out_local):
+        self._check_output('count @in:standard --index 2- --limit 3', '3\n', in_local, out_local)
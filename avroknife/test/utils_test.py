@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013-2015 University of Warsaw
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import base64
+import json
+import warnings
+from collections import OrderedDict
+
+import avro.schema
+
+from avroknife.utils import dict_to_json, encapsulate_strings, \
+    EncapsulatedString, JSONConverter
+
+class _EncapsulatedString:
+    def __init__(self, string):
+        self.string = string
+
+def _encapsulate_strings(python_object):
+    if isinstance(python_object, str):
+        return _EncapsulatedString(python_object)
+    if isinstance(python_object, list):
+        return [_encapsulate_strings(e) for e in python_object]
+    if isinstance(python_object, OrderedDict):
+        new_dict = OrderedDict()
+        for (k, v) in python_object.iteritems():
+            new_dict[k] = _encapsulate_strings(v)
+        return new_dict
+    if isinstance(python_object, dict):
+        return {k: _encapsulate_strings(v)
+                for (k, v) in python_object.iteritems()}
+    return python_object
+
+class _EncapsulatedStringEncoder(json.JSONEncoder):
+    def default(self, python_object):
+        if isinstance(python_object, _EncapsulatedString):
+            return base64.b64encode(python_object.string)
+        return super(_EncapsulatedStringEncoder, self).default(python_object)
+
+def legacy_dict_to_json(python_dict, pretty_print=False):
+    """The implementation of `dict_to_json` used before, which copies
+    the whole dictionary and converts it with the `json` module"""
+    if pretty_print:
+        return _EncapsulatedStringEncoder(indent=4).encode(
+            _encapsulate_strings(python_dict))
+    return _EncapsulatedStringEncoder().encode(
+        _encapsulate_strings(python_dict))
+
+SCHEMA = avro.schema.parse(json.dumps(
+    {'type': 'record', 'name': 'R', 'fields': [
+        {'name': 'text', 'type': 'string'},
+        {'name': 'data', 'type': ['null', 'bytes']},
+        {'name': 'number', 'type': 'double'},
+        {'name': 'flags', 'type': {'type': 'map', 'values': 'boolean'}},
+        {'name': 'children', 'type': {'type': 'array', 'items': 'R'}},
+        {'name': 'empty', 'type': {'type': 'array', 'items': 'int'}}]}))
+
+def create_record(i, children):
+    record = OrderedDict()
+    record['text'] = u'"textł\n{}'.format(i)
+    record['data'] = None if i % 3 == 0 else '\x00\xff\xfe' * i
+    record['number'] = [float('nan'), float('inf'), 0.1, 7][i % 4]
+    record['flags'] = {'f{}'.format(j): j % 2 == 0 for j in range(3 * i)}
+    record['children'] = children
+    record['empty'] = []
+    return record
+
+def create_records():
+    return [create_record(i, [create_record(j, []) for j in range(i)])
+            for i in range(10)]
+
+_UNION_SCHEMA = avro.schema.parse(json.dumps(
+    {'type': 'record', 'name': 'U', 'fields': [
+        {'name': 'value', 'type': ['null', 'string', 
+            {'type': 'fixed', 'name': 'F', 'size': 2},
+            {'type': 'array', 'items': 'bytes'},
+            {'type': 'record', 'name': 'A', 'fields': [
+                {'name': 'a', 'type': 'bytes'}]},
+            {'type': 'record', 'name': 'B', 'fields': [
+                {'name': 'b', 'type': 'bytes'}]},
+            {'type': 'map', 'values': 'bytes'}]}]}))
+
+class DictToJSONTestCase(unittest.TestCase):
+    def test_same_as_legacy_implementation(self):
+        converter = JSONConverter(SCHEMA)
+        for record in create_records():
+            for pretty in [False, True]:
+                expected = legacy_dict_to_json(record, pretty)
+                self.assertEqual(expected, converter.convert(record, pretty))
+                self.assertEqual(expected, 
+                    dict_to_json(record, pretty, SCHEMA))
+
+    def test_record_is_not_modified(self):
+        record = create_record(2, [create_record(1, [])])
+        expected = legacy_dict_to_json(record)
+        JSONConverter(SCHEMA).convert(record)
+        self.assertEqual(expected, legacy_dict_to_json(record))
+        self.assertEqual('\x00\xff\xfe', record['children'][0]['data'])
+
+    def test_unions(self):
+        converter = JSONConverter(_UNION_SCHEMA)
+        for value, expected in [
+                (None, 'null'), (u'\x00', '"\\u0000"'), ('\x00\x01', '"AAE="'),
+                (['\x00\x01', '\x01'], '["AAE=", "AQ=="]'),
+                (OrderedDict([('b', '\x01')]), '{"b": "AQ=="}'),
+                ({'x': '\x01'}, '{"x": "AQ=="}')]:
+            self.assertEqual('{"value": ' + expected + '}', 
+                converter.convert(OrderedDict([('value', value)])))
+
+    def test_recursive_records(self):
+        schema = avro.schema.parse(json.dumps(
+            {'type': 'record', 'name': 'A', 'fields': [
+                {'name': 'b', 'type': ['null', {'type': 'record', 'name': 'B',
+                    'fields': [{'name': 'a', 'type': 'A'}]}]},
+                {'name': 'data', 'type': 'bytes'}]}))
+        record = OrderedDict([('b', OrderedDict([('a', OrderedDict(
+                    [('b', None), ('data', '\x01')]))])), 
+                ('data', '\x00')])
+        self.assertEqual(legacy_dict_to_json(record), 
+            JSONConverter(schema).convert(record))
+
+    def test_without_schema(self):
+        schema = json.loads(str(SCHEMA))
+        self.assertEqual(json.dumps(schema, indent=4), 
+                         dict_to_json(schema, True))
+        self.assertEqual('{"a": "AAE=", "b": "x"}', 
+            dict_to_json(OrderedDict([('a', EncapsulatedString('\x00\x01')),
+                                      ('b', u'x')])))
+
+    def test_deprecated_encapsulate_strings(self):
+        value = OrderedDict([('a', [1, '\x00\x01']), ('b', {})])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            encapsulated = encapsulate_strings(value)
+        self.assertEqual([DeprecationWarning], 
+                         [w.category for w in caught])
+        self.assertEqual(legacy_dict_to_json(value), 
+            dict_to_json(encapsulated))
+
+    def test_pretty(self):
+        schema = avro.schema.parse(json.dumps(
+            {'type': 'record', 'name': 'R', 'fields': [
+                {'name': 'a', 'type': {'type': 'array', 'items': 
+                    ['int', 'bytes']}},
+                {'name': 'b', 'type': {'type': 'map', 'values': 'int'}}]}))
+        self.assertEqual('{\n    "a": [\n        1, \n        "AAE="\n    ], '
+                         '\n    "b": {}\n}', 
+            dict_to_json(OrderedDict([('a', [1, '\x00\x01']), ('b', {})]), 
+                True, schema))
@@ -16,7 +16,9 @@ import json
 import base64
 import os
 import errno
+import warnings
 from collections import OrderedDict
+from json.encoder import encode_basestring_ascii
 
 def to_byte_string(obj):
     """
@@ -27,6 +29,28 @@ def to_byte_string(obj):
     else:
         return str(obj)
 
+_INFINITY = float('inf')
+
+def float_to_json(value):
+    """Converts a float to JSON the same way as the `json` module does"""
+    if value != value:
+        return 'NaN'
+    elif value == _INFINITY:
+        return 'Infinity'
+    elif value == -_INFINITY:
+        return '-Infinity'
+    return repr(value)
+
+def string_to_json(value):
+    """Converts a Unicode string or a UTF-8 encoded byte string to a JSON 
+    string literal"""
+    return encode_basestring_ascii(value)
+
+def bytes_to_json(value):
+    """Converts binary data to a JSON string literal with the data encoded
+    in Base64"""
+    return '"' + base64.b64encode(value) + '"'
+
 ## Previously this class was created using the "namedtuple" function, but
 ## it didn't work properly. The JSON library that turns Python object
 ## into JSON string interpreted the binary string as a normal UTF8 string.
@@ -37,21 +61,30 @@ class EncapsulatedString:
 def encapsulate_strings(python_object):
     """Converts every Python string (_not_ Unicode) to an EncapsulatedString
 
+    Deprecated: pass the schema of the object to `dict_to_json` or use 
+    JSONConverter instead. They encode binary data without copying 
+    the whole object.
+
     Avro DataFileReader yields binary data as a Python string. To be able to jsonify it
     with a custom function we need to convert all strings to an object not understood by
     the JSON encoder. This is a kind of a hack, but on the same time the only solution found
     """
+    warnings.warn('encapsulate_strings is deprecated; pass the schema to '
+        'dict_to_json instead', DeprecationWarning, stacklevel=2)
+    return _encapsulate_strings(python_object)
+
+def _encapsulate_strings(python_object):
     if isinstance(python_object, str):
         return EncapsulatedString(python_object)
     if isinstance(python_object, list):
-        return [encapsulate_strings(e) for e in python_object]
+        return [_encapsulate_strings(e) for e in python_object]
     if isinstance(python_object, OrderedDict):
         new_dict = OrderedDict()
         for (k, v) in python_object.iteritems():
-            new_dict[k] = encapsulate_strings(v)
+            new_dict[k] = _encapsulate_strings(v)
         return new_dict
     if isinstance(python_object, dict):
-        return {k: encapsulate_strings(v) for (k, v) in python_object.iteritems()}
+        return {k: _encapsulate_strings(v) for (k, v) in python_object.iteritems()}
     return python_object
 
 class _AvroJSONEncoder(json.JSONEncoder):
@@ -64,18 +97,233 @@ class _AvroJSONEncoder(json.JSONEncoder):
         else:
             return super(_AvroJSONEncoder, self).default(python_object)
 
-def dict_to_json(python_dict, pretty_print=False):
+_ENCODER = _AvroJSONEncoder()
+_PRETTY_ENCODER = _AvroJSONEncoder(indent=4)
+
+def _encode_bytes(value):
+    if isinstance(value, str):
+        return base64.b64encode(value)
+    return value
+
+def _copy_dict(value, convert_value):
+    ## Records are decoded as OrderedDicts, whose order has to be kept;
+    ## the entries of maps are written in the order of their copy, as in
+    ## previous versions of avroknife
+    if isinstance(value, OrderedDict):
+        return OrderedDict((k, convert_value(v)) for (k, v) in value.iteritems())
+    return {k: convert_value(v) for (k, v) in value.iteritems()}
+
+class _BinaryDataEncoderCompiler:
+    """Creates functions replacing binary data in values of given Avro 
+    schemas with strings holding this data encoded in Base64.
+
+    A function is created only for a schema whose values contain binary
+    data or maps; the values of other schemas are left as they are. 
+    Maps are always copied (see `_copy_dict`); records and arrays are copied
+    only if they contain binary data or maps.
+    """
+
+    def __init__(self):
+        ## Functions converting named records, identified by full names.
+        ## Each function is kept in a one-element list, so that it can be
+        ## referred to by recursive types before it is created.
+        self.__record_converters = {}
+        ## Full names of records mapped to information whether their 
+        ## values have to be converted
+        self.__records_to_convert = {}
+
+    def compile(self, schema):
+        """Returns:
+            a function taking a value of the schema and returning the value
+            with binary data encoded or None if there is no need 
+            to convert the values of the schema
+        """
+        if not self.__needs_conversion(schema):
+            return None
+        type_ = schema.type
+        if type_ in ['bytes', 'fixed']:
+            return _encode_bytes
+        elif type_ == 'array':
+            convert_item = self.compile(schema.items)
+            return lambda value: [convert_item(v) for v in value]
+        elif type_ == 'map':
+            convert_value = self.compile(schema.values)
+            if convert_value is None:
+                convert_value = lambda value: value
+            return lambda value: _copy_dict(value, convert_value)
+        elif type_ in ['record', 'error']:
+            return self.__compile_record(schema)
+        else:
+            return self.__compile_union(schema)
+
+    def __needs_conversion(self, schema):
+        type_ = schema.type
+        if type_ in ['bytes', 'fixed', 'map']:
+            return True
+        elif type_ == 'array':
+            return self.__needs_conversion(schema.items)
+        elif type_ in ['record', 'error']:
+            if schema.fullname not in self.__records_to_convert:
+                self.__analyze_records(schema)
+            return self.__records_to_convert[schema.fullname]
+        elif type_ in ['union', 'error_union']:
+            return any(self.__needs_conversion(s) for s in schema.schemas)
+        return False
+
+    def __analyze_records(self, schema):
+        """Finds out which of the records reachable from the given one
+        have values to be converted"""
+        records = {}
+        self.__collect_new_records(schema, records)
+        for name in records:
+            self.__records_to_convert[name] = False
+        ## Records can refer to each other, so the check is repeated
+        ## until nothing changes
+        changed = True
+        while changed:
+            changed = False
+            for name, record in records.items():
+                if not self.__records_to_convert[name] and any(
+                        self.__needs_conversion(f.type) 
+                        for f in record.fields):
+                    self.__records_to_convert[name] = True
+                    changed = True
+
+    def __collect_new_records(self, schema, records):
+        type_ = schema.type
+        if type_ in ['record', 'error']:
+            name = schema.fullname
+            if name in records or name in self.__records_to_convert:
+                return
+            records[name] = schema
+            for field in schema.fields:
+                self.__collect_new_records(field.type, records)
+        elif type_ == 'array':
+            self.__collect_new_records(schema.items, records)
+        elif type_ == 'map':
+            self.__collect_new_records(schema.values, records)
+        elif type_ in ['union', 'error_union']:
+            for branch in schema.schemas:
+                self.__collect_new_records(branch, records)
+
+    def __compile_record(self, schema):
+        name = schema.fullname
+        if name in self.__record_converters:
+            cell = self.__record_converters[name]
+            if cell[0] is not None:
+                return cell[0]
+            return lambda value: cell[0](value)
+        cell = [None]
+        self.__record_converters[name] = cell
+        field_converters = {}
+        for field in schema.fields:
+            convert_field = self.compile(field.type)
+            if convert_field is not None:
+                field_converters[field.name] = convert_field
+        def convert_entry(entry):
+            convert_field = field_converters.get(entry[0])
+            if convert_field is None:
+                return entry
+            return (entry[0], convert_field(entry[1]))
+        def convert_record(value):
+            if isinstance(value, OrderedDict):
+                return OrderedDict(convert_entry(e) for e in value.iteritems())
+            return dict(convert_entry(e) for e in value.iteritems())
+        cell[0] = convert_record
+        return cell[0]
+
+    def __compile_union(self, schema):
+        """The branch of a union is chosen according to the type of 
+        the value"""
+        convert_str = None
+        convert_list = None
+        convert_map = None
+        ## Pairs (names of fields or None for a map, converting function)
+        dict_converters = []
+        for branch in schema.schemas:
+            convert = self.compile(branch)
+            if branch.type in ['bytes', 'fixed']:
+                convert_str = convert
+            elif branch.type == 'array':
+                convert_list = convert
+            elif branch.type in ['record', 'error']:
+                dict_converters.append(
+                    (frozenset(f.name for f in branch.fields), convert))
+            elif branch.type == 'map':
+                convert_map = convert
+        ## A map matches any dictionary, so it is checked after records
+        if convert_map is not None:
+            dict_converters.append((None, convert_map))
+        def convert_union(value):
+            if isinstance(value, str):
+                if convert_str is not None:
+                    return convert_str(value)
+            elif isinstance(value, list):
+                if convert_list is not None:
+                    return convert_list(value)
+            elif isinstance(value, dict):
+                for field_names, convert in dict_converters:
+                    if field_names is None or \
+                            field_names.issuperset(value.iterkeys()):
+                        if convert is None:
+                            return value
+                        return convert(value)
+            return value
+        return convert_union
+
+class JSONConverter:
+    """Converter of values of an Avro schema, e.g. decoded records, to JSON.
+
+    The values are converted by the `json` module, after their binary data
+    is encoded in Base64. The way the binary data is found is compiled from
+    the schema once, so the converter should be reused for many values.
+    """
+
+    def __init__(self, schema):
+        """
+        Args:
+            schema: an avro.schema.Schema object
+        """
+        self.__encode_binary_data = _BinaryDataEncoderCompiler().compile(
+            schema)
+
+    def convert(self, value, pretty_print=False):
+        """Converts a value to JSON
+
+        Args:
+            value: a value of the schema, e.g., a decoded record
+            pretty_print: if True, the JSON is indented
+        Returns:
+            A string being a valid JSON with binary data encoded with Base64
+        """
+        if self.__encode_binary_data is not None:
+            value = self.__encode_binary_data(value)
+        return _encode(value, pretty_print)
+
+def _encode(python_object, pretty_print):
+    if pretty_print:
+        return _PRETTY_ENCODER.encode(python_object)
+    else:
+        return _ENCODER.encode(python_object)
+
+def dict_to_json(python_dict, pretty_print=False, schema=None):
     """Dumps a Python dictionary to JSON format
 
     Args:
         python_dict: a Python dictionary containing Avro data_store
+        pretty_print: if True, the JSON is indented
+        schema: an avro.schema.Schema object describing the dictionary, 
+            e.g., a decoded record. If given, the binary data of the
+            dictionary is encoded with Base64. Otherwise, the binary data 
+            has to be wrapped in EncapsulatedString objects. To convert 
+            many records, use JSONConverter, which processes the schema 
+            only once.
     Returns:
         A string being a valid JSON with binary data encoded with Base64
     """
-    if pretty_print:
-        return _AvroJSONEncoder(indent=4).encode(python_dict)
-    else:
-        return _AvroJSONEncoder().encode(python_dict)
+    if schema is not None:
+        return JSONConverter(schema).convert(python_dict, pretty_print)
+    return _encode(python_dict, pretty_print)
 
 class FileAlreadyExistsException(Exception):
     def __init__(self, message):